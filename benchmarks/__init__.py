@@ -0,0 +1,4 @@
+"""
+CPU benchmarks for the re-id hot paths. Run from the repository root, e.g.
+    python -m benchmarks.triplet_loss
+"""
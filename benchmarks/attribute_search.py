@@ -0,0 +1,112 @@
+import argparse
+import time
+
+import numpy as np
+
+from reid.gallery import ATTRIBUTE_FIELDS, Gallery, parse_attributes
+
+# Attribute-partitioned search vs full exact search: latency, share of the
+# gallery scanned, recall@k against the exact top-k and rank-1 pid accuracy.
+#
+# Synthetic data by default. For a validation set, save the embeddings and the
+# pid folder names from reid.evaluation.compute_embeddings and pass them in:
+#   np.save("val_feats.npy", features.numpy()); open("val_ids.txt", "w").write("\n".join(ids))
+#   python -m benchmarks.attribute_search --features val_feats.npy --ids val_ids.txt
+
+
+def synthetic(n_pids, views, dim, noise, label_noise, rng):
+    vocab = [8, 12, 6, 12]  # values per attribute
+    attrs = np.stack([rng.integers(0, v, n_pids) for v in vocab], axis=1)
+    centers = rng.standard_normal((n_pids, dim)).astype(np.float32)
+    pids = np.repeat(np.arange(n_pids), views)
+    x = centers[pids] + noise * rng.standard_normal((len(pids), dim)).astype(np.float32)
+    # per-image label noise, like a mislabelled colour in the XMLs
+    labels = attrs[pids].copy()
+    flip = rng.random(labels.shape) < label_noise
+    labels[flip] = rng.integers(0, 6, int(flip.sum()))
+    ids = [str(p) for p in pids]
+    attributes = [{f: f"{f}{v}" for f, v in zip(ATTRIBUTE_FIELDS, row)} for row in labels]
+    return x, ids, attributes
+
+
+def from_files(features_path, ids_path):
+    x = np.load(features_path).astype(np.float32)
+    with open(ids_path, encoding="utf-8") as f:
+        ids = [line.rstrip("\n") for line in f]
+    assert len(ids) == len(x), "features and ids differ in length"
+    return x, ids, [parse_attributes(pid) for pid in ids]
+
+
+def split_queries(ids, n_queries, rng):
+    """One image of up to n_queries random pids (with >= 2 images) becomes a query."""
+    by_pid = {}
+    for i, pid in enumerate(ids):
+        by_pid.setdefault(pid, []).append(i)
+    eligible = [rows for rows in by_pid.values() if len(rows) >= 2]
+    chosen = rng.permutation(len(eligible))[:n_queries]
+    query_rows = np.array([eligible[c][rng.integers(len(eligible[c]))] for c in chosen])
+    gallery_mask = np.ones(len(ids), dtype=bool)
+    gallery_mask[query_rows] = False
+    return query_rows, np.flatnonzero(gallery_mask)
+
+
+def run(search, queries, query_attrs):
+    times, rows, scanned = [], [], []
+    for q, attrs in zip(queries, query_attrs):
+        start = time.perf_counter()
+        out = search(q, attrs)
+        times.append(time.perf_counter() - start)
+        rows.append(out[1][0])
+        scanned.append(out[2][0] if len(out) > 2 else -1)
+    return np.median(times) * 1e3, np.stack(rows), np.array(scanned)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--features", default=None, help=".npy embeddings (N, dim)")
+    parser.add_argument("--ids", default=None, help="text file with N pid folder names")
+    parser.add_argument("--pids", type=int, default=20_000)
+    parser.add_argument("--views", type=int, default=20)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--noise", type=float, default=0.7)
+    parser.add_argument("--label-noise", type=float, default=0.05)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--min-score", type=float, nargs="+", default=[0.3, 0.5, 0.6, 0.7])
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    if args.features:
+        x, ids, attributes = from_files(args.features, args.ids)
+    else:
+        x, ids, attributes = synthetic(args.pids, args.views, args.dim, args.noise, args.label_noise, rng)
+    query_rows, gallery_rows = split_queries(ids, args.queries, rng)
+
+    gallery = Gallery(dim=x.shape[1], index="flat")
+    gallery.add(x[gallery_rows], [ids[i] for i in gallery_rows],
+                attributes=[attributes[i] for i in gallery_rows])
+    gallery.attributes.build()
+    queries, query_attrs = x[query_rows], [attributes[i] for i in query_rows]
+    query_pids = [ids[i] for i in query_rows]
+    print(f"gallery {gallery.count} images, {len(gallery.attributes.cells)} attribute partitions, "
+          f"{len(queries)} queries")
+
+    def score(rows):
+        return np.mean([gallery.pids(r[:1])[0] == pid for r, pid in zip(rows, query_pids)])
+
+    t_full, exact, _ = run(lambda q, attrs: gallery.search(q, args.k, exact=True), queries, query_attrs)
+    print(f"{'mode':>14} {'ms/query':>9} {'scanned':>8} {f'recall@{args.k}':>10} {'rank-1':>7}")
+    print(f"{'full':>14} {t_full:>9.3f} {1.0:>8.1%} {1.0:>10.3f} {score(exact):>7.3f}")
+    for min_score in args.min_score:
+        def search(q, attrs):
+            return gallery.search_attributes(q, attrs, args.k, min_score=min_score, return_scanned=True)
+
+        run(search, queries[:10], query_attrs[:10])  # warmup
+        t, approx, scanned = run(search, queries, query_attrs)
+        recall = np.mean([len(set(a) & set(e)) / args.k for a, e in zip(approx, exact)])
+        print(f"{f'attr/{min_score}':>14} {t:>9.3f} {scanned.mean() / gallery.count:>8.1%} "
+              f"{recall:>10.3f} {score(approx):>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
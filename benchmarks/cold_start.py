@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+# Cold start of the re-id model: notebook construction (ultralytics YOLO + slice
+# + probe forward + load_state_dict) vs reid.model.load_model on a standalone
+# checkpoint. Every run is a fresh interpreter, so import time is included.
+#
+#   python -m benchmarks.cold_start
+#   python -m benchmarks.cold_start --state-dict ReIDAttenv2_6000.pth --yolo yolo11n.pt
+#
+# Without --state-dict a randomly initialised ReIDAtten_v2 is used. --yolo
+# defaults to yolo11n.yaml so the old path runs offline; the notebooks pass
+# yolo11n.pt, which adds reading (or first downloading) the detector weights.
+
+_TIMER = """
+import time
+_t0 = time.perf_counter()
+import torch
+_t_torch = time.perf_counter()
+"""
+
+_OLD = _TIMER + """
+import torch.nn as nn
+from ultralytics import YOLO
+from reid.model import VisionAttentionLayer
+_t_import = time.perf_counter()
+
+class ReIDAtten_v2(nn.Module):
+    def __init__(self, yolo_weights, emb_dim=128):
+        super().__init__()
+        yolo_model = YOLO(yolo_weights)
+        self.backbone = nn.Sequential(*yolo_model.model.model[:5])
+        self.avg_pool = nn.AdaptiveAvgPool2d((1, 1))
+        self.max_pool = nn.AdaptiveMaxPool2d((1, 1))
+        self.backbone_output_dim = self._get_feat_dim()
+        self.attn = VisionAttentionLayer(dim=self.backbone_output_dim, heads=4,
+                                         dim_head=self.backbone_output_dim // 4)
+        self.embed = nn.Linear(self.backbone_output_dim, emb_dim)
+
+    def _get_feat_dim(self):
+        with torch.no_grad():
+            return self.backbone(torch.zeros((1, 3, 256, 128))).shape[1]
+
+    def forward(self, x):
+        x = self.backbone(x)
+        att = self.attn(x.flatten(2).transpose(1, 2)).mean(dim=1)
+        return nn.functional.normalize(self.embed(att), dim=1)
+
+model = ReIDAtten_v2({yolo!r})
+model.load_state_dict(torch.load({state_dict!r}, map_location="cpu"))
+model.eval()
+"""
+
+_NEW = _TIMER + """
+from reid.model import load_model
+_t_import = time.perf_counter()
+model = load_model({checkpoint!r})
+"""
+
+_REPORT = """
+_t_ready = time.perf_counter()
+with torch.no_grad():
+    model(torch.zeros(1, 3, 256, 128))
+_t_first = time.perf_counter()
+import json, sys
+print(json.dumps({{"torch": _t_torch - _t0, "import": _t_import - _t_torch,
+                  "build": _t_ready - _t_import, "first": _t_first - _t_ready,
+                  "total": _t_first - _t0,
+                  "ultralytics": "ultralytics" in sys.modules}}))
+"""
+
+
+def run(code, env):
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--state-dict", default=None, help="notebook ReIDAttenv2_*.pth")
+    parser.add_argument("--yolo", default="yolo11n.yaml", help="weights / yaml the old path builds from")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    import torch
+
+    from reid.model import ReIDAtten_v2, convert
+
+    with tempfile.TemporaryDirectory() as tmp:
+        state_dict = args.state_dict
+        if state_dict is None:
+            state_dict = os.path.join(tmp, "ReIDAttenv2_0.pth")
+            torch.save(ReIDAtten_v2().state_dict(), state_dict)
+        checkpoint = os.path.join(tmp, "reid_attenv2.pt")
+        convert(state_dict, checkpoint)
+
+        env = dict(os.environ, PYTHONPATH=os.getcwd() + os.pathsep + os.environ.get("PYTHONPATH", ""),
+                   YOLO_OFFLINE="1")
+        cases = {
+            "ultralytics": (_OLD + _REPORT).format(yolo=args.yolo, state_dict=state_dict),
+            "standalone": (_NEW + _REPORT).format(checkpoint=checkpoint),
+        }
+        run(cases["ultralytics"], env)  # warm the OS file cache and ultralytics settings
+        results = {name: [run(code, env) for _ in range(args.repeats)] for name, code in cases.items()}
+
+    print(f"median of {args.repeats} fresh interpreters, seconds")
+    print(f"{'path':>12} {'torch':>7} {'import':>7} {'build':>7} {'1st fwd':>8} {'total':>7} {'ultralytics':>12}")
+    for name, runs in results.items():
+        med = {k: np.median([r[k] for r in runs]) for k in ("torch", "import", "build", "first", "total")}
+        print(f"{name:>12} {med['torch']:>7.3f} {med['import']:>7.3f} {med['build']:>7.3f} "
+              f"{med['first']:>8.3f} {med['total']:>7.3f} {str(runs[0]['ultralytics']):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+# Step-time scaling of reid.train from 1 to N processes on this machine.
+#
+#   python -m benchmarks.ddp_scaling --data dataset/train --procs 1 2 4 8 --gather
+#   python -m benchmarks.ddp_scaling --procs 1 2 4 --mode strong --out ddp_scaling.json
+#
+# Every run is a fresh `python -m reid.train --nproc n` with --cores / n
+# intra-op threads per process, so all runs use the same cores.
+#   weak    P identities per process: the global batch grows with n and
+#           efficiency = images/s(n) / (n × images/s(1))
+#   strong  a fixed global batch of P identities split over the processes
+#           (P must be divisible by n): efficiency = speedup / n
+# Without --data the synthetic crops of benchmarks.suite are used.
+
+
+def run(data, nproc, threads, P, K, steps, gather, workers, arch):
+    with tempfile.TemporaryDirectory() as out:
+        stats_path = os.path.join(out, "stats.json")
+        cmd = [sys.executable, "-m", "reid.train", "--data", data, "--arch", arch,
+               "--nproc", str(nproc), "--threads", str(threads), "-P", str(P), "-K", str(K),
+               "--steps", str(steps), "--workers", str(workers), "--out-dir", out,
+               "--log-every", str(10 ** 9), "--save-every", str(10 ** 9), "--stats-out", stats_path]
+        if gather:
+            cmd.append("--gather")
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+        with open(stats_path, encoding="utf-8") as f:
+            return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--data", default=None, help="training pid folders / shard prefix")
+    parser.add_argument("--procs", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--cores", type=int, default=os.cpu_count())
+    parser.add_argument("--mode", choices=["weak", "strong"], default="weak")
+    parser.add_argument("--arch", default="atten_v2")
+    parser.add_argument("-P", type=int, default=8, help="per process (weak) or global (strong)")
+    parser.add_argument("-K", type=int, default=4)
+    parser.add_argument("--steps", type=int, default=15, help="per run; the first 3 are not timed")
+    parser.add_argument("--gather", action="store_true")
+    parser.add_argument("--workers", type=int, default=1, help="DataLoader workers per process")
+    parser.add_argument("--out", default=None, help="write the rows as JSON")
+    args = parser.parse_args()
+
+    data = args.data
+    if data is None:
+        from benchmarks.suite import DEFAULT_DATA_DIR, make_data
+
+        data = os.path.join(make_data(DEFAULT_DATA_DIR), "crops")
+
+    print(f"{args.mode} scaling, {args.cores} cores, {args.arch}, K={args.K}, gather={args.gather}")
+    print(f"{'procs':>5} {'thr/proc':>8} {'P/proc':>6} {'img/step':>8} {'ms/step':>8} {'img/s':>8} "
+          f"{'speedup':>8} {'effic.':>7}")
+    rows = []
+    base = None
+    for n in args.procs:
+        if args.mode == "strong" and args.P % n:
+            print(f"{n:>5} skipped: P={args.P} not divisible by {n}")
+            continue
+        P = args.P // n if args.mode == "strong" else args.P
+        threads = max(1, args.cores // n)
+        stats = run(data, n, threads, P, args.K, args.steps, args.gather, args.workers, args.arch)
+        base = base or stats
+        speedup = stats["images_per_s"] / base["images_per_s"]
+        efficiency = speedup / (n / base["world_size"])
+        rows.append(dict(stats, speedup=speedup, efficiency=efficiency))
+        print(f"{n:>5} {threads:>8} {P:>6} {stats['images_per_step']:>8.0f} {stats['step_s_median'] * 1e3:>8.1f} "
+              f"{stats['images_per_s']:>8.1f} {speedup:>7.2f}x {efficiency:>7.0%}")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"mode": args.mode, "cores": args.cores, "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import torch
+from torch.utils.data import DataLoader
+
+from reid.datasets import FolderBasedReIDValidationDataset
+from reid.embedding_cache import EmbeddingCache
+from reid.evaluation import compute_embeddings, evaluate
+from reid.model import ReIDAtten_v2, load_model
+
+# compute_embeddings with and without the EmbeddingCache: cold run, warm rerun
+# of the same checkpoint, a rerun after --add new images, and the mAP of the
+# cached (float16) embeddings next to the uncached ones.
+#
+#   python -m benchmarks.embedding_cache --val-dir val_2022/ --checkpoint reid_attenv2.pt
+#
+# Without --val-dir the synthetic crops of benchmarks.suite are used. New
+# images are copies of existing ones with one changed pixel (new content, so
+# new cache keys), written to a copy of the validation folder.
+
+
+def add_images(root, n):
+    """Copies n images (+ their .xml) under new names with one pixel changed; returns the count added."""
+    from PIL import Image
+
+    added = 0
+    for pid in sorted(os.listdir(root)):
+        folder = os.path.join(root, pid)
+        for name in sorted(os.listdir(folder)):
+            if added == n:
+                return added
+            if not name.endswith(".png") or "_added" in name:
+                continue
+            base = os.path.join(folder, name[:-4])
+            img = Image.open(base + ".png").convert("RGB")
+            img.putpixel((0, 0), tuple(255 - c for c in img.getpixel((0, 0))))
+            img.save(base + "_added.png")
+            shutil.copy(base + ".xml", base + "_added.xml")
+            added += 1
+    return added
+
+
+def timed_run(model, root, cache, batch_size, workers):
+    loader = DataLoader(FolderBasedReIDValidationDataset(root), batch_size=batch_size, num_workers=workers)
+    if cache is not None:
+        cache.reset_stats()
+    start = time.perf_counter()
+    features, ids, _ = compute_embeddings(model, loader, "cpu", cache=cache)
+    return time.perf_counter() - start, features, ids
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--val-dir", default=None, help="validation root (<pid>/<image>.png + .xml)")
+    parser.add_argument("--checkpoint", default=None, help="re-id checkpoint (random ReIDAtten_v2 if omitted)")
+    parser.add_argument("--cache-dir", default=None, help="default: a temporary directory")
+    parser.add_argument("--dtype", default="float16", choices=["float16", "float32"])
+    parser.add_argument("--add", type=int, default=200, help="images added before the last run")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=0)
+    args = parser.parse_args()
+
+    model = load_model(args.checkpoint) if args.checkpoint else ReIDAtten_v2().eval()
+    work = tempfile.mkdtemp(prefix="reid_cache_bench_")
+    if args.val_dir:
+        src = args.val_dir
+    else:
+        from benchmarks.suite import make_data
+
+        src = os.path.join(make_data(os.path.join(work, "data")), "crops")
+    root = os.path.join(work, "val")
+    shutil.copytree(src, root)
+    cache = EmbeddingCache(args.cache_dir or os.path.join(work, "cache"), dtype=args.dtype)
+
+    uncached, ref, ids = timed_run(model, root, None, args.batch_size, args.workers)
+    print(f"{len(ids)} images, uncached compute_embeddings {uncached:.2f}s")
+    rows = []
+    for label in ("cold cache", "warm rerun"):
+        t, features, _ = timed_run(model, root, cache, args.batch_size, args.workers)
+        rows.append((label, t, dict(cache.stats)))
+    added = add_images(root, args.add)
+    t, _, _ = timed_run(model, root, cache, args.batch_size, args.workers)
+    rows.append((f"+{added} images", t, dict(cache.stats)))
+
+    print(f"\n{'run':>14} {'seconds':>8} {'hits':>7} {'misses':>7} {'hashed':>7} {'speedup':>8}")
+    for label, t, s in rows:
+        print(f"{label:>14} {t:>8.2f} {s['hits']:>7} {s['misses']:>7} {s['files_hashed']:>7} {uncached / t:>7.1f}x")
+
+    full, cached = evaluate(ref, ids), evaluate(features, ids)
+    cos = torch.nn.functional.cosine_similarity(features, ref.float(), dim=1)
+    print(f"\nmAP uncached {full['mAP']:.4%}, cached ({args.dtype}) {cached['mAP']:.4%}, "
+          f"cosine min {cos.min():.6f}")
+    shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
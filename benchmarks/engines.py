@@ -0,0 +1,97 @@
+import argparse
+import tempfile
+
+import torch
+
+from reid.engines import (available_engines, calibration_images, create_engine, drift,
+                          embed_images, time_engine)
+from reid.evaluation import camera_id_from_path
+from reid.model import ReIDAtten_v2, load_model
+
+# Re-id inference engines side by side: rank-1 / mAP and their drift from the
+# fp32 eager model, cosine to the fp32 embeddings, and latency. The last line
+# names the fastest engine whose mAP drop stays within --tolerance.
+#
+#   python -m benchmarks.engines --checkpoint reid_attenv2.pt --val-dir val_2022/ --calib-dir val_2021/ \
+#       --workdir engines_attenv2/
+#
+# INT8 engines are calibrated on --calib-num crops of --calib-dir (the
+# validation set by default); use a different year than --val-dir to keep the
+# evaluation honest. --workdir keeps the exported files for reid.stream --engine.
+# Without --val-dir the images are synthetic (noisy views of random "identity"
+# images), which only exercises the pipeline.
+
+
+def synthetic_set(n_pids, views, rng):
+    base = torch.rand(n_pids, 3, 256, 128, generator=rng) * 2 - 1
+    images = base.repeat_interleave(views, 0)
+    images = (images + 0.3 * torch.randn(images.shape, generator=rng)).clamp(-1, 1)
+    ids = [str(i // views) for i in range(len(images))]
+    return images, ids, None, images[::2]
+
+
+def validation_set(val_dir, calib_dir, max_images, calib_num):
+    from reid.datasets import FolderBasedReIDValidationDataset
+
+    dataset = FolderBasedReIDValidationDataset(val_dir)
+    order = torch.randperm(len(dataset), generator=torch.Generator().manual_seed(0))[:max_images]
+    images = torch.stack([dataset[i][0] for i in order.tolist()])
+    ids = [dataset.samples[i][1] for i in order.tolist()]
+    cams = [camera_id_from_path(dataset.samples[i][0]) for i in order.tolist()]
+    calib = dataset if calib_dir in (None, val_dir) else FolderBasedReIDValidationDataset(calib_dir)
+    return images, ids, cams, calibration_images([calib], calib_num)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkpoint", default=None, help="re-id checkpoint (random ReIDAtten_v2 if omitted)")
+    parser.add_argument("--val-dir", default=None, help="validation root (<pid>/<image>.png + .xml)")
+    parser.add_argument("--calib-dir", default=None, help="INT8 calibration root (default: --val-dir)")
+    parser.add_argument("--calib-num", type=int, default=512)
+    parser.add_argument("--max-images", type=int, default=4000)
+    parser.add_argument("--engines", nargs="+", default=None, help="default: every installed engine")
+    parser.add_argument("--workdir", default=None)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 32])
+    parser.add_argument("--tolerance", type=float, default=0.01, help="allowed mAP drop (absolute)")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    model = load_model(args.checkpoint) if args.checkpoint else ReIDAtten_v2().eval()
+    if args.val_dir:
+        images, ids, cams, calib = validation_set(args.val_dir, args.calib_dir, args.max_images, args.calib_num)
+    else:
+        images, ids, cams, calib = synthetic_set(100, 8, torch.Generator().manual_seed(0))
+    with torch.no_grad():
+        reference = embed_images(model, images)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="reid_engines_")
+    names = args.engines or available_engines()
+    print(f"{len(images)} images, {len(set(ids))} pids, {len(calib)} calibration crops, "
+          f"threads {torch.get_num_threads()}, exports in {workdir}")
+    header = f"{'engine':>17} {'rank-1':>7} {'mAP':>7} {'Δrank-1':>8} {'ΔmAP':>7} {'cos min':>8}"
+    header += "".join(f" {f'ms@{b}':>8} {f'img/s@{b}':>9}" for b in args.batch)
+    print(header)
+
+    rows = []
+    for name in names:
+        engine = create_engine(name, model, workdir=workdir, calibration=calib, threads=args.threads)
+        d = drift(embed_images(engine, images), reference, ids, cams)
+        times = {b: time_engine(engine, b) for b in args.batch}
+        rows.append((name, d, times))
+        line = (f"{name:>17} {d['rank1']:>7.2%} {d['mAP']:>7.2%} {d['rank1_drift'] * 100:>+8.2f} "
+                f"{d['mAP_drift'] * 100:>+7.2f} {d['cos_min']:>8.4f}")
+        line += "".join(f" {t * 1e3:>8.2f} {b / t:>9.1f}" for b, t in times.items())
+        print(line)
+
+    b = max(args.batch)
+    ok = [r for r in rows if r[1]["mAP_drift"] >= -args.tolerance]
+    if ok:
+        name, _, times = min(ok, key=lambda r: r[2][b])
+        print(f"\nfastest within ΔmAP ≥ -{args.tolerance:.2%} at batch {b}: {name} "
+              f"({b / times[b]:.1f} img/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from reid.gallery import Gallery
+
+# Gallery top-k latency and IVF recall@k against the exact flat search, on
+# synthetic clustered 128-d embeddings (many views per pid, like real re-id).
+#
+#   python -m benchmarks.gallery --n 1000000 --nprobe 4 8 16
+
+
+def make_embeddings(n, dim, n_pids, noise, rng):
+    centers = rng.standard_normal((n_pids, dim)).astype(np.float32)
+    pids = rng.integers(0, n_pids, n)
+    x = centers[pids] + noise * rng.standard_normal((n, dim)).astype(np.float32)
+    return x, pids
+
+
+def time_queries(gallery, queries, k, exact):
+    times, rows = [], []
+    for q in queries:
+        start = time.perf_counter()
+        _, r = gallery.search(q, k, exact=exact)
+        times.append(time.perf_counter() - start)
+        rows.append(r[0])
+    times = np.array(times) * 1e3
+    return np.percentile(times, 50), np.percentile(times, 99), np.stack(rows)
+
+
+def recall_at_k(approx, exact):
+    hits = [len(set(a[a >= 0]) & set(e[e >= 0])) / max((e >= 0).sum(), 1) for a, e in zip(approx, exact)]
+    return float(np.mean(hits))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=1_000_000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--pids", type=int, default=None, help="default: n // 20 (20 views per pid)")
+    parser.add_argument("--noise", type=float, default=0.5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 8, 16, 32])
+    parser.add_argument("--disk", action="store_true", help="store the gallery in a temp dir (mmap)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    n_pids = args.pids or max(args.n // 20, 1)
+    x, _ = make_embeddings(args.n + args.queries, args.dim, n_pids, args.noise, rng)
+    base, queries = x[:args.n], x[args.n:]
+
+    tmp = tempfile.TemporaryDirectory() if args.disk else None
+    gallery = Gallery(tmp.name if tmp else None, dim=args.dim, nlist=args.nlist)
+    start = time.perf_counter()
+    gallery.add(base, pids=[str(i) for i in range(args.n)])
+    t_add = time.perf_counter() - start
+    start = time.perf_counter()
+    gallery.train()
+    t_train = time.perf_counter() - start
+    print(f"N={args.n} dim={args.dim}: add {t_add:.1f}s, IVF train+assign {t_train:.1f}s "
+          f"(nlist={len(gallery.ivf.cells)})")
+
+    p50, p99, exact = time_queries(gallery, queries, args.k, exact=True)
+    print(f"{'index':>12} {'p50 ms':>8} {'p99 ms':>8} {f'recall@{args.k}':>10}")
+    print(f"{'flat':>12} {p50:>8.3f} {p99:>8.3f} {1.0:>10.3f}")
+    for nprobe in args.nprobe:
+        gallery.ivf.nprobe = nprobe
+        time_queries(gallery, queries[:10], args.k, exact=False)  # warmup
+        p50, p99, approx = time_queries(gallery, queries, args.k, exact=False)
+        print(f"{f'ivf/{nprobe}':>12} {p50:>8.3f} {p99:>8.3f} {recall_at_k(approx, exact):>10.3f}")
+
+    if tmp:
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import glob
+import os
+import time
+
+import torch
+
+from reid.model import ReIDAtten_v2, load_model, prepare_for_inference
+
+# ReIDAtten_v2 inference variants on CPU: the notebook model as loaded vs
+# prepare_for_inference (BN folding + SDPA attention), channels_last, bf16
+# autocast and torch.compile. Equivalence is checked against the notebook
+# forward on the same batch, then latency / throughput per batch size.
+#
+#   python -m benchmarks.inference_modes --checkpoint ReIDAttenv2_6000.pth --images val_crops/ --compile
+#
+# Without --checkpoint a randomly initialised model is used; without --images
+# the inputs are random in [-1, 1].
+
+
+def load_images(folder, n):
+    from PIL import Image
+
+    from reid.transforms import default_transform
+
+    paths = sorted(glob.glob(os.path.join(folder, "**", "*.png"), recursive=True)
+                   + glob.glob(os.path.join(folder, "**", "*.jpg"), recursive=True))[:n]
+    if not paths:
+        raise FileNotFoundError(f"No .png / .jpg images under {folder}")
+    transform = default_transform()
+    images = torch.stack([transform(Image.open(p).convert("RGB")) for p in paths])
+    return images.repeat((n + len(images) - 1) // len(images), 1, 1, 1)[:n]
+
+
+@torch.no_grad()
+def time_model(model, x, repeats, warmup=3):
+    for _ in range(warmup):
+        model(x)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model(x)
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkpoint", default=None, help="ReIDAttenv2_*.pth or a reid.model checkpoint")
+    parser.add_argument("--images", default=None, help="folder of crops for the equivalence check")
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32, 64])
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--compile", action="store_true", help="also time torch.compile variants")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+    model = load_model(args.checkpoint) if args.checkpoint else ReIDAtten_v2().eval()
+
+    variants = {
+        "notebook": model,
+        "sdpa": prepare_for_inference(model, channels_last=False),
+        "sdpa+cl": prepare_for_inference(model),
+        "sdpa+cl+bf16": prepare_for_inference(model, bf16=True),
+    }
+    if args.compile:
+        variants["compiled"] = prepare_for_inference(model, compile=True)
+        variants["compiled+bf16"] = prepare_for_inference(model, bf16=True, compile=True)
+
+    n_check = max(args.batch)
+    x = load_images(args.images, n_check) if args.images else torch.rand(n_check, 3, 256, 128) * 2 - 1
+    with torch.no_grad():
+        ref = model(x)
+        print(f"equivalence vs notebook forward on {n_check} {'images' if args.images else 'random inputs'}")
+        print(f"{'variant':>14} {'max |diff|':>11} {'min cos':>9}")
+        for name, m in variants.items():
+            out = m(x)
+            print(f"{name:>14} {(out - ref).abs().max().item():>11.2e} {(out * ref).sum(1).min().item():>9.6f}")
+
+    print(f"\nthreads {torch.get_num_threads()}, median of {args.repeats}: ms / batch (images / s)")
+    print(f"{'batch':>6}" + "".join(f" {name:>20}" for name in variants))
+    for b in args.batch:
+        xb = x[:b].contiguous()
+        cells = []
+        for m in variants.values():
+            t = time_model(m, xb, args.repeats)
+            cells.append(f"{t * 1e3:>9.2f} ({b / t:>7.1f})")
+        print(f"{b:>6}" + "".join(f" {c:>20}" for c in cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import glob
+import os
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+from reid.transforms import BatchResizePad, default_transform
+
+# Per-crop PIL preprocessing (ResizePad → ToTensor → Normalize, then stack) vs
+# BatchResizePad: crops per second per batch size, and the difference between
+# the two outputs (pixels, and embeddings if a model is given).
+#
+#   python -m benchmarks.preprocess --images val_2022/ --checkpoint reid_attenv2.pt
+#
+# Without --images the crops are random person-shaped (h ∈ [60, 500), w/h ∈ [0.3, 0.7)).
+
+
+def random_crops(n, rng):
+    import cv2
+
+    crops = []
+    for _ in range(n):
+        h = int(rng.integers(60, 500))
+        w = max(int(h * rng.uniform(0.3, 0.7)), 1)
+        noise = rng.integers(0, 256, (h, w, 3), dtype=np.uint8)
+        crops.append(cv2.GaussianBlur(noise, (0, 0), 1.5))  # some spatial structure, like a photo
+    return crops
+
+
+def load_crops(folder, n):
+    paths = sorted(glob.glob(os.path.join(folder, "**", "*.png"), recursive=True)
+                   + glob.glob(os.path.join(folder, "**", "*.jpg"), recursive=True))[:n]
+    return [np.asarray(Image.open(p).convert("RGB")) for p in paths]
+
+
+def pil_path(crops, transform):
+    return torch.stack([transform(Image.fromarray(c)) for c in crops])
+
+
+def crops_per_second(fn, crops, batch, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for i in range(0, len(crops), batch):
+            fn(crops[i:i + batch])
+        times.append(time.perf_counter() - start)
+    return len(crops) / float(np.median(times))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", default=None, help="folder of crops (.png / .jpg)")
+    parser.add_argument("--n", type=int, default=512)
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--checkpoint", default=None, help="re-id checkpoint for the embedding check")
+    args = parser.parse_args()
+
+    crops = load_crops(args.images, args.n) if args.images else random_crops(args.n, np.random.default_rng(0))
+    transform = default_transform()
+    batched = BatchResizePad(max_batch=max(args.batch))
+
+    ref = pil_path(crops, transform)
+    out = torch.cat([batched(crops[i:i + 128]).clone() for i in range(0, len(crops), 128)])
+    diff = (out - ref).abs()
+    print(f"{len(crops)} crops: |batched - PIL| mean {diff.mean():.4f}, "
+          f"worst crop mean {diff.flatten(1).mean(1).max():.4f}, max {diff.max():.4f} "
+          f"(1 grey level = {2 / 255:.4f})")
+    if args.checkpoint:
+        from reid.model import load_model
+
+        model = load_model(args.checkpoint)
+        with torch.no_grad():
+            cos = (model(out) * model(ref)).sum(1)
+        print(f"embedding cosine batched vs PIL: mean {cos.mean():.5f}, min {cos.min():.5f}")
+
+    print(f"\n{'batch':>6} {'PIL crops/s':>12} {'batched crops/s':>16} {'speedup':>8}")
+    for b in args.batch:
+        pil = crops_per_second(lambda c: pil_path(c, transform), crops, b, args.repeats)
+        fast = crops_per_second(batched, crops, b, args.repeats)
+        print(f"{b:>6} {pil:>12.0f} {fast:>16.0f} {fast / pil:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+import argparse
+
+import torch
+
+from reid.model import load_reid_model
+from reid.scheduler import FrameScheduler
+from reid.stream import FullFrameDetector, StreamPipeline, YOLODetector, print_report
+
+# Replays N local video files as N real-time cameras and compares the plain
+# pipeline (every newest frame is processed) with the FrameScheduler
+# (budgets + static-scene gate + latency SLO).
+#
+#   python -m benchmarks.stream_replay clip1.mp4 clip2.mp4 --copies 4 --reid-model reid_ts.pt --slo-ms 250
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("videos", nargs="+")
+    parser.add_argument("--copies", type=int, default=1, help="replay every video this many times in parallel")
+    parser.add_argument("--detector", default="yolo11n.pt", help="YOLO weights, or 'none' for pre-cropped videos")
+    parser.add_argument("--reid-model", required=True, help="re-id checkpoint (reid.model) or TorchScript export")
+    parser.add_argument("--slo-ms", type=float, default=250.0)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    sources = {f"cam{i * len(args.videos) + j}": video
+               for i in range(args.copies) for j, video in enumerate(args.videos)}
+    detector = FullFrameDetector() if args.detector == "none" else YOLODetector(args.detector, device=args.device)
+    model = load_reid_model(args.reid_model, device=args.device)
+
+    for name, scheduler in (("unscheduled", None), ("scheduled", FrameScheduler(slo_ms=args.slo_ms))):
+        pipeline = StreamPipeline(sources, detector, model, device=args.device, loop=True, scheduler=scheduler)
+        report = pipeline.run(duration=args.duration)
+        print(f"\n== {name}: {len(sources)} cameras, {args.duration:.0f}s ==")
+        print_report(report)
+        if scheduler:
+            costs = scheduler.report()["_scheduler"]
+            print(f"detect {costs['detect_ms_per_frame']:.1f} ms/frame, re-id {costs['reid_ms_per_crop']:.1f} ms/crop, "
+                  f"{costs['crops_per_frame']:.1f} crops/frame, load {costs['load']:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import torch
+
+# Benchmark suite for the training, inference and evaluation hot paths, on
+# CPU with synthetic data (generated once into --data-dir and reused).
+#
+#   python -m benchmarks.suite --threads 1 4 --out bench_main.json
+#   python -m benchmarks.suite --checkpoint reid_attenv2.pt --cases forward train_step --out bench_v2.json
+#   python -m benchmarks.suite compare bench_main.json bench_v2.json --tolerance 0.10
+#
+# Every measurement gets `--warmup` untimed calls, then `--repeats` timed ones
+# (fewer for cases slower than `--budget` seconds in total), and reports p50 /
+# p90 / p99 / mean / min in ms plus items per second at the median. Results
+# are keyed by (case, params, threads), so two JSON files from different
+# commits or model versions can be compared; `compare` exits with 1 if any p50
+# got slower by more than the tolerance.
+
+DATA_VERSION = 1
+DEFAULT_DATA_DIR = os.path.join(os.path.expanduser("~"), ".cache", "reid_bench")
+ARCHS = ("atten_v2", "pool")
+FORWARD_BATCHES = (1, 8, 32, 64)
+P, K = 16, 4
+MIN_REPEATS = 5
+
+
+# harness
+
+def measure(fn, warmup, repeats, items=1, budget=None):
+    """
+    Runs fn warmup + repeats times; percentiles of the timed runs (ms) and
+    items/s at p50. With a budget (seconds), slow cases do fewer repeats
+    (at least MIN_REPEATS), estimated from the last warmup call.
+    """
+    last = 0.0
+    for _ in range(max(warmup, 1)):
+        start = time.perf_counter()
+        fn()
+        last = time.perf_counter() - start
+    if budget:
+        repeats = max(MIN_REPEATS, min(repeats, int(budget / max(last, 1e-9))))
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    t = np.array(times) * 1e3
+    p50 = float(np.percentile(t, 50))
+    return {"p50_ms": p50, "p90_ms": float(np.percentile(t, 90)), "p99_ms": float(np.percentile(t, 99)),
+            "mean_ms": float(t.mean()), "min_ms": float(t.min()), "repeats": repeats,
+            "items": items, "items_per_s": items / p50 * 1e3}
+
+
+def set_threads(n):
+    torch.set_num_threads(n)
+    try:
+        import cv2
+
+        cv2.setNumThreads(n)
+    except ImportError:
+        pass
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "git_commit": commit,
+            "python": platform.python_version(), "torch": torch.__version__, "numpy": np.__version__,
+            "platform": platform.platform(), "processor": platform.processor(),
+            "cpu_count": os.cpu_count(), "argv": sys.argv[1:]}
+
+
+# synthetic data
+
+_XML = """<?xml version="1.0" encoding="utf-8"?>
+<ANNOTATION>
+  <FILE><name>{name}</name><width>{w}</width><height>{h}</height></FILE>
+  <CAMERA><id>C{cam}</id><mode>0</mode></CAMERA>
+  <OBJECT ID="{pid}">
+    <upperclothes>{upper}</upperclothes><upperclothes_color>{upper_color}</upperclothes_color>
+    <lowerclothes>{lower}</lowerclothes><lowerclothes_color>{lower_color}</lowerclothes_color>
+    <BOX><xmin>0</xmin><ymin>0</ymin><xmax>{w}</xmax><ymax>{h}</ymax></BOX>
+  </OBJECT>
+</ANNOTATION>
+"""
+
+
+def make_data(data_dir, n_pids=48, views=8, n_xml=2000):
+    """
+    <data_dir>/crops/<pid>_<attrs>/<cam>_<i>.png (+ .xml) person-shaped crops, and
+    <data_dir>/xml/*.xml labels for the parse benchmark. Created once.
+    """
+    import cv2
+
+    marker = os.path.join(data_dir, f".complete_v{DATA_VERSION}")
+    if os.path.exists(marker):
+        return data_dir
+    rng = np.random.default_rng(0)
+    clothes = (("tshirt", "shirt", "jacket"), ("red", "blue", "black"), ("pants", "shorts", "skirt"),
+               ("grey", "white", "green"))
+
+    def attrs():
+        return [c[rng.integers(len(c))] for c in clothes]
+
+    for p in range(n_pids):
+        a = attrs()
+        folder = os.path.join(data_dir, "crops", "_".join([f"{p:04d}"] + a))
+        os.makedirs(folder, exist_ok=True)
+        for i in range(views):
+            h = int(rng.integers(80, 400))
+            w = max(int(h * rng.uniform(0.3, 0.6)), 8)
+            img = cv2.GaussianBlur(rng.integers(0, 256, (h, w, 3), dtype=np.uint8), (0, 0), 1.5)
+            name = f"C{i % 4}_{i:03d}.png"
+            cv2.imwrite(os.path.join(folder, name), img)
+            with open(os.path.join(folder, name[:-4] + ".xml"), "w", encoding="utf-8") as f:
+                f.write(_XML.format(name=name, w=w, h=h, cam=i % 4, pid=f"{p:04d}", upper=a[0],
+                                    upper_color=a[1], lower=a[2], lower_color=a[3]))
+
+    xml_dir = os.path.join(data_dir, "xml")
+    os.makedirs(xml_dir, exist_ok=True)
+    for i in range(n_xml):
+        a = attrs()
+        with open(os.path.join(xml_dir, f"{i:06d}.xml"), "w", encoding="utf-8") as f:
+            f.write(_XML.format(name=f"{i:06d}.png", w=64, h=160, cam=i % 4, pid=f"{i % 500:04d}",
+                                upper=a[0], upper_color=a[1], lower=a[2], lower_color=a[3]))
+    open(marker, "w").close()
+    return data_dir
+
+
+def clustered_features(n, dim=128, n_pids=None, noise=0.7, seed=0):
+    rng = np.random.default_rng(seed)
+    n_pids = n_pids or max(n // 10, 2)
+    centers = rng.standard_normal((n_pids, dim)).astype(np.float32)
+    pids = rng.integers(0, n_pids, n)
+    x = centers[pids] + noise * rng.standard_normal((n, dim)).astype(np.float32)
+    cams = [f"C{c}" for c in rng.integers(0, 4, n)]
+    return x, [str(p) for p in pids], cams
+
+
+# cases: each yields (params, fn, items)
+
+def case_pk_loader(ctx):
+    from reid.datasets import FolderPKDataset
+    from reid.samplers import make_pk_loader
+
+    dataset = FolderPKDataset(os.path.join(ctx["data_dir"], "crops"))
+    loader = make_pk_loader(dataset, P, K, num_batches=10 ** 6, num_workers=0)
+    batches = iter(loader)
+    yield {"P": P, "K": K, "workers": 0}, lambda: next(batches), P * K
+
+
+def case_triplet_loss(ctx):
+    from reid.losses import combined_triplet_loss
+
+    for p, k in ((16, 4), (32, 8)):
+        emb = torch.nn.functional.normalize(torch.randn(p * k, 128), dim=1)
+        labels = torch.arange(p).repeat_interleave(k)
+
+        def step(emb=emb, labels=labels):
+            e = emb.clone().requires_grad_(True)
+            combined_triplet_loss(e, labels).backward()
+        yield {"P": p, "K": k}, step, p * k
+
+
+def case_train_step(ctx):
+    from reid.losses import combined_triplet_loss
+
+    x = torch.rand(P * K, 3, 256, 128) * 2 - 1
+    labels = torch.arange(P).repeat_interleave(K)
+    for arch, model in ctx["models"].items():
+        model = _fresh(model).train()
+        optimizer = torch.optim.Adam(model.parameters(), lr=1e-4)
+
+        def step(model=model, optimizer=optimizer):
+            optimizer.zero_grad()
+            combined_triplet_loss(model(x), labels).backward()
+            optimizer.step()
+        yield {"arch": arch, "P": P, "K": K}, step, P * K
+
+
+def case_forward(ctx):
+    from reid.model import prepare_for_inference
+
+    for arch, model in ctx["models"].items():
+        variants = {"eager": model, "inference": prepare_for_inference(model)}
+        for variant, m in variants.items():
+            for b in FORWARD_BATCHES:
+                x = torch.rand(b, 3, 256, 128) * 2 - 1
+
+                def forward(m=m, x=x):
+                    with torch.no_grad():
+                        m(x)
+                yield {"arch": arch, "variant": variant, "batch": b}, forward, b
+
+
+def case_compute_embeddings(ctx):
+    from torch.utils.data import DataLoader, TensorDataset
+
+    from reid.evaluation import compute_embeddings
+
+    n = 256
+    dataset = TensorDataset(torch.rand(n, 3, 256, 128) * 2 - 1, torch.arange(n))
+    loader = DataLoader(dataset, batch_size=64)
+    for arch, model in ctx["models"].items():
+        yield ({"arch": arch, "images": n, "batch": 64},
+               lambda model=model: compute_embeddings(model, loader, "cpu"), n)
+
+
+def case_evaluate(ctx):
+    from reid.evaluation import evaluate, evaluate_rank1
+
+    for n in (2000, 5000):
+        x, ids, cams = clustered_features(n)
+        yield ({"fn": "evaluate", "n": n},
+               lambda x=x, ids=ids, cams=cams: evaluate(x, ids, query_cams=cams, gallery_cams=cams), n)
+    x, ids, _ = clustered_features(2000)
+
+    def rank1():
+        with contextlib.redirect_stdout(io.StringIO()):  # evaluate_rank1 prints its result
+            evaluate_rank1(torch.from_numpy(x), ids)
+    yield {"fn": "evaluate_rank1", "n": 2000}, rank1, 2000
+
+
+def case_validate_similarity(ctx):
+    from reid.datasets import FolderGroupedBatchDataset
+    from reid.transforms import default_transform
+    from reid.validation import validate_similarity
+
+    dataset = FolderGroupedBatchDataset(os.path.join(ctx["data_dir"], "crops"), transform=default_transform())
+    for arch, model in ctx["models"].items():
+        yield ({"arch": arch, "P": 5, "K": 5, "inter_K": 16},
+               lambda model=model: validate_similarity(model, dataset, "cpu"), 5 * 5 + 5 * 16)
+
+
+def case_xml_parse(ctx):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                    "preprocessing"))
+    from label_index import parse_labels
+
+    xml_dir = os.path.join(ctx["data_dir"], "xml")
+    paths = sorted(os.path.join(xml_dir, f) for f in os.listdir(xml_dir))
+    workers = ctx["threads"]
+    yield {"files": len(paths), "workers": workers}, lambda: parse_labels(paths, workers=workers), len(paths)
+
+
+CASES = {
+    "pk_loader": case_pk_loader,
+    "triplet_loss": case_triplet_loss,
+    "train_step": case_train_step,
+    "forward": case_forward,
+    "compute_embeddings": case_compute_embeddings,
+    "evaluate": case_evaluate,
+    "validate_similarity": case_validate_similarity,
+    "xml_parse": case_xml_parse,
+}
+
+
+def _fresh(model):
+    import copy
+
+    return copy.deepcopy(model)
+
+
+def load_models(checkpoint, archs):
+    from reid.model import DEFAULT_CONFIGS, build_model, load_model
+
+    if checkpoint:
+        model = load_model(checkpoint)
+        return {model.config["arch"]: model}
+    torch.manual_seed(0)
+    return {arch: build_model(DEFAULT_CONFIGS[arch]).eval() for arch in archs}
+
+
+def run_suite(args):
+    data_dir = make_data(args.data_dir)
+    models = load_models(args.checkpoint, args.archs)
+    results = []
+    for threads in args.threads:
+        set_threads(threads)
+        ctx = {"data_dir": data_dir, "models": models, "threads": threads}
+        for name in args.cases:
+            for params, fn, items in CASES[name](ctx):
+                r = measure(fn, args.warmup, args.repeats, items, args.budget)
+                results.append({"case": name, "params": params, "threads": threads, **r})
+                print(f"{name:>20} {json.dumps(params):<60} t={threads:<2} p50 {r['p50_ms']:>9.2f} ms  "
+                      f"p90 {r['p90_ms']:>9.2f} ms  {r['items_per_s']:>9.1f} items/s", flush=True)
+    meta = environment()
+    meta.update(checkpoint=args.checkpoint,
+                models={arch: getattr(m, "config", None) or arch for arch, m in models.items()},
+                warmup=args.warmup, repeats=args.repeats, budget=args.budget,
+                data_dir=data_dir, data_version=DATA_VERSION)
+    return {"meta": meta, "results": results}
+
+
+def _key(r):
+    return r["case"], json.dumps(r["params"], sort_keys=True), r["threads"]
+
+
+def compare(base_path, new_path, tolerance):
+    with open(base_path, encoding="utf-8") as f:
+        base = {_key(r): r for r in json.load(f)["results"]}
+    with open(new_path, encoding="utf-8") as f:
+        new = {_key(r): r for r in json.load(f)["results"]}
+    regressions = 0
+    print(f"{'case':>20} {'params':<60} {'t':>2} {'base p50':>10} {'new p50':>10} {'change':>8}")
+    for key in sorted(base.keys() & new.keys()):
+        b, n = base[key]["p50_ms"], new[key]["p50_ms"]
+        change = n / b - 1
+        flag = ""
+        if change > tolerance:
+            flag, regressions = " ❌", regressions + 1
+        print(f"{key[0]:>20} {key[1]:<60} {key[2]:>2} {b:>10.2f} {n:>10.2f} {change:>+8.1%}{flag}")
+    for key in sorted(base.keys() ^ new.keys()):
+        print(f"{key[0]:>20} {key[1]:<60} {key[2]:>2} only in {'base' if key in base else 'new'}")
+    print(f"\n{regressions} regression(s) above {tolerance:.0%}")
+    return regressions
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        parser = argparse.ArgumentParser(prog="benchmarks.suite compare")
+        parser.add_argument("base")
+        parser.add_argument("new")
+        parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative p50 increase")
+        args = parser.parse_args(sys.argv[2:])
+        sys.exit(1 if compare(args.base, args.new, args.tolerance) else 0)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", nargs="+", default=list(CASES), choices=list(CASES))
+    parser.add_argument("--archs", nargs="+", default=list(ARCHS), choices=list(ARCHS))
+    parser.add_argument("--checkpoint", default=None, help="benchmark this model instead of random ones")
+    parser.add_argument("--threads", type=int, nargs="+", default=[1])
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--budget", type=float, default=30.0, help="seconds per measurement (0 = no limit)")
+    parser.add_argument("--data-dir", default=DEFAULT_DATA_DIR)
+    parser.add_argument("--out", default=None, help="JSON results file")
+    args = parser.parse_args()
+
+    report = run_suite(args)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"💾 {len(report['results'])} results → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
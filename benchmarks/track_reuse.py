@@ -0,0 +1,99 @@
+import argparse
+import time
+
+import numpy as np
+import torch
+
+from reid.gallery import Gallery
+from reid.model import load_reid_model
+from reid.stream import FullFrameDetector, RoICropper, YOLODetector
+from reid.tracker import Tracker
+
+# Re-id forwards with and without track-aware embedding reuse on recorded clips.
+#
+# Every frame is detected once; each detection is embedded ("fresh") and the
+# tracker decides which of those forwards it would actually have run. Reported:
+# forwards per second of video both ways, how close the reused track embedding
+# is to the fresh one, and, with a gallery, whether both give the same top-1 pid.
+#
+#   python -m benchmarks.track_reuse clip.mp4 --reid-model reid_ts.pt --gallery gallery_dir/
+
+
+def read_frames(path, max_frames=None):
+    import cv2
+
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+    frames = []
+    while max_frames is None or len(frames) < max_frames:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames, fps
+
+
+@torch.no_grad()
+def run_clip(path, detector, model, cropper, tracker, max_frames=None):
+    frames, fps = read_frames(path, max_frames)
+    fresh, reused, forwards = [], [], 0
+    for index, frame in enumerate(frames):
+        boxes, _ = detector([frame])[0]
+        if len(boxes) == 0:
+            tracker.update(boxes, index, frame.shape)
+            continue
+        embeddings = model(cropper([frame], [boxes])).cpu().numpy()
+        tracks, needs, quality = tracker.update(boxes, index, frame.shape)
+        for track, need, q, emb in zip(tracks, needs, quality, embeddings):
+            if need:
+                track.add_embedding(emb, q, index)
+                forwards += 1
+            fresh.append(emb)
+            reused.append(track.embedding)
+    return np.array(fresh), np.array(reused), forwards, len(frames) / fps
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("clips", nargs="+")
+    parser.add_argument("--detector", default="yolo11n.pt", help="YOLO weights, or 'none' for pre-cropped videos")
+    parser.add_argument("--reid-model", required=True, help="re-id checkpoint (reid.model) or TorchScript export")
+    parser.add_argument("--gallery", default=None, help="Gallery directory for top-1 agreement")
+    parser.add_argument("--embed-interval", type=int, nargs="+", default=[5, 15, 30])
+    parser.add_argument("--max-frames", type=int, default=None)
+    parser.add_argument("--device", default="cpu")
+    args = parser.parse_args()
+
+    detector = FullFrameDetector() if args.detector == "none" else YOLODetector(args.detector, device=args.device)
+    model = load_reid_model(args.reid_model, device=args.device)
+    cropper = RoICropper(device=args.device)
+    gallery = Gallery(args.gallery) if args.gallery else None
+
+    print(f"{'interval':>8} {'dets/s':>8} {'fwd/s':>8} {'saving':>7} {'cos mean':>9} {'cos p5':>7} {'top-1 agree':>12}")
+    for interval in args.embed_interval:
+        start = time.perf_counter()
+        fresh, reused, forwards, seconds = [], [], 0, 0.0
+        for clip in args.clips:
+            f, r, n, s = run_clip(clip, detector, model, cropper, Tracker(embed_interval=interval), args.max_frames)
+            fresh.append(f), reused.append(r)
+            forwards += n
+            seconds += s
+        fresh = np.concatenate([f for f in fresh if len(f)]) if any(len(f) for f in fresh) else np.zeros((0, 1))
+        reused = np.concatenate([r for r in reused if len(r)]) if any(len(r) for r in reused) else np.zeros((0, 1))
+        fresh_n = fresh / np.maximum(np.linalg.norm(fresh, axis=1, keepdims=True), 1e-12)
+        cos = (fresh_n * reused).sum(axis=1) if len(fresh) else np.zeros(1)
+
+        agree = float("nan")
+        if gallery is not None and len(fresh):
+            _, top_fresh = gallery.search(fresh, k=1, exact=True)
+            _, top_reused = gallery.search(reused, k=1, exact=True)
+            agree = float(np.mean(np.array(gallery.pids(top_fresh)) == np.array(gallery.pids(top_reused))))
+        dets = len(fresh) / max(seconds, 1e-9)
+        fwd = forwards / max(seconds, 1e-9)
+        print(f"{interval:>8} {dets:>8.1f} {fwd:>8.1f} {dets / max(fwd, 1e-9):>6.1f}x {cos.mean():>9.3f} "
+              f"{np.percentile(cos, 5):>7.3f} {agree:>12.3f}   ({time.perf_counter() - start:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
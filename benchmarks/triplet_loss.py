@@ -0,0 +1,55 @@
+import argparse
+import time
+
+import torch
+
+from reid.losses import combined_triplet_loss, combined_triplet_loss_loop
+
+# Vectorized vs per-anchor combined_triplet_loss, forward + backward, on CPU.
+#
+#   python -m benchmarks.triplet_loss --threads 4
+
+
+def time_loss(loss_fn, embeddings, labels, repeats):
+    times = []
+    for _ in range(repeats):
+        emb = embeddings.clone().requires_grad_(True)
+        start = time.perf_counter()
+        loss = loss_fn(emb, labels)
+        loss.backward()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2], loss.detach(), emb.grad
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--P", type=int, nargs="+", default=[16, 32, 64])
+    parser.add_argument("--K", type=int, nargs="+", default=[4, 8])
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(0)
+
+    print(f"{'P':>4} {'K':>3} {'N':>5} {'loop ms':>10} {'vector ms':>10} {'speedup':>8} {'max |Δloss|':>12} {'max |Δgrad|':>12}")
+    for P in args.P:
+        for K in args.K:
+            labels = torch.arange(P).repeat_interleave(K)
+            embeddings = torch.randn(P * K, args.dim)
+
+            # warmup
+            time_loss(combined_triplet_loss, embeddings, labels, 2)
+            time_loss(combined_triplet_loss_loop, embeddings, labels, 1)
+
+            t_loop, l_loop, g_loop = time_loss(combined_triplet_loss_loop, embeddings, labels, max(3, args.repeats // 5))
+            t_vec, l_vec, g_vec = time_loss(combined_triplet_loss, embeddings, labels, args.repeats)
+            print(f"{P:>4} {K:>3} {P * K:>5} {t_loop * 1e3:>10.2f} {t_vec * 1e3:>10.3f} {t_loop / t_vec:>7.1f}x "
+                  f"{(l_loop - l_vec).abs().item():>12.2e} {(g_loop - g_vec).abs().max().item():>12.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,11 @@
 import os
 import shutil
-import xml.etree.ElementTree as ET
 from pathlib import Path
 from collections import defaultdict
-import random
+
+from dedup import dedup_sequences, print_report
+from label_index import LABEL_FIELDS, load_or_build_index, index_by_path, lookup_label
+from manifest import Manifest, copy_with_manifest
 
 
 # 🔍 Scanning group: TS3_2022_IN
@@ -36,44 +38,66 @@ RAW_BASE = Path("DATA/Validation/raw/VS")
 LABEL_BASE = Path("DATA/Validation/label/VS")
 OUTPUT_BASE = Path("DATA/VALID")
 NUM_SETS = 5
-
-
-def parse_xml(xml_path):
-    try:
-        tree = ET.parse(xml_path)
-        root = tree.getroot()
-
-        mode = root.findtext("CAMERA/mode", default="0")
-        obj = root.find("OBJECT")
-        object_id = obj.attrib.get("ID")
-        upper = obj.findtext("upperclothes", "NULL")
-        upper_color = obj.findtext("upperclothes_color", "NULL")
-        lower = obj.findtext("lowerclothes", "NULL")
-        lower_color = obj.findtext("lowerclothes_color", "NULL")
-
-        foldername = f"{object_id}_{upper}_{upper_color}_{lower}_{lower_color}"
-        return mode, foldername
-    except Exception as e:
-        print(f"❌ Failed to parse XML: {xml_path} → {e}")
+SKIP_GROUPS = ("VS1_2020_IN", "VS2_2020_OUT")
+INDEX_PATH = OUTPUT_BASE / "label_index.npy"  # shared XML label index (see label_index.py)
+REBUILD_INDEX = False
+INDEX_WORKERS = None  # None → os.cpu_count()
+MANIFEST_PATH = OUTPUT_BASE / "manifest.sqlite"  # file stats, set assignment and copy progress (see manifest.py)
+SEED = None  # seed for shuffling newly seen folders into sets
+LINK_MODE = "auto"  # "auto" | "hardlink" | "reflink" | "symlink" | "copy" (see materialize.py)
+COPY_WORKERS = 8  # threads for the files that still need a real copy
+DEDUP_THRESHOLD = None  # None → keep every other frame; e.g. 6 → drop frames within 6 dHash bits of a recent kept frame (dedup.py)
+DEDUP_WORKERS = None  # None → os.cpu_count()
+
+
+def parse_xml(fields):
+    """Returns (mode, foldername) from a label_index row, or (None, None) if it failed to parse."""
+    if fields is None or not fields["has_object"]:
         return None, None
-
-
-def collect_valid_images():
+    # same defaults as root.findtext("CAMERA/mode", "0") / obj.findtext(tag, "NULL"): only for missing tags
+    mode = "0" if fields["mode"] is None else fields["mode"]
+    object_id = fields["object_id"]
+    upper, upper_color, lower, lower_color = (
+        "NULL" if fields[f] is None else fields[f]
+        for f in ("upperclothes", "upperclothes_color", "lowerclothes", "lowerclothes_color"))
+
+    foldername = f"{object_id}_{upper}_{upper_color}_{lower}_{lower_color}"
+    return mode, foldername
+
+
+def collect_valid_images(manifest):
+    """
+    Scans the raw tree, syncs every image into the manifest and returns
+    {foldername: [image paths]} for the selected images.
+
+    Files with mode=1000 are only excluded, never deleted, so the frame
+    selection is the same on every rerun. Within each camera sequence,
+    near-duplicate frames are pruned by perceptual hash (DEDUP_THRESHOLD), or
+    every other frame is kept when DEDUP_THRESHOLD is None.
+    """
     folder_to_images = defaultdict(list)
-    removed_mode_count = 0
+    skipped_mode_count = 0
     kept_image_count = 0
 
     if not RAW_BASE.exists():
         print(f"❌ RAW_BASE path not found: {RAW_BASE}")
         return folder_to_images
 
+    groups = [g for g in sorted(os.listdir(RAW_BASE))
+              if (RAW_BASE / g).is_dir() and g not in SKIP_GROUPS]
+    index = load_or_build_index(INDEX_PATH, [LABEL_BASE / g for g in groups if (LABEL_BASE / g).is_dir()],
+                                workers=INDEX_WORKERS, rebuild=REBUILD_INDEX)
+    path_to_row = index_by_path(index)
+    records = []
+    sequences = defaultdict(list)  # (camera dir, foldername) → record indices, in frame order
+
     for group in os.listdir(RAW_BASE):
         group_path = RAW_BASE / group
         label_group_path = LABEL_BASE / group
 
         if not group_path.is_dir():
             continue
-        if group_path.name == "VS1_2020_IN" or group_path.name == "VS2_2020_OUT":
+        if group_path.name in SKIP_GROUPS:
             print("Skipping 2020 data")
             continue    
         print(f"🔍 Scanning group: {group}")
@@ -103,61 +127,80 @@ def collect_valid_images():
                             print(f"⚠️ Missing XML     {xml_path} ")
                             continue
 
-                        mode, foldername = parse_xml(xml_path)
+                        fields = lookup_label(index, path_to_row, xml_path)
+                        mode, foldername = parse_xml(fields)
                         if mode is None:
                             continue
 
-                        # Step 0: Remove files with mode=1000
+                        # Step 0: skip files with mode=1000
+                        # Step 1: near-duplicate pruning below, or skip odd index (keep only 0, 2, 4, ...)
+                        selected = mode != "1000" and (DEDUP_THRESHOLD is not None or idx % 2 == 0)
                         if mode == "1000":
-                            try:
-                                os.remove(img_path)
-                                os.remove(xml_path)
-                                removed_mode_count += 1
-                            except:
-                                pass
-                            continue
-
-                        # Step 1: skip even index (keep only 0, 2, 4, ...)
-                        if idx % 2 == 1:
-                            continue
-
-                        folder_to_images[foldername].append(img_path.resolve())
-                        kept_image_count += 1
-
-    print(f"✅ Mode=1000 files removed: {removed_mode_count}")
+                            skipped_mode_count += 1
+
+                        img_path = img_path.resolve()
+                        st = img_path.stat()
+                        record = {name: fields[name] for name in LABEL_FIELDS}
+                        record.update(path=str(img_path), size=st.st_size, mtime_ns=st.st_mtime_ns,
+                                      xml_path=fields["xml_path"], seq_idx=idx,
+                                      selected=int(selected), group_key=foldername)
+                        if selected:
+                            sequences[(str(img_dir), foldername)].append(len(records))
+                        records.append(record)
+
+    if DEDUP_THRESHOLD is not None and sequences:
+        kept, stats = dedup_sequences({k: [records[i]["path"] for i in idx_list] for k, idx_list in sequences.items()},
+                                      threshold=DEDUP_THRESHOLD, workers=DEDUP_WORKERS, manifest=manifest)
+        print_report(stats)
+        for key, idx_list in sequences.items():
+            keep = set(kept[key])
+            for i in idx_list:
+                records[i]["selected"] = int(records[i]["path"] in keep)
+
+    for record in records:
+        if record["selected"]:
+            folder_to_images[record["group_key"]].append(Path(record["path"]))
+            kept_image_count += 1
+
+    new, changed, unchanged, removed = manifest.sync_files(records)
+    print(f"📒 Manifest: {new} new, {changed} changed, {unchanged} unchanged, {removed} removed files")
+    print(f"✅ Mode=1000 files skipped: {skipped_mode_count}")
     print(f"✅ Valid images kept: {kept_image_count}")
     print(f"✅ Unique grouped folders: {len(folder_to_images)}")
     return folder_to_images
 
 
-def distribute_images(folder_to_images):
-    grouped = list(folder_to_images.items())
-    random.shuffle(grouped)
-
-    sets = [[] for _ in range(NUM_SETS)]
-    for i, item in enumerate(grouped):
-        sets[i % NUM_SETS].append(item)
+def distribute_images(folder_to_images, manifest):
+    """
+    Copies each folder into its set. Folders keep the set they were given on
+    earlier runs and copies already recorded in the manifest are skipped.
+    """
+    targets = [f"set{i}" for i in range(1, NUM_SETS + 1)]
+    assignment = manifest.assign_groups(targets, list(folder_to_images), seed=SEED)
 
     print(f"📦 Distributing folders into {NUM_SETS} sets...")
 
-    for set_idx, group in enumerate(sets, 1):
-        set_path = OUTPUT_BASE / f"set{set_idx}"
-        for foldername, img_list in group:
-            target_folder = set_path / foldername
-            target_folder.mkdir(parents=True, exist_ok=True)
-            for img_path in img_list:
-                shutil.copy(img_path, target_folder / img_path.name)
+    pairs = []
+    for foldername, img_list in folder_to_images.items():
+        target_folder = OUTPUT_BASE / assignment[foldername] / foldername
+        for img_path in img_list:
+            pairs.append((img_path, target_folder / img_path.name))
 
-    print("🎉 All images copied successfully into sets.")
+    copied, skipped, failed = copy_with_manifest(manifest, pairs, shutil.copy,
+                                                 link_mode=LINK_MODE, workers=COPY_WORKERS)
+    print(f"📋 Copied: {copied}, already done: {skipped}, failed: {failed}")
+    if failed == 0:
+        print("🎉 All images copied successfully into sets.")
 
 
 def main():
     print("🚀 Starting dataset processing...")
-    folder_to_images = collect_valid_images()
-    if not folder_to_images:
-        print("⚠️ No images collected. Exiting.")
-        return
-    distribute_images(folder_to_images)
+    with Manifest(MANIFEST_PATH) as manifest:
+        folder_to_images = collect_valid_images(manifest)
+        if not folder_to_images:
+            print("⚠️ No images collected. Exiting.")
+            return
+        distribute_images(folder_to_images, manifest)
     print("✅ Done.")
 
 
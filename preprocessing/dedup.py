@@ -0,0 +1,209 @@
+import os
+import re
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# Near-duplicate frame pruning for the preprocessing scripts.
+#
+# The raw data are frame sequences from mostly static cameras. Keeping every
+# other frame (idx % 2 / [1::2]) keeps long runs of near-identical frames of a
+# person standing still and drops distinct ones when they move. Here each frame
+# gets a 64-bit difference hash (dHash: a 9x8 grey thumbnail, one bit per
+# horizontal gradient sign). A frame is dropped when it is within THRESHOLD
+# bits of one of the last WINDOW frames kept from the same sequence
+# (pid / camera), so a slow drift still keeps a frame every few steps.
+#
+#   python dedup.py <image_dir> [<image_dir> ...] -t 6 -w 8     # report only
+#
+# Hashing runs in a process pool. With a Manifest, hashes of unchanged files
+# (same size / mtime) are reused on the next run.
+
+HASH_SIZE = 8  # dHash grid → HASH_SIZE * HASH_SIZE bit hash
+THRESHOLD = 6  # max Hamming distance (bits of 64) still counted as a duplicate
+WINDOW = 4  # kept frames of the sequence each new frame is compared against
+CHUNK_SIZE = 256  # images handed to a worker per task
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp")
+
+# trailing frame number of a file name: "..._C01_000123.png" → "..._C01"
+_FRAME_SUFFIX = re.compile(r"[_\-]?\d+$")
+
+
+def dhash(path, hash_size=HASH_SIZE):
+    """
+    Difference hash of an image as a Python int, or None if it can't be read.
+
+    Args:
+        path (str): Image file.
+        hash_size (int): Grid size; the hash has hash_size**2 bits.
+    """
+    try:
+        with Image.open(path) as img:
+            img.draft("L", (hash_size * 4, hash_size * 4))  # JPEG: decode at reduced size
+            thumb = img.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    except (OSError, ValueError):
+        return None
+    pixels = np.asarray(thumb, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def _hash_chunk(paths):
+    return [dhash(p) for p in paths]
+
+
+def hash_images(paths, workers=None, chunksize=CHUNK_SIZE, manifest=None):
+    """
+    dHashes of many images in parallel.
+
+    Args:
+        paths (list): Image files.
+        workers (int, optional): Number of worker processes. Defaults to os.cpu_count().
+        chunksize (int): Number of images sent to a worker per task.
+        manifest (Manifest, optional): Reuse / store hashes of files whose size
+                                       and mtime did not change.
+
+    Returns:
+        list: One hash (int, or None for unreadable files) per path, in order.
+    """
+    paths = [str(p) for p in paths]
+    hashes = [None] * len(paths)
+    todo = list(range(len(paths)))
+    stats = {}
+    if manifest is not None:
+        known = manifest.known_hashes()
+        todo = []
+        for i, p in enumerate(paths):
+            st = os.stat(p)
+            stats[p] = (st.st_size, st.st_mtime_ns)
+            cached = known.get(p)
+            if cached is not None and cached[:2] == stats[p]:
+                hashes[i] = cached[2]
+            else:
+                todo.append(i)
+
+    workers = workers or os.cpu_count() or 1
+    missing = [paths[i] for i in todo]
+    chunks = [missing[i:i + chunksize] for i in range(0, len(missing), chunksize)]
+    if workers == 1 or len(chunks) <= 1:
+        results = [h for chunk in chunks for h in _hash_chunk(chunk)]
+    else:
+        results = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for chunk_result in pool.map(_hash_chunk, chunks):
+                results.extend(chunk_result)
+    for i, h in zip(todo, results):
+        hashes[i] = h
+
+    if manifest is not None and todo:
+        manifest.store_hashes([(paths[i], *stats[paths[i]], hashes[i]) for i in todo if hashes[i] is not None])
+    return hashes
+
+
+def select_distinct(hashes, threshold=THRESHOLD, window=WINDOW):
+    """
+    Indices of the frames to keep from one sequence (in frame order).
+
+    A frame is kept unless its hash is within `threshold` bits of one of the
+    last `window` kept frames. Frames without a hash are always kept.
+    """
+    keep = []
+    recent = []
+    for i, h in enumerate(hashes):
+        if h is None:
+            keep.append(i)
+            continue
+        if any((h ^ r).bit_count() <= threshold for r in recent):
+            continue
+        keep.append(i)
+        recent.append(h)
+        if len(recent) > window:
+            recent.pop(0)
+    return keep
+
+
+def sequence_key(filename):
+    """Groups files of one flat folder into sequences: the name without its frame number."""
+    return _FRAME_SUFFIX.sub("", os.path.splitext(os.path.basename(filename))[0])
+
+
+def dedup_sequences(sequences, threshold=THRESHOLD, window=WINDOW, workers=None, manifest=None):
+    """
+    Near-duplicate pruning of many frame sequences, hashed in one parallel pass.
+
+    Args:
+        sequences (dict): {key: [image paths in frame order]}.
+        threshold (int): See select_distinct.
+        window (int): See select_distinct.
+        workers (int, optional): Hashing processes.
+        manifest (Manifest, optional): Hash cache, see hash_images.
+
+    Returns:
+        tuple: ({key: [kept paths]}, stats dict with total / kept / removed /
+               unreadable / bytes_removed / seconds).
+    """
+    start = time.perf_counter()
+    keys = list(sequences)
+    flat = [p for k in keys for p in sequences[k]]
+    hashes = hash_images(flat, workers=workers, manifest=manifest)
+
+    kept = {}
+    bytes_removed = 0
+    pos = 0
+    for k in keys:
+        paths = sequences[k]
+        seq_hashes = hashes[pos:pos + len(paths)]
+        pos += len(paths)
+        keep = select_distinct(seq_hashes, threshold, window)
+        kept[k] = [paths[i] for i in keep]
+        keep_set = set(keep)
+        bytes_removed += sum(os.path.getsize(p) for i, p in enumerate(paths) if i not in keep_set)
+
+    n_kept = sum(len(v) for v in kept.values())
+    stats = {"sequences": len(keys), "total": len(flat), "kept": n_kept, "removed": len(flat) - n_kept,
+             "unreadable": sum(h is None for h in hashes), "bytes_removed": bytes_removed,
+             "seconds": time.perf_counter() - start}
+    return kept, stats
+
+
+def print_report(stats):
+    total = max(stats["total"], 1)
+    print(f"🧹 Dedup: {stats['total']} frames in {stats['sequences']} sequences → kept {stats['kept']}, "
+          f"removed {stats['removed']} ({stats['removed'] / total:.1%}, "
+          f"{stats['bytes_removed'] / 1e6:.1f} MB) in {stats['seconds']:.1f}s")
+    if stats["unreadable"]:
+        print(f"⚠️ Unreadable images (kept): {stats['unreadable']}")
+
+
+def sequences_in_folder(image_dir):
+    """{(folder, sequence_key): [sorted image paths]} for every folder under image_dir."""
+    sequences = defaultdict(list)
+    for root, _, files in os.walk(image_dir):
+        for f in sorted(files):
+            if f.lower().endswith(IMAGE_EXTENSIONS):
+                sequences[(root, sequence_key(f))].append(os.path.join(root, f))
+    return dict(sequences)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Report near-duplicate frames per sequence (nothing is deleted).")
+    parser.add_argument("image_dirs", nargs="+")
+    parser.add_argument("-t", "--threshold", type=int, default=THRESHOLD)
+    parser.add_argument("--window", type=int, default=WINDOW)
+    parser.add_argument("-w", "--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    sequences = {}
+    for d in args.image_dirs:
+        if not os.path.isdir(d):
+            print(f"❌ Not a directory: {d}")
+            sys.exit(1)
+        sequences.update(sequences_in_folder(d))
+    _, stats = dedup_sequences(sequences, args.threshold, args.window, args.workers)
+    print_report(stats)
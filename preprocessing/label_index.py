@@ -0,0 +1,366 @@
+import os
+import sys
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+# Shared label indexer for the preprocessing scripts.
+#
+# 2022file_preprocess.py, split_data.py and part_classify_files.py all need the
+# same handful of fields from every XML label. Instead of each script calling
+# ET.parse once per file in a single thread, this module parses the whole label
+# tree once with a process pool and stores the result as a NumPy structured
+# array (one column per field). The scripts load that array and look rows up
+# by XML path.
+#
+#   python label_index.py <label_dir> [<label_dir> ...] -o label_index.npy -w 8
+#
+# The lookups follow the scripts' original ElementTree calls: CAMERA/mode and
+# FILE/name / OBJECT under the root (root.find("OBJECT")), or with nested=True
+# the first FILE/name and OBJECT at any depth (root.find(".//OBJECT"), as in
+# split_data.py). A missing tag or attribute is kept apart from an empty one
+# (None vs ""), so every script can apply its own defaults.
+
+# Fields pulled out of each XML, in column order.
+LABEL_FIELDS = (
+    "mode",                # CAMERA/mode (findtext default "0" is applied by the caller)
+    "object_id",           # OBJECT@ID
+    "upperclothes",        # OBJECT/upperclothes
+    "upperclothes_color",  # OBJECT/upperclothes_color
+    "lowerclothes",        # OBJECT/lowerclothes
+    "lowerclothes_color",  # OBJECT/lowerclothes_color
+    "file_name",           # FILE/name
+)
+
+_CLOTHING_TAGS = ("upperclothes", "upperclothes_color", "lowerclothes", "lowerclothes_color")
+
+CHUNK_SIZE = 2048  # XML files handed to a worker per task
+
+
+def parse_label(xml_path, nested=False):
+    """
+    Streams a single XML label and returns only the fields in LABEL_FIELDS.
+
+    The file is read with ET.iterparse and parsing stops as soon as every
+    field has been seen, so the rest of the document is never built.
+
+    Args:
+        xml_path (str): Path of the XML label.
+        nested (bool): Take the first OBJECT and FILE/name at any depth
+                       (".//OBJECT") instead of direct children of the root.
+
+    Returns:
+        tuple: (fields, has_object) where fields is a tuple in LABEL_FIELDS
+               order: the tag text ("" when empty, like findtext) or None when
+               the tag / ID attribute is missing. None if the file could not be parsed.
+    """
+    values = dict.fromkeys(LABEL_FIELDS)
+    found = set()
+    has_object = False
+    object_depth = None  # stack depth of the OBJECT in use while it is open
+    object_done = False
+    stack = []
+
+    try:
+        for event, elem in ET.iterparse(xml_path, events=("start", "end")):
+            if event == "start":
+                stack.append(elem.tag)
+                if (elem.tag == "OBJECT" and not has_object
+                        and (len(stack) == 2 or (nested and len(stack) > 2))):
+                    has_object = True
+                    object_depth = len(stack)
+                    values["object_id"] = elem.get("ID")
+                    found.add("object_id")
+                continue
+
+            stack.pop()
+            parent = stack[-1] if stack else None
+            if parent == "CAMERA" and len(stack) == 2 and elem.tag == "mode" and "mode" not in found:
+                values["mode"] = elem.text or ""
+                found.add("mode")
+            elif (parent == "FILE" and (len(stack) == 2 or (nested and len(stack) > 2))
+                  and elem.tag == "name" and "file_name" not in found):
+                values["file_name"] = elem.text or ""
+                found.add("file_name")
+            elif (parent == "OBJECT" and len(stack) == object_depth and not object_done
+                  and elem.tag in _CLOTHING_TAGS and elem.tag not in found):
+                values[elem.tag] = elem.text or ""
+                found.add(elem.tag)
+            elif elem.tag == "OBJECT" and len(stack) + 1 == object_depth:
+                # only the first OBJECT counts, like root.find("OBJECT") / root.find(".//OBJECT")
+                object_done = True
+
+            if len(stack) > 1:
+                elem.clear()
+            if len(found) == len(LABEL_FIELDS):
+                break
+    except (ET.ParseError, OSError) as e:
+        print(f"❌ Failed to parse XML: {xml_path} → {e}")
+        return None
+
+    return tuple(values[f] for f in LABEL_FIELDS), has_object
+
+
+def _parse_chunk(xml_paths, nested=False):
+    return [parse_label(p, nested) for p in xml_paths]
+
+
+def parse_labels(xml_paths, workers=None, chunksize=CHUNK_SIZE, nested=False):
+    """
+    Parses many XML labels in parallel.
+
+    Args:
+        xml_paths (list[str]): XML files to parse.
+        workers (int, optional): Number of worker processes. Defaults to os.cpu_count().
+                                 With workers=1 everything runs in this process.
+        chunksize (int): Number of files sent to a worker per task.
+        nested (bool): See parse_label.
+
+    Returns:
+        list: One parse_label() result per input path, in the same order.
+    """
+    xml_paths = list(xml_paths)
+    workers = workers or os.cpu_count() or 1
+    chunks = [xml_paths[i:i + chunksize] for i in range(0, len(xml_paths), chunksize)]
+
+    if workers == 1 or len(chunks) <= 1:
+        return [r for chunk in chunks for r in _parse_chunk(chunk, nested)]
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunk_result in pool.map(partial(_parse_chunk, nested=nested), chunks):
+            results.extend(chunk_result)
+    return results
+
+
+def find_label_files(label_dirs, recursive=True):
+    """
+    Lists every .xml file under the given directories, sorted.
+
+    Args:
+        label_dirs (str | Path | list): One or more label root directories.
+        recursive (bool): Also descend into subdirectories (False: os.listdir of each root).
+
+    Returns:
+        list[str]: Absolute XML paths.
+    """
+    if isinstance(label_dirs, (str, os.PathLike)):
+        label_dirs = [label_dirs]
+
+    xml_paths = []
+    for label_dir in label_dirs:
+        if not recursive:
+            xml_paths.extend(os.path.abspath(os.path.join(label_dir, f)) for f in os.listdir(label_dir)
+                             if f.endswith(".xml") and os.path.isfile(os.path.join(label_dir, f)))
+            continue
+        for dirpath, _, filenames in os.walk(label_dir):
+            for fname in filenames:
+                if fname.endswith(".xml"):
+                    xml_paths.append(os.path.abspath(os.path.join(dirpath, fname)))
+    xml_paths.sort()
+    return xml_paths
+
+
+def _encode(values):
+    return [v.encode("utf-8") for v in values]
+
+
+def _byte_column(values):
+    width = max((len(v) for v in values), default=1) or 1
+    return np.array(values, dtype=f"S{width}")
+
+
+def stat_files(paths):
+    """Returns (size, mtime_ns) for each path; (-1, -1) if the file is gone."""
+    stats = []
+    for p in paths:
+        try:
+            st = os.stat(p)
+            stats.append((st.st_size, st.st_mtime_ns))
+        except OSError:
+            stats.append((-1, -1))
+    return stats
+
+
+def records_to_index(xml_paths, results, stats=None, nested=False):
+    """
+    Builds the columnar index from parse_labels() output.
+
+    Strings are stored as UTF-8 bytes (fixed width per column) so the array
+    stays compact and can be memory-mapped; use row_fields() to decode a row.
+    Missing tags are stored as "" with their bit set in `missing` (bit i =
+    LABEL_FIELDS[i]). `stats` are the (size, mtime_ns) of each XML, used to
+    skip unchanged files on the next build; `nested` records how the rows were parsed.
+    """
+    n = len(xml_paths)
+    stats = stats if stats is not None else stat_files(xml_paths)
+    columns = {"xml_path": _byte_column(_encode(xml_paths))}
+    for i, field in enumerate(LABEL_FIELDS):
+        columns[field] = _byte_column(_encode(r[0][i] or "" if r else "" for r in results))
+    ok = np.array([r is not None for r in results], dtype=bool)
+    has_object = np.array([bool(r and r[1]) for r in results], dtype=bool)
+    missing = np.array([sum(1 << i for i, v in enumerate(r[0]) if v is None) if r else 0 for r in results],
+                       dtype=np.uint8)
+
+    dtype = [(name, col.dtype) for name, col in columns.items()]
+    dtype += [("ok", bool), ("has_object", bool), ("missing", np.uint8), ("nested", bool),
+              ("size", np.int64), ("mtime_ns", np.int64)]
+    index = np.empty(n, dtype=dtype)
+    for name, col in columns.items():
+        index[name] = col
+    index["ok"] = ok
+    index["has_object"] = has_object
+    index["missing"] = missing
+    index["nested"] = nested
+    index["size"] = [st[0] for st in stats]
+    index["mtime_ns"] = [st[1] for st in stats]
+    return index
+
+
+def _row_result(row):
+    if not row["ok"]:
+        return None
+    return tuple(_field(row, i, f) for i, f in enumerate(LABEL_FIELDS)), bool(row["has_object"])
+
+
+def _field(row, i, field):
+    return None if int(row["missing"]) >> i & 1 else row[field].decode("utf-8")
+
+
+def build_index(label_dirs, workers=None, previous=None, nested=False, recursive=True):
+    """
+    Walks the label tree(s) once and parses every XML in parallel.
+
+    Args:
+        label_dirs (str | Path | list): One or more label root directories.
+        workers (int, optional): Number of worker processes.
+        previous (np.ndarray, optional): An earlier index. Rows whose XML has the
+                                         same size and mtime (and were parsed with
+                                         the same `nested`) are reused as-is, so
+                                         only new or changed labels are parsed.
+        nested (bool): See parse_label.
+        recursive (bool): See find_label_files.
+
+    Returns:
+        np.ndarray: Structured array with columns xml_path, LABEL_FIELDS, ok,
+                    has_object, missing, nested, size, mtime_ns.
+    """
+    start = time.perf_counter()
+    xml_paths = find_label_files(label_dirs, recursive=recursive)
+    stats = stat_files(xml_paths)
+    print(f"🔍 Found {len(xml_paths)} XML labels")
+
+    results = [None] * len(xml_paths)
+    to_parse = list(range(len(xml_paths)))
+    if previous is not None and "nested" in previous.dtype.names:
+        prev_rows = index_by_path(previous)
+        to_parse = []
+        for i, (path, st) in enumerate(zip(xml_paths, stats)):
+            row = prev_rows.get(path)
+            if (row is not None and previous["nested"][row] == nested
+                    and (previous["size"][row], previous["mtime_ns"][row]) == st):
+                results[i] = _row_result(previous[row])
+            else:
+                to_parse.append(i)
+        print(f"♻️ Reusing {len(xml_paths) - len(to_parse)} unchanged labels, parsing {len(to_parse)}")
+
+    parsed = parse_labels([xml_paths[i] for i in to_parse], workers=workers, nested=nested)
+    for i, r in zip(to_parse, parsed):
+        results[i] = r
+    index = records_to_index(xml_paths, results, stats, nested=nested)
+
+    elapsed = time.perf_counter() - start
+    rate = len(to_parse) / elapsed if elapsed > 0 else 0.0
+    print(f"✅ Indexed {len(xml_paths)} labels in {elapsed:.1f}s ({rate:.0f} parsed files/s), "
+          f"{int((~index['ok']).sum())} failed")
+    return index
+
+
+def save_index(index, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.tmp.npy"
+    np.save(tmp_path, index)
+    os.replace(tmp_path, path)
+
+
+def load_index(path, mmap=True):
+    return np.load(path, mmap_mode="r" if mmap else None)
+
+
+def load_or_build_index(path, label_dirs, workers=None, rebuild=False, refresh=True, nested=False,
+                        recursive=True):
+    """
+    Loads the index at `path`, or builds it from `label_dirs` and saves it there.
+
+    With refresh=True (default) an existing index is brought up to date first:
+    new or modified XMLs are parsed, deleted ones dropped, everything else reused.
+    `nested` / `recursive` are passed to build_index.
+    """
+    previous = None
+    if not rebuild and os.path.exists(path):
+        previous = load_index(path, mmap=False)
+        print(f"📂 Loaded label index: {path} ({len(previous)} rows)")
+        if not refresh:
+            return previous
+
+    index = build_index(label_dirs, workers=workers, previous=previous, nested=nested, recursive=recursive)
+    if previous is None or index.dtype != previous.dtype or not np.array_equal(index, previous):
+        save_index(index, path)
+        print(f"💾 Saved label index: {path}")
+    return index
+
+
+def index_by_path(index):
+    """Maps each XML path (str) to its row number in the index."""
+    return {p.decode("utf-8"): i for i, p in enumerate(index["xml_path"])}
+
+
+def row_fields(row):
+    """Decodes one index row into a dict of str / bool values (None for missing tags)."""
+    out = {name: _field(row, i, name) for i, name in enumerate(LABEL_FIELDS)}
+    out["xml_path"] = row["xml_path"].decode("utf-8")
+    out["ok"] = bool(row["ok"])
+    out["has_object"] = bool(row["has_object"])
+    return out
+
+
+def lookup_label(index, path_to_row, xml_path, nested=False):
+    """
+    Returns row_fields() for `xml_path`, parsing the file directly when it is
+    not in the index (e.g. labels added after the index was built).
+    Returns None if the XML cannot be parsed.
+    """
+    xml_path = os.path.abspath(str(xml_path))
+    row = path_to_row.get(xml_path)
+    if row is not None:
+        fields = row_fields(index[row])
+        return fields if fields["ok"] else None
+
+    result = parse_label(xml_path, nested)
+    if result is None:
+        return None
+    fields = dict(zip(LABEL_FIELDS, result[0]))
+    fields.update(xml_path=xml_path, ok=True, has_object=result[1])
+    return fields
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build a label index from XML label trees.")
+    parser.add_argument("label_dirs", nargs="+")
+    parser.add_argument("-o", "--output", default="label_index.npy")
+    parser.add_argument("-w", "--workers", type=int, default=None)
+    parser.add_argument("--nested", action="store_true", help="OBJECT / FILE/name at any depth (split_data.py)")
+    parser.add_argument("--top-level", action="store_true", help="only the XMLs directly in each label_dir")
+    args = parser.parse_args()
+
+    idx = build_index(args.label_dirs, workers=args.workers, nested=args.nested, recursive=not args.top_level)
+    if len(idx) == 0:
+        print("⚠️ No XML labels found.")
+        sys.exit(1)
+    save_index(idx, args.output)
+    print(f"💾 Saved label index: {args.output}")
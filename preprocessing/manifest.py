@@ -0,0 +1,263 @@
+import os
+import random
+import sqlite3
+from collections import Counter
+
+from label_index import LABEL_FIELDS
+from materialize import COPY_WORKERS, Materializer
+
+# Persistent preprocessing manifest (SQLite, one file next to the output).
+#
+# Every run of the preprocessing scripts used to start from scratch: re-scan,
+# re-shuffle, re-copy. The manifest remembers, per source image:
+#   - path, size and mtime (so unchanged files are recognised on the next run)
+#   - the parsed label fields and the group (folder) key they produce
+#   - which set / part the group was assigned to (assignments are kept stable)
+#   - which copies were completed (so an interrupted run resumes where it stopped)
+#   - perceptual hashes of the frames (dedup.py), so reruns only hash new files
+#
+# Typical use:
+#   manifest = Manifest(OUTPUT_BASE / "manifest.sqlite")
+#   manifest.sync_files(records)                      # new / changed files only
+#   targets = manifest.assign_groups([f"set{i}" for i in range(1, 6)])
+#   for src, dst in manifest.pending_copies(pairs): ...; manifest.mark_copied(done)
+
+COMMIT_EVERY = 2000  # copies recorded per transaction
+
+_FILE_COLUMNS = ("path", "size", "mtime_ns", "xml_path", "seq_idx", "selected", "group_key") + LABEL_FIELDS
+
+
+class Manifest:
+    """
+    SQLite-backed record of source files, group assignments and finished copies.
+
+    Args:
+        db_path (str | Path): Location of the manifest database. Created if missing.
+    """
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+        self.conn = sqlite3.connect(self.db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        label_columns = ", ".join(f"{f} TEXT" for f in LABEL_FIELDS)
+        self.conn.executescript(f"""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                xml_path TEXT,
+                seq_idx INTEGER,
+                selected INTEGER,
+                group_key TEXT,
+                {label_columns}
+            );
+            CREATE INDEX IF NOT EXISTS files_group ON files(group_key);
+            CREATE TABLE IF NOT EXISTS groups (
+                group_key TEXT PRIMARY KEY,
+                target TEXT
+            );
+            CREATE TABLE IF NOT EXISTS copies (
+                src TEXT,
+                dst TEXT,
+                size INTEGER,
+                mtime_ns INTEGER,
+                PRIMARY KEY (src, dst)
+            );
+            CREATE TABLE IF NOT EXISTS hashes (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                hash TEXT
+            );
+        """)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.commit()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- source files ---------------------------------------------------
+
+    def known_stats(self):
+        """Returns {path: (size, mtime_ns)} for every file in the manifest."""
+        return {p: (s, m) for p, s, m in self.conn.execute("SELECT path, size, mtime_ns FROM files")}
+
+    def sync_files(self, records, prune=True):
+        """
+        Inserts new files and updates changed ones. Only rows whose stored
+        columns differ (new or modified files, shifted seq_idx / selection,
+        relabelled XMLs) are written, so a rerun over unchanged data writes nothing.
+
+        Args:
+            records (list[dict]): One dict per source file with the keys in
+                                  _FILE_COLUMNS (path, size, mtime_ns, ...).
+            prune (bool): Remove files that are in the manifest but not in `records`.
+
+        Returns:
+            tuple: (new, changed, unchanged, removed) counts.
+        """
+        known = {row[0]: row for row in self.conn.execute(f"SELECT {', '.join(_FILE_COLUMNS)} FROM files")}
+        new = changed = unchanged = 0
+        rows = []
+        for rec in records:
+            row = tuple(rec.get(c) for c in _FILE_COLUMNS)
+            old = known.pop(rec["path"], None)
+            if old is None:
+                new += 1
+            elif old[1:3] != (rec["size"], rec["mtime_ns"]):
+                changed += 1
+            else:
+                unchanged += 1
+            # seq_idx / selection can shift for unchanged files too, so the whole row is compared
+            if old != row:
+                rows.append(row)
+
+        placeholders = ", ".join("?" for _ in _FILE_COLUMNS)
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO files ({', '.join(_FILE_COLUMNS)}) VALUES ({placeholders})", rows)
+            removed = 0
+            if prune and known:
+                self.conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in known])
+                removed = len(known)
+        return new, changed, unchanged, removed
+
+    # --- set / part assignment ------------------------------------------
+
+    def assign_groups(self, targets, group_keys=None, seed=None):
+        """
+        Assigns every group without a target to one of `targets`.
+
+        Groups assigned on an earlier run keep their target, so adding data never
+        moves existing identities between sets. New groups are shuffled and dealt
+        to the targets with the fewest groups, which reproduces the original
+        round-robin split on a fresh manifest.
+
+        Args:
+            targets (list[str]): Target names, e.g. ["set1", ..., "set5"].
+            group_keys (list[str], optional): Groups to assign. Defaults to the
+                                              groups of all selected files.
+            seed (int, optional): Seed for shuffling the new groups.
+
+        Returns:
+            dict: {group_key: target} for all requested groups.
+        """
+        if group_keys is None:
+            group_keys = [g for (g,) in self.conn.execute(
+                "SELECT DISTINCT group_key FROM files WHERE selected = 1")]
+        assigned = dict(self.conn.execute("SELECT group_key, target FROM groups"))
+
+        load = {t: 0 for t in targets}
+        for t in assigned.values():
+            if t in load:
+                load[t] += 1
+
+        new_keys = sorted(g for g in group_keys if g not in assigned)
+        random.Random(seed).shuffle(new_keys)
+        new_rows = []
+        for g in new_keys:
+            target = min(targets, key=lambda t: load[t])
+            load[target] += 1
+            assigned[g] = target
+            new_rows.append((g, target))
+
+        with self.conn:
+            self.conn.executemany("INSERT INTO groups (group_key, target) VALUES (?, ?)", new_rows)
+        if new_rows:
+            print(f"📌 Assigned {len(new_rows)} new groups ({len(assigned) - len(new_rows)} kept)")
+        return {g: assigned[g] for g in group_keys}
+
+    # --- perceptual hashes ----------------------------------------------
+
+    def known_hashes(self):
+        """Returns {path: (size, mtime_ns, hash)} for every hashed file."""
+        return {p: (s, m, int(h, 16)) for p, s, m, h in
+                self.conn.execute("SELECT path, size, mtime_ns, hash FROM hashes")}
+
+    def store_hashes(self, rows):
+        """Records (path, size, mtime_ns, hash) rows; hashes are stored as hex (they exceed int64)."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO hashes (path, size, mtime_ns, hash) VALUES (?, ?, ?, ?)",
+                [(str(p), s, m, f"{h:x}") for p, s, m, h in rows])
+
+    # --- copies ---------------------------------------------------------
+
+    def pending_copies(self, pairs):
+        """
+        Filters (src, dst) pairs down to the ones that still need to be copied.
+
+        A pair is done when it was recorded by mark_copied(), the source still
+        has the same size and mtime, and the destination exists.
+        """
+        done = {(s, d): (size, mtime) for s, d, size, mtime in
+                self.conn.execute("SELECT src, dst, size, mtime_ns FROM copies")}
+        pending = []
+        for src, dst in pairs:
+            src, dst = str(src), str(dst)
+            rec = done.get((src, dst))
+            if rec is not None and os.path.exists(dst):
+                try:
+                    st = os.stat(src)
+                except OSError:
+                    continue
+                if rec == (st.st_size, st.st_mtime_ns):
+                    continue
+            pending.append((src, dst))
+        return pending
+
+    def mark_copied(self, pairs):
+        """Records finished (src, dst) copies with the source's current size and mtime."""
+        rows = []
+        for src, dst in pairs:
+            src, dst = str(src), str(dst)
+            st = os.stat(src)
+            rows.append((src, dst, st.st_size, st.st_mtime_ns))
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO copies (src, dst, size, mtime_ns) VALUES (?, ?, ?, ?)", rows)
+
+
+def copy_with_manifest(manifest, pairs, copy_fn, commit_every=COMMIT_EVERY,
+                       link_mode="copy", workers=COPY_WORKERS):
+    """
+    Materializes every pending (src, dst) pair and records progress in the
+    manifest every `commit_every` files, so a run that dies part-way only redoes
+    the last unrecorded batch.
+
+    Args:
+        link_mode (str): How files are materialized, see materialize.LINK_MODES.
+                         "auto" hardlinks / reflinks where the filesystem allows
+                         and falls back to `copy_fn`.
+        workers (int): Thread pool size for the real copies.
+
+    Returns:
+        tuple: (copied, skipped, failed) counts.
+    """
+    pairs = [(str(s), str(d)) for s, d in pairs]
+    pending = manifest.pending_copies(pairs)
+    skipped = len(pairs) - len(pending)
+    if skipped:
+        print(f"⏭️ Skipping {skipped} files already copied")
+
+    materializer = Materializer(link_mode, workers, copy_fn)
+    copied = failed = 0
+    methods = Counter()
+    for i in range(0, len(pending), commit_every):
+        done, errors, batch_methods = materializer.run(pending[i:i + commit_every])
+        for src, _, e in errors:
+            print(f"❌ Copy failed: {src} → {e}")
+        manifest.mark_copied(done)
+        copied += len(done)
+        failed += len(errors)
+        methods.update(batch_methods)
+    if methods:
+        print("🔗 " + ", ".join(f"{m}: {n}" for m, n in sorted(methods.items())))
+    return copied, skipped, failed
@@ -0,0 +1,174 @@
+import errno
+import os
+import shutil
+import sys
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# Builds the set{N}/{pid} and part_N layouts without duplicating image data.
+#
+# Each (src, dst) pair is materialized with the cheapest method the filesystem
+# allows:
+#   hardlink - same file, second directory entry (same volume only)
+#   reflink  - copy-on-write clone (Linux btrfs / XFS / overlayfs ..., FICLONE ioctl)
+#   symlink  - absolute symbolic link to the source
+#   copy     - real copy, run on a thread pool
+#
+# mode="auto" tries hardlink → reflink → copy and remembers, per (source device,
+# destination device), which method the filesystems do not support so it is not
+# retried for every file. Errors that depend on the file itself (permissions,
+# link count) only send that one file on to the next method. An explicit mode
+# never falls back to a copy: a pair it cannot link is reported as failed.
+# Symlinks are only used when asked for explicitly, because they break as soon
+# as the raw data is moved or deleted.
+
+LINK_MODES = ("auto", "hardlink", "reflink", "symlink", "copy")
+COPY_WORKERS = 8
+
+_FICLONE = 0x40049409  # _IOW(0x94, 9, int) from linux/fs.h
+
+# errnos meaning "this method is not possible between these devices"
+_UNSUPPORTED = {errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY, errno.EINVAL, errno.ENOSYS}
+# errnos meaning "not possible for this file" (protected_hardlinks, read-only
+# source, too many links): the next method is tried, nothing is remembered
+_FILE_UNSUPPORTED = {errno.EPERM, errno.EACCES, errno.EMLINK}
+
+
+def _reflink(src, dst):
+    if not sys.platform.startswith("linux"):
+        raise OSError(errno.EOPNOTSUPP, "reflink is only supported on Linux")
+    import fcntl
+
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.remove(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def _hardlink(src, dst):
+    os.link(src, dst)
+
+
+def _symlink(src, dst):
+    os.symlink(os.path.abspath(src), dst)
+
+
+_LINKERS = {"hardlink": _hardlink, "reflink": _reflink, "symlink": _symlink}
+
+
+def _prepare_dst(src, dst):
+    """Makes sure the parent exists and removes a stale dst. Returns True if dst already is src."""
+    if os.path.lexists(dst):
+        try:
+            if os.path.samefile(src, dst):
+                return True
+        except OSError:
+            pass
+        os.remove(dst)
+    else:
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+    return False
+
+
+class Materializer:
+    """
+    Materializes (src, dst) pairs with links where possible and copies otherwise.
+
+    Args:
+        mode (str): One of LINK_MODES. Only "auto" falls back to copies.
+        workers (int): Thread pool size for the real copies.
+        copy_fn (callable): Function used for real copies, e.g. shutil.copy2.
+    """
+    def __init__(self, mode="auto", workers=COPY_WORKERS, copy_fn=shutil.copy2):
+        if mode not in LINK_MODES:
+            raise ValueError(f"Unknown link mode: {mode} (expected one of {LINK_MODES})")
+        self.mode = mode
+        self.workers = workers
+        self.copy_fn = copy_fn
+        self._failed = set()  # (method, src_dev, dst_dev) known not to work (auto mode)
+
+    def _methods(self):
+        if self.mode == "auto":
+            return ("hardlink", "reflink")
+        if self.mode == "copy":
+            return ()
+        return (self.mode,)
+
+    def _try_link(self, src, dst):
+        """
+        Returns the link method used, or None if the pair needs a real copy.
+        Runs on the calling thread only. In an explicit link mode a failure is raised.
+        """
+        methods = self._methods()
+        if not methods:
+            return None
+        src_dev = os.stat(src).st_dev
+        dst_dev = os.stat(os.path.dirname(dst)).st_dev
+        for method in methods:
+            key = (method, src_dev, dst_dev)
+            if key in self._failed:
+                continue
+            try:
+                _LINKERS[method](src, dst)
+                return method
+            except OSError as e:
+                if self.mode != "auto" or e.errno not in _UNSUPPORTED | _FILE_UNSUPPORTED:
+                    raise
+                if e.errno in _UNSUPPORTED:
+                    self._failed.add(key)
+        return None
+
+    def _copy(self, src, dst):
+        self.copy_fn(src, dst)
+        return "copy"
+
+    def run(self, pairs):
+        """
+        Materializes every pair.
+
+        Returns:
+            tuple: (done, failed, methods) where done is the list of finished
+                   (src, dst) pairs, failed the list of (src, dst, error) and
+                   methods a Counter of how each file was materialized.
+        """
+        done, failed, to_copy = [], [], []
+        methods = Counter()
+
+        # links are single metadata syscalls, cheap enough to do inline
+        for src, dst in pairs:
+            src, dst = str(src), str(dst)
+            try:
+                if _prepare_dst(src, dst):
+                    methods["existing"] += 1
+                    done.append((src, dst))
+                    continue
+                method = self._try_link(src, dst)
+            except OSError as e:
+                failed.append((src, dst, e))
+                continue
+            if method is None:
+                to_copy.append((src, dst))
+            else:
+                methods[method] += 1
+                done.append((src, dst))
+
+        if to_copy:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = [(src, dst, pool.submit(self._copy, src, dst)) for src, dst in to_copy]
+                for src, dst, future in futures:
+                    try:
+                        methods[future.result()] += 1
+                        done.append((src, dst))
+                    except OSError as e:
+                        failed.append((src, dst, e))
+
+        return done, failed, methods
+
+
+def materialize(pairs, mode="auto", workers=COPY_WORKERS, copy_fn=shutil.copy2):
+    """Convenience wrapper around Materializer(mode, workers, copy_fn).run(pairs)."""
+    return Materializer(mode, workers, copy_fn).run(pairs)
@@ -1,6 +1,7 @@
 import os
 import shutil
-import xml.etree.ElementTree as ET
+
+from label_index import build_index, load_or_build_index, index_by_path, lookup_label
 
 # 3
 
@@ -22,8 +23,13 @@ LABEL_SUBFOLDER_NAME = "[라벨]Validation"
 # 각 'xxx_odd_files' 폴더 안의 원본 이미지 파일이 들어있는 폴더 이름
 IMAGE_SUBFOLDER_NAME = "[원천]Validation"
 
+# 모든 파트의 XML을 한 번에 파싱해 둔 라벨 인덱스 (label_index.py)
+INDEX_PATH = os.path.join(BASE_VALIDATION_PATH, "label_index.npy")
+REBUILD_INDEX = False # True면 인덱스를 다시 생성
+INDEX_WORKERS = None # 파싱 프로세스 수 (None → CPU 코어 수)
+
 # --- 함수 정의 ---
-def process_odd_files_folder(base_part_odd_path: str, label_sub: str, image_sub: str):
+def process_odd_files_folder(base_part_odd_path: str, label_sub: str, image_sub: str, index=None):
     """
     단일 '_odd_files' 폴더 내의 이미지 및 XML 파일을 메타데이터에 따라 분류하고 이동합니다.
 
@@ -31,6 +37,8 @@ def process_odd_files_folder(base_part_odd_path: str, label_sub: str, image_sub:
         base_part_odd_path (str): 현재 처리할 'part_X_odd_files' 폴더의 전체 경로입니다.
         label_sub (str): 라벨 파일이 들어있는 하위 폴더 이름입니다.
         image_sub (str): 이미지 파일이 들어있는 하위 폴더 이름입니다.
+        index (np.ndarray, optional): label_index로 만든 라벨 인덱스입니다.
+                                      인덱스에 없는 XML은 직접 파싱합니다.
     """
     print(f"\n{'='*50}")
     print(f"'{os.path.basename(base_part_odd_path)}' 폴더 처리 시작...")
@@ -48,6 +56,10 @@ def process_odd_files_folder(base_part_odd_path: str, label_sub: str, image_sub:
 
     print(f"'{label_source_dir}' 폴더에서 XML 파일 처리 시작...")
 
+    if index is None:
+        index = build_index(label_source_dir, workers=INDEX_WORKERS)
+    path_to_row = index_by_path(index)
+
     processed_xml_count = 0
     processed_image_count = 0
     not_found_image_count = 0
@@ -58,20 +70,20 @@ def process_odd_files_folder(base_part_odd_path: str, label_sub: str, image_sub:
             xml_file_path = os.path.join(label_source_dir, filename)
             
             try:
-                tree = ET.parse(xml_file_path)
-                root = tree.getroot()
+                label = lookup_label(index, path_to_row, xml_file_path)
+                if label is None:
+                    raise ValueError("XML 파싱 실패")
 
                 # OBJECT ID 추출
-                object_element = root.find('OBJECT')
-                human_id = object_element.get('ID') if object_element is not None else "UNKNOWN_ID"
+                human_id = label["object_id"] if label["has_object"] else "UNKNOWN_ID"
 
                 # 상의 정보 추출 (None 값 방지)
-                upperclothes = object_element.find('upperclothes').text if object_element is not None and object_element.find('upperclothes') is not None and object_element.find('upperclothes').text else "no_upperclothes"
-                upperclothes_color = object_element.find('upperclothes_color').text if object_element is not None and object_element.find('upperclothes_color') is not None and object_element.find('upperclothes_color').text else "no_upperclothes_color"
-                
+                upperclothes = label["upperclothes"] or "no_upperclothes"
+                upperclothes_color = label["upperclothes_color"] or "no_upperclothes_color"
+
                 # 하의 정보 추출 (None 값 방지)
-                lowerclothes = object_element.find('lowerclothes').text if object_element is not None and object_element.find('lowerclothes') is not None and object_element.find('lowerclothes').text else "no_lowerclothes"
-                lowerclothes_color = object_element.find('lowerclothes_color').text if object_element is not None and object_element.find('lowerclothes_color') is not None and object_element.find('lowerclothes_color').text else "no_lowerclothes_color"
+                lowerclothes = label["lowerclothes"] or "no_lowerclothes"
+                lowerclothes_color = label["lowerclothes_color"] or "no_lowerclothes_color"
 
                 # 새 폴더 이름 생성 (ID_상의종류_상의색상_하의종류_하의색상)
                 # 폴더명에 불필요한 공백이나 특수문자가 들어가지 않도록 처리
@@ -86,7 +98,7 @@ def process_odd_files_folder(base_part_odd_path: str, label_sub: str, image_sub:
                 processed_xml_count += 1
 
                 # 해당 이미지 파일 찾아서 이동 (XML 파일명에서 이미지 파일명을 가져옴)
-                image_filename_from_xml_tag = root.find('FILE/name').text if root.find('FILE/name') is not None else None
+                image_filename_from_xml_tag = label["file_name"] or None
                 
                 if image_filename_from_xml_tag:
                     # 이미지 파일은 image_source_dir에서 찾습니다.
@@ -100,7 +112,7 @@ def process_odd_files_folder(base_part_odd_path: str, label_sub: str, image_sub:
                 else:
                     print(f"경고: XML 파일 '{filename}'에서 이미지 파일명을 찾을 수 없습니다.")
 
-            except ET.ParseError as e:
+            except ValueError as e:
                 error_count += 1
                 print(f"오류: XML 파일 '{filename}' 파싱 중 오류 발생: {e}. 건너뜝니다.")
             except Exception as e:
@@ -138,6 +150,7 @@ if __name__ == "__main__":
     print(f"처리할 파트: {', '.join(PART_FOLDERS_TO_PROCESS)}")
     print("-" * 50)
 
+    odd_files_folder_paths = []
     for part_folder_name in PART_FOLDERS_TO_PROCESS:
         # 'part_X_odd_files' 폴더의 전체 경로 구성
         odd_files_folder_path = os.path.join(BASE_VALIDATION_PATH, part_folder_name, part_folder_name + ODD_FILES_SUBFOLDER_SUFFIX)
@@ -145,7 +158,15 @@ if __name__ == "__main__":
         if not os.path.isdir(odd_files_folder_path):
             print(f"\n경고: '{odd_files_folder_path}' 폴더를 찾을 수 없습니다. 이 파트는 건너뜠니다.")
             continue
-        
-        process_odd_files_folder(odd_files_folder_path, LABEL_SUBFOLDER_NAME, IMAGE_SUBFOLDER_NAME)
+        odd_files_folder_paths.append(odd_files_folder_path)
+
+    # 모든 파트의 XML을 프로세스 풀로 한 번에 파싱 (이미 인덱스가 있으면 읽기만 함)
+    label_index = load_or_build_index(
+        INDEX_PATH,
+        [os.path.join(p, LABEL_SUBFOLDER_NAME) for p in odd_files_folder_paths],
+        workers=INDEX_WORKERS, rebuild=REBUILD_INDEX)
+
+    for odd_files_folder_path in odd_files_folder_paths:
+        process_odd_files_folder(odd_files_folder_path, LABEL_SUBFOLDER_NAME, IMAGE_SUBFOLDER_NAME, label_index)
 
     print(f"\n--- 모든 지정된 파트 폴더 처리 완료 ---")
\ No newline at end of file
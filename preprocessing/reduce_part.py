@@ -1,6 +1,10 @@
 import os
 import shutil
 import random
+from collections import defaultdict
+
+from dedup import dedup_sequences, print_report, sequence_key
+from manifest import Manifest, copy_with_manifest
 
 # 2
 
@@ -11,6 +15,11 @@ PART_FOLDERS_TO_PROCESS = ["part_1", "part_2", "part_3", "part_4", "part_5"] # 
 LABEL_SUBFOLDER_NAME = "[라벨]Validation" # 각 part_X 안의 라벨 폴더 이름
 IMAGE_SUBFOLDER_NAME = "[원천]Validation"      # 각 part_X 안의 이미지 폴더 이름
 OUTPUT_FOLDER_SUFFIX = "_odd_files"  # 홀수 번째 파일을 저장할 새 폴더 이름에 붙을 접미사
+MANIFEST_NAME = "manifest.sqlite"  # 출력 폴더에 저장되는 복사 진행 기록 (manifest.py)
+LINK_MODE = "auto"  # "auto" | "hardlink" | "reflink" | "symlink" | "copy" - 가능하면 복사 대신 링크 생성 (materialize.py)
+COPY_WORKERS = 8  # 실제 복사가 필요한 파일을 처리할 스레드 수
+DEDUP_THRESHOLD = None  # None이면 기존처럼 홀수 번째 파일만 선택, 숫자(예: 6)면 연속 프레임 중복 제거 기준 (dHash 비트 차이, dedup.py)
+DEDUP_WORKERS = None  # 해시 계산 프로세스 수 (None → CPU 코어 수)
 
 # --- 함수 정의 ---
 def process_part_folder(base_part_path: str, label_subfolder: str, image_subfolder: str, output_suffix: str):
@@ -62,48 +71,50 @@ def process_part_folder(base_part_path: str, label_subfolder: str, image_subfold
 
     print(f"'{os.path.basename(image_path)}'에서 발견된 이미지 파일 수: {len(image_files)}")
 
-    # --- 2. 홀수 번째 데이터 선택 ---
-    # 리스트 인덱스는 0부터 시작하므로, 홀수 인덱스 = 짝수 번째 파일 (1번째, 3번째, 5번째...)
-    # [1::2] 슬라이싱은 인덱스 1부터 시작하여 2칸씩 건너뛰며 선택
-    selected_files = image_files[1::2] # 홀수 인덱스(0부터 시작)의 파일들만 선택
-
-    print(f"총 {len(image_files)}개 중 {len(selected_files)}개 (홀수 번째) 파일이 선택되었습니다.")
-
-    # --- 3. 파일 복사 ---
-    print("\n--- 선택된 파일 복사 중 ---")
-    copied_count = 0
-
-    for image_filename in selected_files:
-        # 이미지 파일 원본 경로
-        source_image_path = os.path.join(image_path, image_filename)
-        # 이미지 파일 복사될 경로
-        dest_image_path = os.path.join(output_image_path, image_filename)
-
-        # XML 파일 원본 경로 (이미지 파일명에서 확장자만 .xml로 변경)
-        xml_filename = os.path.splitext(image_filename)[0] + '.xml'
-        source_xml_path = os.path.join(label_path, xml_filename)
-        # XML 파일 복사될 경로
-        dest_xml_path = os.path.join(output_label_path, xml_filename)
-
-        try:
-            # 이미지 파일 복사
-            shutil.copy2(source_image_path, dest_image_path)
+    # 매니페스트 (해시 캐시 + 복사 진행 기록)는 한 번만 열어서 선택과 복사에 같이 사용
+    with Manifest(os.path.join(output_base_path, MANIFEST_NAME)) as manifest:
+        # --- 2. 데이터 선택 ---
+        if DEDUP_THRESHOLD is None:
+            # 리스트 인덱스는 0부터 시작하므로, 홀수 인덱스 = 짝수 번째 파일 (1번째, 3번째, 5번째...)
+            # [1::2] 슬라이싱은 인덱스 1부터 시작하여 2칸씩 건너뛰며 선택
+            selected_files = image_files[1::2] # 홀수 인덱스(0부터 시작)의 파일들만 선택
+            print(f"총 {len(image_files)}개 중 {len(selected_files)}개 (홀수 번째) 파일이 선택되었습니다.")
+        else:
+            # 파일 이름에서 프레임 번호를 뺀 부분이 같은 파일들을 하나의 시퀀스로 보고,
+            # 최근에 남긴 프레임과 거의 같은(perceptual hash 차이 ≤ DEDUP_THRESHOLD) 프레임을 제외
+            sequences = defaultdict(list)
+            for image_filename in image_files:
+                sequences[sequence_key(image_filename)].append(os.path.join(image_path, image_filename))
+            kept, stats = dedup_sequences(sequences, threshold=DEDUP_THRESHOLD, workers=DEDUP_WORKERS,
+                                          manifest=manifest)  # 해시 캐시
+            print_report(stats)
+            kept_paths = {p for paths in kept.values() for p in paths}
+            selected_files = [f for f in image_files if os.path.join(image_path, f) in kept_paths]
+            print(f"총 {len(image_files)}개 중 {len(selected_files)}개 (중복 제거 후) 파일이 선택되었습니다.")
+
+        # --- 3. 파일 복사 ---
+        # 완료된 복사는 매니페스트에 기록되므로, 다시 실행하면 바뀌지 않은 파일은 건너뜀
+        print("\n--- 선택된 파일 복사 중 ---")
+        pairs = []
+
+        for image_filename in selected_files:
+            # 이미지 파일 원본 경로 → 복사될 경로
+            pairs.append((os.path.join(image_path, image_filename), os.path.join(output_image_path, image_filename)))
+
+            # XML 파일 원본 경로 (이미지 파일명에서 확장자만 .xml로 변경)
+            xml_filename = os.path.splitext(image_filename)[0] + '.xml'
+            source_xml_path = os.path.join(label_path, xml_filename)
 
-            # XML 파일 복사
             if os.path.exists(source_xml_path):
-                shutil.copy2(source_xml_path, dest_xml_path)
+                pairs.append((source_xml_path, os.path.join(output_label_path, xml_filename)))
             else:
                 print(f"경고: 매칭되는 XML 파일 '{xml_filename}'을 찾을 수 없습니다. 이미지 '{image_filename}'에 대한 라벨은 복사되지 않습니다.")
-                
-            copied_count += 1
 
-        except FileNotFoundError:
-            print(f"오류: 파일 찾을 수 없음 - 이미지: {source_image_path} 또는 XML: {source_xml_path}. 이 쌍은 건너뜨니다.")
-        except Exception as e:
-            print(f"오류: 파일 복사 실패 - {image_filename} 관련 파일: {e}. 이 쌍은 건너뜝니다.")
+        copied_count, skipped_count, failed_count = copy_with_manifest(manifest, pairs, shutil.copy2,
+                                                                       link_mode=LINK_MODE, workers=COPY_WORKERS)
 
     print(f"\n--- '{os.path.basename(base_part_path)}' 작업 완료 ---")
-    print(f"총 {copied_count}쌍의 홀수 번째 파일이 '{output_base_path}' 폴더에 복사되었습니다.")
+    print(f"총 {copied_count}개의 파일이 '{output_base_path}' 폴더에 복사되었습니다. (이미 완료 {skipped_count}개, 실패 {failed_count}개)")
 
 
 # --- 메인 실행 로직 ---
@@ -1,9 +1,10 @@
 import os
-import xml.etree.ElementTree as ET
 import shutil
 import math
 from collections import defaultdict
-import random
+
+from label_index import load_or_build_index, row_fields
+from manifest import Manifest, copy_with_manifest
 
 # 1
 
@@ -16,119 +17,126 @@ OUTPUT_BASE_FOLDER = os.path.join(BASE_PATH, "Validation_Grouped_5_parts") # 결
 # --- 경로 설정 ---
 LABEL_PATH = os.path.join(BASE_PATH, LABEL_FOLDER_NAME)
 IMAGE_PATH = os.path.join(BASE_PATH, IMAGE_FOLDER_NAME)
+INDEX_PATH = os.path.join(OUTPUT_BASE_FOLDER, "label_index.npy") # XML 라벨 인덱스 (label_index.py)
+REBUILD_INDEX = False # True면 인덱스를 다시 생성
+INDEX_WORKERS = None # 파싱 프로세스 수 (None → CPU 코어 수)
+MANIFEST_PATH = os.path.join(OUTPUT_BASE_FOLDER, "manifest.sqlite") # 파트 할당 및 복사 진행 상황 (manifest.py)
+SEED = None # 새 그룹을 섞을 때 사용할 시드
+LINK_MODE = "auto" # "auto" | "hardlink" | "reflink" | "symlink" | "copy" - 가능하면 복사 대신 링크 생성 (materialize.py)
+COPY_WORKERS = 8 # 실제 복사가 필요한 파일을 처리할 스레드 수
+
+
+def _tag_text(value, missing):
+    """태그가 있으면 obj.find(tag).text (내용이 비어 있으면 None), 태그가 없으면 missing"""
+    if value is None:
+        return missing
+    return value or None
+
+
+def main():
+    # --- 출력 폴더 생성 (이미 존재하면 에러 방지) ---
+    os.makedirs(OUTPUT_BASE_FOLDER, exist_ok=True)
+    for i in range(1, 6): # part_1 부터 part_5 까지
+        os.makedirs(os.path.join(OUTPUT_BASE_FOLDER, f"part_{i}", LABEL_FOLDER_NAME), exist_ok=True)
+        os.makedirs(os.path.join(OUTPUT_BASE_FOLDER, f"part_{i}", IMAGE_FOLDER_NAME), exist_ok=True)
+
+    print(f"라벨 폴더 경로: {LABEL_PATH}")
+    print(f"이미지 폴더 경로: {IMAGE_PATH}")
+    print(f"결과 저장될 폴더: {OUTPUT_BASE_FOLDER}")
+    print("-" * 30)
+
+    # --- 1. XML 파일 파싱 및 정보 추출 ---
+    # all_data 리스트는 필요 없고, 바로 grouped_data로 수집
+    grouped_data = defaultdict(list) # key: group_key, value: list of (xml_file_path, image_filename)
+
+    # XML은 label_index가 프로세스 풀로 한 번만 파싱해서 저장해 둔 인덱스를 읽음
+    # LABEL_PATH 바로 아래의 XML만, root.find('.//OBJECT') / root.find('.//FILE/name')과 같은 방식으로 파싱
+    index = load_or_build_index(INDEX_PATH, LABEL_PATH, workers=INDEX_WORKERS, rebuild=REBUILD_INDEX,
+                                nested=True, recursive=False)
+
+    for row in index:
+        label = row_fields(row)
+        xml_file_path = label['xml_path']
+        xml_filename = os.path.basename(xml_file_path)
+        if not label['ok']:
+            print(f"오류: {xml_filename} 파싱 중 오류 발생")
+            continue
+
+        # 이미지 파일명
+        image_filename = label['file_name'] or None
+
+        # OBJECT 정보 (태그가 없으면 기본값, 내용이 비어 있으면 .text와 같이 None)
+        if label['has_object']:
+            obj_id = 'N/A' if label['object_id'] is None else label['object_id']
+            upperclothes = _tag_text(label['upperclothes'], 'N/A_UC')
+            upperclothes_color = _tag_text(label['upperclothes_color'], 'N/A_UCC')
+            lowerclothes = _tag_text(label['lowerclothes'], 'N/A_LC')
+            lowerclothes_color = _tag_text(label['lowerclothes_color'], 'N/A_LCC')
+
+            # 그룹 키 생성
+            group_key = f"{obj_id}_{upperclothes}_{upperclothes_color}_{lowerclothes}_{lowerclothes_color}"
+            # 해당 그룹 키의 리스트에 (xml_file_path, image_filename) 튜플 추가
+            grouped_data[group_key].append((xml_file_path, image_filename))
+        else:
+            print(f"경고: {xml_filename} 파일에 <OBJECT> 태그가 없습니다. 건너뜁니다.")
+
+    if not grouped_data:
+        print("처리할 XML 데이터가 없습니다. 경로 또는 파일 내용을 확인해주세요.")
+        return
+
+    manifest = Manifest(MANIFEST_PATH)
+
+    total_xml_files = sum(len(items) for items in grouped_data.values())
+    print(f"총 {total_xml_files}개의 XML 파일을 처리했습니다. ({len(grouped_data)}개의 고유 그룹)")
+
+    # --- 2. 각 그룹을 5개의 파트 중 한 곳에만 할당 ---
+    # 할당 결과는 매니페스트에 저장되어, 다시 실행해도 기존 그룹은 같은 파트에 남고
+    # 새로 추가된 그룹만 무작위로 섞어서 그룹 수가 가장 적은 파트부터 분배
+    part_names = [f"part_{i}" for i in range(1, 6)]
+    assignment = manifest.assign_groups(part_names, list(grouped_data.keys()), seed=SEED)
+
+    # 각 파트별 실제 파일 리스트 초기화
+    parts_data = [[] for _ in range(5)]
+
+    # 각 파트의 그룹 키에 해당하는 모든 파일들을 parts_data에 추가
+    for group_key, items in grouped_data.items():
+        parts_data[part_names.index(assignment[group_key])].extend(items)
 
-# --- 출력 폴더 생성 (이미 존재하면 에러 방지) ---
-os.makedirs(OUTPUT_BASE_FOLDER, exist_ok=True)
-for i in range(1, 6): # part_1 부터 part_5 까지
-    os.makedirs(os.path.join(OUTPUT_BASE_FOLDER, f"part_{i}", LABEL_FOLDER_NAME), exist_ok=True)
-    os.makedirs(os.path.join(OUTPUT_BASE_FOLDER, f"part_{i}", IMAGE_FOLDER_NAME), exist_ok=True)
-
-print(f"라벨 폴더 경로: {LABEL_PATH}")
-print(f"이미지 폴더 경로: {IMAGE_PATH}")
-print(f"결과 저장될 폴더: {OUTPUT_BASE_FOLDER}")
-print("-" * 30)
-
-# --- 1. XML 파일 파싱 및 정보 추출 ---
-# all_data 리스트는 필요 없고, 바로 grouped_data로 수집
-grouped_data = defaultdict(list) # key: group_key, value: list of (xml_file_path, image_filename)
-
-for xml_filename in os.listdir(LABEL_PATH):
-    if xml_filename.endswith('.xml'):
-        xml_file_path = os.path.join(LABEL_PATH, xml_filename)
-        
-        try:
-            tree = ET.parse(xml_file_path)
-            root = tree.getroot()
-
-            # 이미지 파일명 추출
-            image_name_element = root.find('.//FILE/name')
-            image_filename = image_name_element.text if image_name_element is not None else None
-
-            # OBJECT 정보 추출
-            obj_element = root.find('.//OBJECT')
-            if obj_element is not None:
-                obj_id = obj_element.get('ID', 'N/A')
-                upperclothes = obj_element.find('upperclothes').text if obj_element.find('upperclothes') is not None else 'N/A_UC'
-                upperclothes_color = obj_element.find('upperclothes_color').text if obj_element.find('upperclothes_color') is not None else 'N/A_UCC'
-                lowerclothes = obj_element.find('lowerclothes').text if obj_element.find('lowerclothes') is not None else 'N/A_LC'
-                lowerclothes_color = obj_element.find('lowerclothes_color').text if obj_element.find('lowerclothes_color') is not None else 'N/A_LCC'
-
-                # 그룹 키 생성
-                group_key = f"{obj_id}_{upperclothes}_{upperclothes_color}_{lowerclothes}_{lowerclothes_color}"
-                # 해당 그룹 키의 리스트에 (xml_file_path, image_filename) 튜플 추가
-                grouped_data[group_key].append((xml_file_path, image_filename))
+    # 선택된 데이터의 총 개수 확인 (디버깅용)
+    total_selected = sum(len(part) for part in parts_data)
+    print(f"총 {total_selected}개의 데이터가 5개 파트로 분배됩니다.")
+    print("각 파트에는 특정 그룹의 전체 데이터가 할당됩니다.")
+
+    # --- 3. 파일 복사 ---
+    # 이미 복사가 끝난 파일(매니페스트에 기록됨, 원본 변경 없음)은 건너뛰므로 중단된 작업을 이어서 진행 가능
+    for i, part_items in enumerate(parts_data):
+        part_number = i + 1
+        output_label_dir = os.path.join(OUTPUT_BASE_FOLDER, f"part_{part_number}", LABEL_FOLDER_NAME)
+        output_image_dir = os.path.join(OUTPUT_BASE_FOLDER, f"part_{part_number}", IMAGE_FOLDER_NAME)
+
+        print(f"\n--- part_{part_number} 에 {len(part_items)}개 파일 복사 중 ---")
+
+        pairs = []
+        for xml_file_path, image_filename in part_items:
+            # XML 파일
+            xml_basename = os.path.basename(xml_file_path)
+            pairs.append((xml_file_path, os.path.join(output_label_dir, xml_basename)))
+
+            # 이미지 파일 (image_filename이 None이 아닌 경우에만)
+            if image_filename:
+                pairs.append((os.path.join(IMAGE_PATH, image_filename), os.path.join(output_image_dir, image_filename)))
             else:
-                print(f"경고: {xml_filename} 파일에 <OBJECT> 태그가 없습니다. 건너뜁니다.")
-        except ET.ParseError as e:
-            print(f"오류: {xml_filename} 파싱 중 오류 발생 - {e}")
-        except Exception as e:
-            print(f"오류: {xml_filename} 처리 중 알 수 없는 오류 발생 - {e}")
-
-if not grouped_data:
-    print("처리할 XML 데이터가 없습니다. 경로 또는 파일 내용을 확인해주세요.")
-    exit()
-
-total_xml_files = sum(len(items) for items in grouped_data.values())
-print(f"총 {total_xml_files}개의 XML 파일을 처리했습니다. ({len(grouped_data)}개의 고유 그룹)")
-
-# --- 2. 각 그룹을 5개의 파트 중 한 곳에만 할당 ---
-# 모든 그룹 키를 리스트로 만들고 섞기
-all_group_keys = list(grouped_data.keys())
-random.shuffle(all_group_keys) # 그룹 자체를 무작위로 섞어서 분배
-
-# 각 파트에 할당될 그룹 키 리스트
-parts_group_keys = [[] for _ in range(5)]
-
-# 그룹 키들을 5개의 파트에 균등하게 분배
-for i, group_key in enumerate(all_group_keys):
-    parts_group_keys[i % 5].append(group_key) # 0,1,2,3,4,0,1,2,3,4... 순으로 할당
-
-# 각 파트별 실제 파일 리스트 초기화
-parts_data = [[] for _ in range(5)]
-
-# 각 파트의 그룹 키에 해당하는 모든 파일들을 parts_data에 추가
-for i, group_keys_in_part in enumerate(parts_group_keys):
-    for group_key in group_keys_in_part:
-        parts_data[i].extend(grouped_data[group_key])
-
-# 선택된 데이터의 총 개수 확인 (디버깅용)
-total_selected = sum(len(part) for part in parts_data)
-print(f"총 {total_selected}개의 데이터가 5개 파트로 분배됩니다.")
-print("각 파트에는 특정 그룹의 전체 데이터가 할당됩니다.")
-
-# --- 3. 파일 복사 (이전 코드와 동일) ---
-for i, part_items in enumerate(parts_data):
-    part_number = i + 1
-    output_label_dir = os.path.join(OUTPUT_BASE_FOLDER, f"part_{part_number}", LABEL_FOLDER_NAME)
-    output_image_dir = os.path.join(OUTPUT_BASE_FOLDER, f"part_{part_number}", IMAGE_FOLDER_NAME)
-    
-    print(f"\n--- part_{part_number} 에 {len(part_items)}개 파일 복사 중 ---")
-    
-    for xml_file_path, image_filename in part_items:
-        # XML 파일 복사
-        xml_basename = os.path.basename(xml_file_path)
-        dest_xml_path = os.path.join(output_label_dir, xml_basename)
-        try:
-            shutil.copy2(xml_file_path, dest_xml_path)
-            # print(f"  복사: {xml_basename} -> {output_label_dir}")
-        except FileNotFoundError:
-            print(f"경고: XML 파일 찾을 수 없음 - {xml_file_path}. 건너뜁니다.")
-        except Exception as e:
-            print(f"오류: XML 파일 복사 실패 - {xml_file_path}: {e}")
-
-        # 이미지 파일 복사 (image_filename이 None이 아닌 경우에만)
-        if image_filename:
-            source_image_path = os.path.join(IMAGE_PATH, image_filename)
-            dest_image_path = os.path.join(output_image_dir, image_filename)
-            try:
-                shutil.copy2(source_image_path, dest_image_path)
-                # print(f"  복사: {image_filename} -> {output_image_dir}")
-            except FileNotFoundError:
-                print(f"경고: 이미지 파일 찾을 수 없음 - {source_image_path}. 건너뜁니다.")
-            except Exception as e:
-                print(f"오류: 이미지 파일 복사 실패 - {source_image_path}: {e}")
-        else:
-            print(f"경고: {xml_basename} 파일에 해당하는 이미지 파일명이 없습니다. 이미지 복사를 건너뜁니다.")
+                print(f"경고: {xml_basename} 파일에 해당하는 이미지 파일명이 없습니다. 이미지 복사를 건너뜁니다.")
+
+        copied, skipped, failed = copy_with_manifest(manifest, pairs, shutil.copy2,
+                                                     link_mode=LINK_MODE, workers=COPY_WORKERS)
+        print(f"복사 {copied}개, 이미 완료 {skipped}개, 실패 {failed}개")
+
+    manifest.close()
+    print("\n--- 작업 완료 ---")
+    print(f"그룹별로 5등분된 데이터는 '{OUTPUT_BASE_FOLDER}' 폴더에 저장되었습니다.")
+
 
-print("\n--- 작업 완료 ---")
-print(f"그룹별로 5등분된 데이터는 '{OUTPUT_BASE_FOLDER}' 폴더에 저장되었습니다.")
\ No newline at end of file
+# 프로세스 풀(spawn)에서 다시 import 되어도 실행되지 않도록 main 가드 사용
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,5 @@
+"""
+Importable versions of the re-identification code from the notebooks
+(model_construct_ipy/, Final_trained_results/) plus the data, evaluation and
+inference tooling built around them.
+"""
@@ -0,0 +1,168 @@
+import os
+import glob
+import random
+from collections import defaultdict
+
+import torch
+from torch.utils.data import Dataset
+from torchvision import transforms
+from PIL import Image
+
+from . import instrument
+from .transforms import ResizePad
+
+
+class FolderGroupedBatchDataset:
+    def __init__(self, root_dir, transform=None):
+        self.root_dir = root_dir
+        self.transform = transform or transforms.Compose([
+            transforms.Resize((256, 128)),
+            transforms.ToTensor(),
+            transforms.Normalize([0.5]*3, [0.5]*3)
+        ])
+        self.pid_to_paths = defaultdict(list)
+        for pid in os.listdir(root_dir):
+            pid_folder = os.path.join(root_dir, pid)
+            if os.path.isdir(pid_folder):
+                for fname in os.listdir(pid_folder):
+                    if fname.endswith('.png'):
+                        self.pid_to_paths[pid].append(os.path.join(pid_folder, fname))
+        self.pids = list(self.pid_to_paths.keys())
+
+
+    def sample(self, P, K):
+        selected_pids = random.sample(self.pids, min(P, len(self.pids)))
+        images, labels = [], []
+        for pid in selected_pids:
+            paths = self.pid_to_paths[pid]
+            chosen = random.choices(paths, k=K) if len(paths) < K else random.sample(paths, K)
+            for path in chosen:
+                with instrument.stage("decode"):
+                    img = Image.open(path).convert("RGB")
+                with instrument.stage("augment"):
+                    img = self.transform(img)
+                images.append(img)
+                labels.append(pid)
+        return torch.stack(images), labels
+
+
+class FolderGroupedBatchTrainingDataset:
+    """
+    Groups images by folder (person ID) for training only. Does not inherit from PyTorch Dataset
+    because it's not accessed by index but by a custom sampling method.
+    """
+    def __init__(self, root_dir, transform=None):
+        self.transform = transform or transforms.Compose([
+            ResizePad((256, 128)),
+            transforms.ToTensor(),
+            transforms.Normalize([0.5]*3, [0.5]*3)
+        ])
+
+        self.pid_to_imgs = defaultdict(list)
+
+        for pid in os.listdir(root_dir):
+            folder = os.path.join(root_dir, pid)
+            if not os.path.isdir(folder): continue
+
+            for img_path in glob.glob(os.path.join(folder, '*.png')):
+                self.pid_to_imgs[pid].append(img_path)
+
+
+        self.pids = [pid for pid, imgs in self.pid_to_imgs.items() if len(imgs) >= 2]
+
+    def sample(self, P, K):
+        """
+        Sample a batch of P identities with K images each.
+        Returns: images (tensor list), labels (list of pids)
+        """
+        assert len(self.pids) >= P, "Not enough unique IDs to sample."
+
+        batch_pids = random.sample(self.pids, P)
+        images = []
+        labels = []
+        for pid in batch_pids:
+            img_paths = random.sample(self.pid_to_imgs[pid], min(K, len(self.pid_to_imgs[pid])))
+            for path in img_paths:
+                with instrument.stage("decode"):
+                    img = Image.open(path).convert('RGB')
+                with instrument.stage("augment"):
+                    img = self.transform(img)
+                images.append(img)
+                labels.append(pid)
+        return images, labels
+
+
+class FolderBasedReIDValidationDataset(Dataset):
+    def __init__(self, root_dir, transform=None):
+        self.transform = transform or transforms.Compose([
+            ResizePad((256, 128)),
+            transforms.ToTensor(),
+            transforms.Normalize([0.5]*3, [0.5]*3)
+        ])
+
+        self.samples = []  # list of (image_path, person_id)
+
+        for pid in os.listdir(root_dir):
+            folder = os.path.join(root_dir, pid)
+            if not os.path.isdir(folder):
+                continue
+
+            image_paths = glob.glob(os.path.join(folder, '*.png'))
+            for img_path in image_paths:
+                xml_path = img_path.replace('.png', '.xml')
+                if os.path.exists(xml_path):  # optional check
+                    self.samples.append((img_path, pid))  # folder name = pid
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, index):
+        img_path, pid = self.samples[index]
+        with instrument.stage("decode"):
+            img = Image.open(img_path).convert('RGB')
+        with instrument.stage("augment"):
+            tensor = self.transform(img)
+        return tensor, pid, img_path  # ⬅️ include image path
+
+
+class FolderPKDataset(Dataset):
+    """
+    Map-style version of FolderGroupedBatchTrainingDataset for use with a
+    DataLoader and PKBatchSampler: `ds[i]` → (tensor, label), where label is
+    an int index into `pid_names`.
+
+    Decoding and augmentation happen in __getitem__, so with num_workers > 0
+    they run in the loader workers and overlap with the training step.
+    """
+    def __init__(self, root_dir, transform=None):
+        self.transform = transform or transforms.Compose([
+            ResizePad((256, 128)),
+            transforms.ToTensor(),
+            transforms.Normalize([0.5]*3, [0.5]*3)
+        ])
+
+        self.samples = []  # list of (image_path, label)
+        self.pid_names = []
+        self.pid_to_indices = {}
+
+        for pid in sorted(os.listdir(root_dir)):
+            folder = os.path.join(root_dir, pid)
+            if not os.path.isdir(folder): continue
+
+            img_paths = sorted(glob.glob(os.path.join(folder, '*.png')))
+            if not img_paths: continue
+
+            label = len(self.pid_names)
+            self.pid_names.append(pid)
+            self.pid_to_indices[pid] = range(len(self.samples), len(self.samples) + len(img_paths))
+            self.samples.extend((p, label) for p in img_paths)
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getitem__(self, index):
+        img_path, label = self.samples[index]
+        with instrument.stage("decode"):
+            img = Image.open(img_path).convert('RGB')
+        with instrument.stage("augment"):
+            return self.transform(img), label
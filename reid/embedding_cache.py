@@ -0,0 +1,285 @@
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Subset
+
+from .evaluation import compute_embeddings
+
+# Content-addressed on-disk embedding cache.
+#
+# compute_embeddings re-decodes and re-embeds a whole validation folder on
+# every run. The cache keeps embeddings keyed by
+#   (image content hash, model weights hash, preprocessing config)
+# so only new or changed images go through the model:
+#
+#   cache = EmbeddingCache("emb_cache/")
+#   features, ids, paths = compute_embeddings(model, val_loader, device, cache=cache)
+#   cache.print_stats()
+#
+# One directory per model version (weights + preprocessing + dtype):
+#   <root>/<version>/vectors.npy   (capacity, dim) float16/float32, memory-mapped r+
+#   <root>/<version>/keys.npy      (capacity,) content digests of the rows
+#   <root>/cache.json              versions with row count and last use (LRU)
+#   <root>/files.json              path → size / mtime / digest, so unchanged files are not re-read
+# Whole versions are evicted least recently used first once the cache is over
+# max_bytes or holds more than max_versions. The version in use is never evicted.
+
+DIGEST_SIZE = 16  # blake2b bytes → 32 hex chars
+READ_CHUNK = 1 << 20
+HASH_WORKERS = 8  # threads reading files for their digest
+INITIAL_CAPACITY = 1024
+MAX_BYTES = 2 << 30
+MAX_VERSIONS = 8
+VECTORS_FILE = "vectors.npy"
+KEYS_FILE = "keys.npy"
+INDEX_FILE = "cache.json"
+FILES_FILE = "files.json"
+
+_ADDRESS = re.compile(r" at 0x[0-9a-fA-F]+")
+
+
+def file_digest(path):
+    h = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def model_fingerprint(model):
+    """Digest of a model's class and weights (state_dict order and dtype included)."""
+    if not hasattr(model, "state_dict"):
+        raise ValueError(f"{type(model).__name__} has no state_dict; pass model_key= explicitly")
+    h = hashlib.blake2b(type(model).__name__.encode(), digest_size=DIGEST_SIZE)
+    for name, tensor in model.state_dict().items():
+        h.update(name.encode())
+        h.update(str(tensor.dtype).encode())
+        h.update(tensor.detach().cpu().contiguous().view(-1).view(torch.uint8).numpy().tobytes())
+    return h.hexdigest()
+
+
+def preprocess_fingerprint(transform):
+    """Digest of a transform's repr (object addresses stripped, so it is stable across runs)."""
+    text = _ADDRESS.sub("", repr(transform))
+    return hashlib.blake2b(text.encode(), digest_size=DIGEST_SIZE).hexdigest()
+
+
+class _Version:
+    """Vectors / keys of one model version, memory-mapped, with a digest → row dict."""
+    def __init__(self, path, dtype, count):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.count = count
+        self.vectors = self.keys = None
+        if count:
+            self.vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r+")
+            self.keys = np.load(os.path.join(path, KEYS_FILE), mmap_mode="r+")
+        self.rows = {k.decode(): i for i, k in enumerate(self.keys[:count])} if count else {}
+
+    def _allocate(self, capacity, dim):
+        names = {}
+        for name, dtype, shape in ((VECTORS_FILE, self.dtype, (capacity, dim)),
+                                   (KEYS_FILE, f"S{2 * DIGEST_SIZE}", (capacity,))):
+            tmp = os.path.join(self.path, name + ".tmp.npy")
+            names[name] = (tmp, np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=shape))
+        vectors, keys = names[VECTORS_FILE][1], names[KEYS_FILE][1]
+        if self.count:
+            vectors[:self.count] = self.vectors[:self.count]
+            keys[:self.count] = self.keys[:self.count]
+        vectors.flush()
+        keys.flush()
+        self.vectors = self.keys = None
+        for name, (tmp, _) in names.items():
+            os.replace(tmp, os.path.join(self.path, name))
+        self.vectors, self.keys = vectors, keys
+
+    def add(self, digests, embeddings):
+        embeddings = np.asarray(embeddings)
+        need = self.count + len(digests)
+        if self.vectors is None or need > len(self.vectors):
+            capacity = max(INITIAL_CAPACITY, len(self.vectors) if self.vectors is not None else 0)
+            while capacity < need:
+                capacity *= 2
+            self._allocate(capacity, embeddings.shape[1])
+        self.vectors[self.count:need] = embeddings.astype(self.dtype)
+        self.keys[self.count:need] = [d.encode() for d in digests]
+        for i, d in enumerate(digests):
+            self.rows[d] = self.count + i
+        self.count = need
+
+    def flush(self):
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.keys.flush()
+
+
+def _version_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in (VECTORS_FILE, KEYS_FILE)
+               if os.path.exists(os.path.join(path, f)))
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache shared by every model version evaluated against it.
+
+    Args:
+        root (str): Cache directory (created if missing).
+        dtype (str): Storage dtype, "float16" (half the size; cosine error ~1e-3) or "float32".
+        max_bytes (int): Evict least recently used versions above this total size.
+        max_versions (int): Keep at most this many model versions.
+    """
+    def __init__(self, root, dtype="float16", max_bytes=MAX_BYTES, max_versions=MAX_VERSIONS):
+        if np.dtype(dtype) not in (np.float16, np.float32):
+            raise ValueError(f"Unsupported cache dtype: {dtype} (expected float16 or float32)")
+        self.root = root
+        self.dtype = np.dtype(dtype).name
+        self.max_bytes = max_bytes
+        self.max_versions = max_versions
+        os.makedirs(root, exist_ok=True)
+        self.versions = self._load_json(INDEX_FILE, {})
+        self.files = self._load_json(FILES_FILE, {})
+        self._open = {}
+        self.reset_stats()
+
+    def _load_json(self, name, default):
+        path = os.path.join(self.root, name)
+        if not os.path.exists(path):
+            return default
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_json(self, name, data):
+        tmp = os.path.join(self.root, name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, os.path.join(self.root, name))
+
+    def reset_stats(self):
+        self.stats = {"hits": 0, "misses": 0, "files_hashed": 0, "hash_s": 0.0, "embed_s": 0.0,
+                      "evicted": 0}
+
+    # keys
+
+    def digests(self, paths):
+        """Content digests of image files; files with unchanged size / mtime reuse the stored digest."""
+        start = time.perf_counter()
+        out = [None] * len(paths)
+        todo = []
+        for i, p in enumerate(paths):
+            st = os.stat(p)
+            known = self.files.get(p)
+            if known is not None and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+                out[i] = known[2]
+            else:
+                todo.append((i, p, st.st_size, st.st_mtime_ns))
+        if todo:
+            with ThreadPoolExecutor(max_workers=HASH_WORKERS) as pool:
+                for (i, p, size, mtime), digest in zip(todo, pool.map(file_digest, [t[1] for t in todo])):
+                    out[i] = digest
+                    self.files[p] = [size, mtime, digest]
+        self.stats["files_hashed"] += len(todo)
+        self.stats["hash_s"] += time.perf_counter() - start
+        return out
+
+    def version_key(self, model, transform, model_key=None):
+        model_key = model_key or model_fingerprint(model)
+        text = f"{model_key}:{preprocess_fingerprint(transform)}:{self.dtype}"
+        return hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+
+    def _version(self, key):
+        if key not in self._open:
+            path = os.path.join(self.root, key)
+            os.makedirs(path, exist_ok=True)
+            count = self.versions.get(key, {}).get("count", 0)
+            self._open[key] = _Version(path, self.dtype, count)
+        return self._open[key]
+
+    # lookup
+
+    def compute_embeddings(self, model, dataloader, device, model_key=None):
+        """
+        Cached reid.evaluation.compute_embeddings: only images whose content
+        is not yet in the cache for this model version are decoded and embedded.
+
+        Args:
+            model: Re-id model (or engine with model_key given).
+            dataloader: DataLoader over a dataset with `samples` [(path, pid)] and
+                        `transform` (FolderBasedReIDValidationDataset). Its batch size,
+                        workers and collate_fn are reused for the misses.
+            device: Model device.
+            model_key (str, optional): Identifies the weights when the model has no state_dict.
+
+        Returns:
+            tuple: (features float32 tensor (N, D), ids, paths) in dataset order.
+        """
+        dataset = dataloader.dataset
+        if not hasattr(dataset, "samples"):
+            raise ValueError(f"{type(dataset).__name__} has no samples list of (path, pid); can't cache it")
+        key = self.version_key(model, getattr(dataset, "transform", None), model_key)
+        version = self._version(key)
+        paths = [p for p, _ in dataset.samples]
+        ids = [pid for _, pid in dataset.samples]
+        digests = self.digests(paths)
+
+        missing, seen = [], set()
+        for i, d in enumerate(digests):
+            if d not in version.rows and d not in seen:  # identical files are embedded once
+                missing.append(i)
+                seen.add(d)
+        self.stats["misses"] += len(missing)
+        self.stats["hits"] += len(paths) - len(missing)
+
+        if missing:
+            start = time.perf_counter()
+            loader = DataLoader(Subset(dataset, missing), batch_size=dataloader.batch_size or 1,
+                                num_workers=dataloader.num_workers, collate_fn=dataloader.collate_fn)
+            features, _, _ = compute_embeddings(model, loader, device)
+            version.add([digests[i] for i in missing], features.float().numpy())
+            version.flush()
+            self.stats["embed_s"] += time.perf_counter() - start
+
+        self.versions[key] = {"count": version.count, "last_used": time.time(), "dtype": self.dtype,
+                              "model": model_key or type(model).__name__}
+        self.evict(keep=key)
+        self._save_json(INDEX_FILE, self.versions)
+        self._save_json(FILES_FILE, self.files)
+
+        rows = np.fromiter((version.rows[d] for d in digests), dtype=np.int64, count=len(digests))
+        features = torch.from_numpy(np.asarray(version.vectors[rows], dtype=np.float32))
+        return features, ids, paths
+
+    # eviction
+
+    def evict(self, keep=None):
+        """Drops least recently used versions until within max_bytes / max_versions."""
+        sizes = {k: _version_bytes(os.path.join(self.root, k)) for k in self.versions}
+        order = sorted(self.versions, key=lambda k: self.versions[k]["last_used"])
+        for k in order:
+            if sum(sizes.values()) <= self.max_bytes and len(sizes) <= self.max_versions:
+                break
+            if k == keep:
+                continue
+            version = self._open.pop(k, None)
+            if version is not None:
+                version.vectors = version.keys = None
+            shutil.rmtree(os.path.join(self.root, k), ignore_errors=True)
+            del self.versions[k], sizes[k]
+            self.stats["evicted"] += 1
+
+    @property
+    def nbytes(self):
+        return sum(_version_bytes(os.path.join(self.root, k)) for k in self.versions)
+
+    def print_stats(self):
+        s = self.stats
+        total = max(s["hits"] + s["misses"], 1)
+        print(f"🗃️ Embedding cache: {s['hits']} hits, {s['misses']} misses ({s['hits'] / total:.1%} hit rate), "
+              f"{s['files_hashed']} files hashed in {s['hash_s']:.1f}s, embedding {s['embed_s']:.1f}s, "
+              f"{len(self.versions)} versions / {self.nbytes / 1e6:.1f} MB, {s['evicted']} evicted")
@@ -0,0 +1,281 @@
+import os
+import random
+from abc import ABC, abstractmethod
+import tempfile
+import time
+
+import numpy as np
+import torch
+
+from .embedding_cache import model_fingerprint
+from .evaluation import evaluate
+from .model import prepare_for_inference
+from .transforms import INPUT_SIZE
+
+# Interchangeable CPU inference engines for the re-id model.
+#
+# Every engine is called like the model: (B, 3, H, W) float tensor in, (B, D)
+# float32 embeddings out, so it can go wherever a model goes (compute_embeddings,
+# StreamPipeline, ...). Pick one by name:
+#
+#   eager             prepare_for_inference (SDPA attention, BN folded, channels_last)
+#   torchscript       traced + frozen version of the above
+#   onnxruntime       ONNX export with a dynamic batch axis, ONNX Runtime CPU
+#   onnxruntime-int8  static INT8 (QDQ, per-channel weights) calibrated on real crops
+#   openvino          the same ONNX file compiled by OpenVINO (if installed)
+#   openvino-int8     the INT8 QDQ file compiled by OpenVINO
+#
+# Quantization only has a meaning if the accuracy is checked, so drift() gives
+# rank-1 / mAP of an engine next to those of the fp32 model on the same images.
+# optimization/openvino_opt.ipynb did the export by hand: opset 11, batch 1.
+#
+# Exported files are named after the weights (model_<fingerprint>.onnx, ...),
+# so a workdir can hold several checkpoints and never serves a stale export.
+
+ONNX_OPSET = 17
+CALIBRATION_IMAGES = 512
+FINGERPRINT_CHARS = 16  # of reid.embedding_cache.model_fingerprint in export file names
+
+
+class Engine(ABC):
+    """Base class: callable on an image batch, returns embeddings on the CPU."""
+    name = None
+    precision = "fp32"
+
+    @abstractmethod
+    def __call__(self, images):
+        """(B, 3, H, W) images → (B, D) float32 embeddings."""
+
+    # let engines stand in for nn.Modules (compute_embeddings / StreamPipeline call these);
+    # engines run on the CPU and take inputs from any device
+    def eval(self):
+        return self
+
+    def to(self, device):
+        return self
+
+
+class TorchEngine(Engine):
+    name = "eager"
+
+    def __init__(self, model, threads=None):
+        if threads:
+            torch.set_num_threads(threads)
+        self.model = model
+
+    @torch.no_grad()
+    def __call__(self, images):
+        return self.model(torch.as_tensor(images)).float()
+
+
+class TorchScriptEngine(TorchEngine):
+    name = "torchscript"
+
+    def __init__(self, model, threads=None, path=None):
+        """`path` is loaded if it exists, otherwise `model` is traced and saved there."""
+        if path and os.path.exists(path):
+            frozen = torch.jit.load(path, map_location="cpu")
+        else:
+            with torch.no_grad():
+                traced = torch.jit.trace(prepare_for_inference(model).cpu(), torch.zeros(2, 3, *INPUT_SIZE))
+                frozen = torch.jit.freeze(traced.eval())
+            if path:
+                frozen.save(path)  # saved before optimize_for_inference, whose prepacked ops don't reload
+        super().__init__(torch.jit.optimize_for_inference(frozen), threads)
+
+
+def export_onnx(model, path, opset=ONNX_OPSET, dynamic_batch=True):
+    """
+    Exports the inference variant of `model` (BN folded, NCHW) to ONNX.
+
+    Args:
+        model: ReIDAtten_v2 / YOLOv11ReID.
+        path (str): Output .onnx file.
+        opset (int): ONNX opset.
+        dynamic_batch (bool): Leave the batch axis symbolic.
+    """
+    prepared = prepare_for_inference(model, channels_last=False).cpu()  # a copy: `model` may stay on the GPU
+    dynamic_axes = {"input": {0: "batch"}, "output": {0: "batch"}} if dynamic_batch else None
+    with torch.no_grad():
+        torch.onnx.export(prepared, torch.zeros(1, 3, *INPUT_SIZE), path,
+                          input_names=["input"], output_names=["output"],
+                          opset_version=opset, dynamic_axes=dynamic_axes, dynamo=False)
+    return path
+
+
+class _CalibrationReader:
+    """onnxruntime CalibrationDataReader over a (N, 3, H, W) tensor."""
+    def __init__(self, images, batch_size):
+        self.batches = iter([images[i:i + batch_size].numpy() for i in range(0, len(images), batch_size)])
+
+    def get_next(self):
+        batch = next(self.batches, None)
+        return None if batch is None else {"input": batch}
+
+
+def quantize_onnx(src, dst, calibration, batch_size=32, per_channel=True):
+    """
+    Static INT8 post-training quantization of an fp32 ONNX model (QDQ format,
+    int8 per-channel weights, uint8 activations, min/max calibration).
+
+    Args:
+        src (str): fp32 .onnx (from export_onnx).
+        dst (str): Output .onnx.
+        calibration: (N, 3, H, W) normalized crops, see calibration_images.
+    """
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    with tempfile.TemporaryDirectory() as tmp:
+        prepped = os.path.join(tmp, "prepped.onnx")
+        quant_pre_process(src, prepped, skip_symbolic_shape=True)
+        quantize_static(prepped, dst, _CalibrationReader(torch.as_tensor(calibration), batch_size),
+                        quant_format=QuantFormat.QDQ, per_channel=per_channel,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                        calibrate_method=CalibrationMethod.MinMax)
+    return dst
+
+
+class OnnxRuntimeEngine(Engine):
+    name = "onnxruntime"
+
+    def __init__(self, path, threads=None, precision="fp32"):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.precision = precision
+
+    def __call__(self, images):
+        x = np.ascontiguousarray(torch.as_tensor(images).cpu().numpy(), dtype=np.float32)
+        return torch.from_numpy(self.session.run(None, {"input": x})[0])
+
+
+class OpenVINOEngine(Engine):
+    name = "openvino"
+
+    def __init__(self, path, threads=None, precision="fp32", device="CPU"):
+        try:
+            from openvino import Core
+        except ImportError:  # openvino < 2023.1
+            from openvino.runtime import Core
+
+        core = Core()
+        config = {"INFERENCE_NUM_THREADS": threads} if threads else {}
+        if precision == "fp32":
+            config["INFERENCE_PRECISION_HINT"] = "f32"  # no silent bf16 on AMX CPUs
+        self.compiled = core.compile_model(core.read_model(path), device, config)
+        self.output = self.compiled.output(0)
+        self.precision = precision
+
+    def __call__(self, images):
+        x = np.ascontiguousarray(torch.as_tensor(images).cpu().numpy(), dtype=np.float32)
+        return torch.from_numpy(np.array(self.compiled([x])[self.output]))
+
+
+ENGINES = ("eager", "torchscript", "onnxruntime", "onnxruntime-int8", "openvino", "openvino-int8")
+
+
+def available_engines():
+    """Engine names whose runtime is installed."""
+    import importlib.util
+
+    names = ["eager", "torchscript"]
+    if importlib.util.find_spec("onnxruntime") and importlib.util.find_spec("onnx"):
+        names += ["onnxruntime", "onnxruntime-int8"]
+        if importlib.util.find_spec("openvino"):
+            names += ["openvino", "openvino-int8"]
+    return names
+
+
+def create_engine(name, model, workdir=None, calibration=None, threads=None):
+    """
+    Builds an inference engine by name (see ENGINES).
+
+    Args:
+        name (str): Engine name.
+        model: fp32 re-id model (reid.model.load_model).
+        workdir (str, optional): Where exported files go (a temporary directory by default);
+                                 existing exports of the same weights are reused.
+        calibration: (N, 3, H, W) crops, required by the -int8 engines.
+        threads (int, optional): Intra-op threads.
+
+    Returns:
+        Engine
+    """
+    if name not in ENGINES:
+        raise ValueError(f"Unknown engine {name!r}, expected one of {ENGINES}")
+    if name == "eager":
+        return TorchEngine(prepare_for_inference(model).cpu(), threads)
+    workdir = workdir or tempfile.mkdtemp(prefix="reid_engines_")
+    os.makedirs(workdir, exist_ok=True)
+    base = os.path.join(workdir, f"model_{model_fingerprint(model)[:FINGERPRINT_CHARS]}")
+    if name == "torchscript":
+        return TorchScriptEngine(model, threads, path=base + "_ts.pt")
+
+    path = base + ".onnx"
+    if not os.path.exists(path):
+        export_onnx(model, path)
+    precision = "fp32"
+    if name.endswith("-int8"):
+        int8_path = base + "_int8.onnx"
+        if not os.path.exists(int8_path):
+            if calibration is None:
+                raise ValueError(f"{name} needs calibration images (no {int8_path} for these weights)")
+            quantize_onnx(path, int8_path, calibration)
+        path, precision = int8_path, "int8"
+    if name.startswith("onnxruntime"):
+        engine = OnnxRuntimeEngine(path, threads, precision)
+    else:
+        engine = OpenVINOEngine(path, threads, precision)
+    engine.name = name
+    return engine
+
+
+def calibration_images(datasets, n=CALIBRATION_IMAGES, seed=0):
+    """
+    A seeded random sample of n transformed crops drawn across datasets
+    (e.g. FolderBasedReIDValidationDataset of each validation year).
+    """
+    index = [(d, i) for d in datasets for i in range(len(d))]
+    picks = random.Random(seed).sample(index, min(n, len(index)))
+    return torch.stack([d[i][0] for d, i in picks])
+
+
+@torch.no_grad()
+def embed_images(engine, images, batch_size=64):
+    return torch.cat([engine(images[i:i + batch_size]) for i in range(0, len(images), batch_size)])
+
+
+def drift(features, reference, ids, cams=None):
+    """
+    Accuracy of an engine's embeddings next to the fp32 reference embeddings of
+    the same images (all-vs-all, see reid.evaluation.evaluate).
+
+    Returns:
+        dict: rank1, mAP, rank1_drift, mAP_drift (engine - reference), cos_mean,
+              cos_min (per-image cosine to the reference embedding).
+    """
+    res = evaluate(features, ids, query_cams=cams, gallery_cams=cams, ranks=(1,))
+    ref = evaluate(reference, ids, query_cams=cams, gallery_cams=cams, ranks=(1,))
+    cos = torch.nn.functional.cosine_similarity(torch.as_tensor(features).float(),
+                                                torch.as_tensor(reference).float(), dim=1)
+    return {"rank1": res["rank1"], "mAP": res["mAP"],
+            "rank1_drift": res["rank1"] - ref["rank1"], "mAP_drift": res["mAP"] - ref["mAP"],
+            "cos_mean": cos.mean().item(), "cos_min": cos.min().item()}
+
+
+def time_engine(engine, batch_size, repeats=20, warmup=3):
+    """Median seconds per call on a batch of batch_size zero images."""
+    x = torch.zeros(batch_size, 3, *INPUT_SIZE)
+    for _ in range(warmup):
+        engine(x)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        engine(x)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
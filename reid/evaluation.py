@@ -0,0 +1,260 @@
+import os
+import re
+
+import numpy as np
+import torch
+
+from . import instrument
+
+# Re-id evaluation in bounded memory.
+#
+# The notebook versions (RE_ID_valid.ipynb) build a full N×N float64
+# cosine_similarity matrix and per-query Python masks, which does not fit the
+# full 2022 validation set (~71k images). Here similarities are computed for a
+# block of queries at a time against the whole gallery (float32), so peak
+# memory is O(block_size × N_gallery) and all per-query work is batched.
+
+BLOCK_SIZE = 256
+GAP_BINS = np.linspace(-1.0, 1.0, 81)
+
+# Camera token in an image file name, e.g. "..._C3_..." or "...-cam02.png",
+# or a whole directory name such as "C3" / "cam02".
+CAMERA_PATTERN = re.compile(r"(?i)(?:^|[_\-])(c(?:am)?\d+)(?=[_\-.]|$)")
+
+
+def compute_embeddings(model, dataloader, device, cache=None):
+    """
+    Embeds every batch of the dataloader.
+
+    Args:
+        cache (EmbeddingCache, optional): Only embed images that are not cached
+                                          for this model (see reid.embedding_cache).
+
+    Returns:
+        tuple: (features (N, D), ids, paths)
+    """
+    if cache is not None:
+        return cache.compute_embeddings(model, dataloader, device)
+    model.eval()
+    features = []
+    ids = []
+    paths = []
+
+    with torch.no_grad():
+        for batch in instrument.timed_iter(dataloader, "eval_data"):
+            if len(batch) == 2:
+                imgs, pids = batch
+                batch_paths = [None] * len(imgs)  # dummy placeholder
+            else:
+                imgs, pids, batch_paths = batch
+
+            imgs = imgs.to(device)
+            with instrument.stage("eval_forward"):
+                emb = model(imgs)  # shape [B, D]
+            features.append(emb.cpu())
+            ids.extend(pids)
+            paths.extend(batch_paths)
+
+    features = torch.cat(features)
+    return features, ids, paths
+
+
+def camera_id_from_path(path, pattern=CAMERA_PATTERN):
+    """
+    Extracts the camera id from an image path: first the file name is matched
+    against `pattern`, then the directory names from the file upwards (the raw
+    layout is .../<human_id>/<cam_setting>/<camera_id>/<file>.png).
+    Returns None when nothing matches.
+    """
+    if path is None:
+        return None
+    parts = os.path.normpath(path).split(os.sep)
+    m = pattern.search(os.path.splitext(parts[-1])[0])
+    if m:
+        return m.group(1).upper()
+    for part in reversed(parts[:-1]):
+        m = pattern.fullmatch(part)
+        if m:
+            return m.group(1).upper()
+    return None
+
+
+def save_features(path, features):
+    """Stores features as float32 .npy so they can be memory-mapped by evaluate()."""
+    np.save(path, np.ascontiguousarray(_to_numpy(features), dtype=np.float32))
+
+
+def load_features(path, mmap=True):
+    return np.load(path, mmap_mode="r" if mmap else None)
+
+
+def _to_numpy(x):
+    if isinstance(x, torch.Tensor):
+        return x.detach().cpu().numpy()
+    return np.asarray(x)
+
+
+def _encode_labels(*label_lists):
+    """Maps arbitrary hashable labels (str pids, camera ids, None) to shared int codes."""
+    table = {}
+    out = []
+    for labels in label_lists:
+        out.append(np.array([table.setdefault(l, len(table)) for l in labels], dtype=np.int64))
+    return out
+
+
+def _normalize(x):
+    return x / x.norm(dim=1, keepdim=True).clamp(min=1e-12)
+
+
+@instrument.timed("evaluate")
+@torch.no_grad()
+def evaluate(query_features, query_ids, gallery_features=None, gallery_ids=None,
+             query_cams=None, gallery_cams=None, ranks=(1, 5, 10), block_size=BLOCK_SIZE,
+             normalize=True):
+    """
+    Rank-k (CMC), mAP and the best-positive vs hardest-negative similarity gap.
+
+    If no gallery is given, every image is a query against all the others
+    (self-match excluded), like evaluate_rank1 / compute_similarity_gaps.
+    With camera ids, gallery images with the same pid *and* the same camera as
+    the query are ignored (standard cross-camera protocol).
+
+    Args:
+        query_features: (Nq, D) tensor / array / memmap.
+        query_ids: Nq pids.
+        gallery_features, gallery_ids: (Ng, D) and Ng pids, optional.
+        query_cams, gallery_cams: camera ids (None entries disable the
+                                  exclusion for that image), optional.
+        ranks (tuple): k values reported as rank{k}.
+        block_size (int): Queries processed per block.
+        normalize (bool): L2-normalize features (cosine similarity).
+
+    Returns:
+        dict: rank{k}, mAP, gap_mean, gap_positive_rate, gap_hist (counts, bin
+              edges), gaps (per valid query), num_queries, num_valid_queries.
+    """
+    same_set = gallery_features is None
+    if same_set:
+        gallery_features, gallery_ids, gallery_cams = query_features, query_ids, query_cams
+
+    q_pid, g_pid = _encode_labels(query_ids, gallery_ids)
+    use_cams = query_cams is not None and gallery_cams is not None
+    if use_cams:
+        q_cam, g_cam = _encode_labels(query_cams, gallery_cams)
+        q_cam_known = np.array([c is not None for c in query_cams])
+        g_cam_known = np.array([c is not None for c in gallery_cams])
+
+    gallery = torch.from_numpy(np.ascontiguousarray(_to_numpy(gallery_features), dtype=np.float32))
+    if normalize:
+        gallery = _normalize(gallery)
+    g_pid_t = torch.from_numpy(g_pid)
+    if use_cams:
+        g_cam_t = torch.from_numpy(g_cam)
+        g_cam_known_t = torch.from_numpy(g_cam_known)
+
+    n_q, n_g = len(q_pid), len(g_pid)
+    max_rank = max(ranks)
+    cmc_hits = np.zeros(max_rank, dtype=np.int64)
+    ap_sum = 0.0
+    num_valid = 0
+    gaps = []
+
+    for start in range(0, n_q, block_size):
+        end = min(start + block_size, n_q)
+        q = torch.from_numpy(np.ascontiguousarray(_to_numpy(query_features[start:end]), dtype=np.float32))
+        if normalize:
+            q = _normalize(q)
+        sim = q @ gallery.T  # (b, Ng)
+
+        qp = torch.from_numpy(q_pid[start:end]).unsqueeze(1)
+        match = qp == g_pid_t.unsqueeze(0)
+        junk = torch.zeros_like(match)
+        if same_set:
+            rows = torch.arange(end - start)
+            junk[rows, rows + start] = True
+        if use_cams:
+            qc = torch.from_numpy(q_cam[start:end]).unsqueeze(1)
+            qk = torch.from_numpy(q_cam_known[start:end]).unsqueeze(1)
+            junk |= match & (qc == g_cam_t.unsqueeze(0)) & qk & g_cam_known_t.unsqueeze(0)
+
+        pos = match & ~junk
+        neg = ~match & ~junk
+        has_pos = pos.any(dim=1)
+        has_neg = neg.any(dim=1)
+
+        # similarity gap: best positive − hardest (most similar) negative
+        best_pos = sim.masked_fill(~pos, float("-inf")).amax(dim=1)
+        best_neg = sim.masked_fill(~neg, float("-inf")).amax(dim=1)
+        gap_rows = has_pos & has_neg
+        gaps.append((best_pos - best_neg)[gap_rows].numpy())
+
+        # ranking with junk pushed to the end (they are never counted)
+        order = sim.masked_fill(junk, float("-inf")).argsort(dim=1, descending=True)
+        hits = pos.gather(1, order)[has_pos]  # (v, Ng) bool, junk at the tail is False
+        if len(hits) == 0:
+            continue
+        num_valid += len(hits)
+
+        first_hit = hits.float().argmax(dim=1)
+        for k in range(max_rank):
+            cmc_hits[k] += int((first_hit <= k).sum())
+
+        hits_f = hits.float()
+        cum_hits = hits_f.cumsum(dim=1)
+        positions = torch.arange(1, n_g + 1, dtype=torch.float32).unsqueeze(0)
+        precision_at_hit = (cum_hits / positions) * hits_f
+        ap_sum += float((precision_at_hit.sum(dim=1) / hits_f.sum(dim=1)).sum())
+
+    gaps = np.concatenate(gaps) if gaps else np.zeros(0, dtype=np.float32)
+    results = {f"rank{k}": (cmc_hits[k - 1] / num_valid if num_valid else 0.0) for k in ranks}
+    results.update(
+        mAP=ap_sum / num_valid if num_valid else 0.0,
+        gap_mean=float(gaps.mean()) if len(gaps) else 0.0,
+        gap_positive_rate=float((gaps > 0).mean()) if len(gaps) else 0.0,
+        gap_hist=np.histogram(np.clip(gaps, GAP_BINS[0], GAP_BINS[-1]), bins=GAP_BINS),
+        gaps=gaps,
+        num_queries=n_q,
+        num_valid_queries=num_valid,
+    )
+    return results
+
+
+def print_results(results):
+    ranks = " | ".join(f"Rank-{k[4:]}: {v * 100:.2f}%" for k, v in results.items()
+                       if k.startswith("rank"))
+    print(f"{ranks} | mAP: {results['mAP'] * 100:.2f}% "
+          f"({results['num_valid_queries']}/{results['num_queries']} queries)")
+    print(f"Avg similarity gap (pos - hardest neg): {results['gap_mean']:.4f}")
+    print(f"% queries where positive > negative: {results['gap_positive_rate'] * 100:.2f}%")
+
+
+def plot_gap_histogram(results):
+    import matplotlib.pyplot as plt
+
+    counts, edges = results["gap_hist"]
+    plt.stairs(counts, edges, fill=True, color='blue', edgecolor='black')
+    plt.title("Distribution of (best positive - hardest negative) similarity gaps")
+    plt.xlabel("Similarity Gap")
+    plt.ylabel("Number of queries")
+    plt.grid(True)
+    plt.show()
+
+
+def evaluate_rank1(features, ids):
+    """Rank-1 over all images against each other, as in RE_ID_valid.ipynb."""
+    results = evaluate(features, ids, ranks=(1,))
+    # the notebook divides by all queries, including ones without any positive
+    acc = results["rank1"] * results["num_valid_queries"] / max(results["num_queries"], 1)
+    print(f"Rank-1 Accuracy: {acc*100:.2f}%")
+    return acc
+
+
+def compute_similarity_gaps(features, ids, show=False):
+    """Similarity-gap statistics over all images, as in RE_ID_valid.ipynb."""
+    results = evaluate(features, ids, ranks=(1,))
+    print(f"Avg similarity gap (pos - hardest neg): {results['gap_mean']:.4f}")
+    print(f"% queries where positive > negative: {results['gap_positive_rate']*100:.2f}%")
+    if show:
+        plot_gap_histogram(results)
+    return results["gaps"]
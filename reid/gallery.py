@@ -0,0 +1,740 @@
+import json
+import os
+import time
+
+import numpy as np
+
+# Persistent embedding gallery for re-identification.
+#
+# Holds normalized ReIDAtten_v2 embeddings (128-d) with pid / camera / timestamp
+# metadata and answers top-k cosine queries, either exactly (FlatIndex, one
+# matmul over every row) or approximately (IVFIndex, only the nprobe closest
+# k-means cells are scanned).
+#
+# On disk a gallery is a directory:
+#   vectors.npy   float32 (capacity, dim), memory-mapped r+
+#   meta.npy      structured (capacity,) pid / camera / timestamp / alive / clothing, memory-mapped r+
+#   strings.json  the pid / camera / clothing strings; meta.npy holds their index in this list
+#   ivf.npz       IVF centroids + cell of every row (only with index="ivf")
+#   gallery.json  dim, count, settings
+# Rows are append-only; delete() and expire() clear the alive flag and
+# compact() rewrites the files without the dead rows.
+#
+# Each entry also carries the four clothing labels from the XMLs (the same
+# values the preprocessing puts in the pid folder names). search_attributes()
+# uses them as partitions: it scans the entries whose clothing matches the
+# query first and only widens to partitions that differ in more attributes
+# while the results are weak.
+
+EMBED_DIM = 128
+INITIAL_CAPACITY = 1024
+VECTORS_FILE = "vectors.npy"
+META_FILE = "meta.npy"
+IVF_FILE = "ivf.npz"
+STRINGS_FILE = "strings.json"
+INFO_FILE = "gallery.json"
+
+ATTRIBUTE_FIELDS = ("upperclothes", "upperclothes_color", "lowerclothes", "lowerclothes_color")
+
+META_DTYPE = np.dtype([
+    ("pid", np.int32),     # index into Gallery.strings, so any length / encoding fits
+    ("camera", np.int32),
+    ("timestamp", np.float64),
+    ("alive", bool),
+] + [(field, np.int32) for field in ATTRIBUTE_FIELDS])
+
+# Placeholders the preprocessing scripts write for a missing clothing label.
+# They are stored as "" (unknown), which matches every query value.
+NULL_ATTRIBUTES = {"", "null", "none", "n/a", "unknown",
+                   "n/a_uc", "n/a_ucc", "n/a_lc", "n/a_lcc",
+                   "no_upperclothes", "no_upperclothes_color", "no_lowerclothes", "no_lowerclothes_color"}
+
+MIN_SCORE = 0.6  # search_attributes widens while the k-th score is below this
+
+NPROBE = 8
+KMEANS_ITERS = 10
+TRAIN_PER_LIST = 32      # k-means training sample = nlist * TRAIN_PER_LIST rows
+ASSIGN_BLOCK = 65536     # rows assigned to cells per matmul
+
+
+def _normalize(x):
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+
+def _text(value):
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="replace")
+    return "" if value is None else str(value)
+
+
+def _strings(values, n):
+    if values is None:
+        return [""] * n
+    if isinstance(values, (str, bytes)):
+        values = [values] * n
+    return [_text(v) for v in values]
+
+
+class _StringTable:
+    """Interned metadata strings; code 0 is ""."""
+    def __init__(self, strings=None):
+        self.strings = list(strings or [""])
+        self.codes = {s: i for i, s in enumerate(self.strings)}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __getitem__(self, code):
+        return self.strings[code]
+
+    def encode(self, values):
+        """int32 codes of `values`, adding the new strings."""
+        out = np.empty(len(values), dtype=np.int32)
+        for i, v in enumerate(values):
+            code = self.codes.get(v)
+            if code is None:
+                code = self.codes[v] = len(self.strings)
+                self.strings.append(v)
+            out[i] = code
+        return out
+
+    def lookup(self, value):
+        """Code of `value`, -1 if it was never stored."""
+        return self.codes.get(_text(value), -1)
+
+
+def _attribute(value):
+    value = value.decode("utf-8") if isinstance(value, bytes) else str(value or "")
+    value = value.strip()
+    return "" if value.lower() in NULL_ATTRIBUTES else value
+
+
+def parse_attributes(folder_name):
+    """
+    Clothing attributes from a pid folder name
+    ("{object_id}_{upperclothes}_{upperclothes_color}_{lowerclothes}_{lowerclothes_color}").
+
+    Returns:
+        dict: ATTRIBUTE_FIELDS → value, "" for missing or unparseable ones.
+    """
+    name = os.path.basename(os.path.normpath(str(folder_name)))
+    # multi-word placeholders from part_classify_files.py
+    for token in ("no_upperclothes_color", "no_lowerclothes_color", "no_upperclothes", "no_lowerclothes"):
+        name = name.replace(token, "NULL")
+    parts = name.split("_")
+    if len(parts) != len(ATTRIBUTE_FIELDS) + 1:
+        return dict.fromkeys(ATTRIBUTE_FIELDS, "")
+    return {field: _attribute(v) for field, v in zip(ATTRIBUTE_FIELDS, parts[1:])}
+
+
+def _attribute_columns(attributes, n):
+    """Normalizes `attributes` (None, one dict for all rows, or N dicts) to string columns."""
+    if attributes is None or isinstance(attributes, dict):
+        attributes = [attributes or {}] * n
+    return {field: [_attribute(a.get(field, "")) for a in attributes] for field in ATTRIBUTE_FIELDS}
+
+
+def _topk(scores, ids, k):
+    """Top-k of a 1-D score array, sorted by descending score."""
+    if len(scores) > k:
+        part = np.argpartition(-scores, k - 1)[:k]
+        scores, ids = scores[part], ids[part]
+    order = np.argsort(-scores, kind="stable")
+    return scores[order], ids[order]
+
+
+def _pad(scores, ids, k):
+    out_s = np.full(k, -np.inf, dtype=np.float32)
+    out_i = np.full(k, -1, dtype=np.int64)
+    out_s[:len(scores)] = scores
+    out_i[:len(ids)] = ids
+    return out_s, out_i
+
+
+class FlatIndex:
+    """Exact top-k: scores every live row of the gallery."""
+    def __init__(self, gallery):
+        self.gallery = gallery
+
+    def add(self, rows):
+        pass
+
+    def reset(self):
+        pass
+
+    def search(self, queries, k):
+        g = self.gallery
+        n = g.count
+        vectors = g.vectors[:n]
+        alive = g.meta["alive"][:n]
+        scores = queries @ vectors.T  # (q, n)
+        scores[:, ~alive] = -np.inf
+        out_s = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        out_i = np.full((len(queries), k), -1, dtype=np.int64)
+        ids = np.arange(n)
+        for i, row in enumerate(scores):
+            s, r = _topk(row, ids, k)
+            keep = np.isfinite(s)
+            out_s[i], out_i[i] = _pad(s[keep], r[keep], k)
+        return out_s, out_i
+
+
+class _Cell:
+    """One inverted list: row ids and a contiguous copy of their vectors."""
+    __slots__ = ("ids", "vectors", "size")
+
+    def __init__(self, dim, capacity=16):
+        self.ids = np.empty(capacity, dtype=np.int64)
+        self.vectors = np.empty((capacity, dim), dtype=np.float32)
+        self.size = 0
+
+    def extend(self, ids, vectors):
+        end = self.size + len(ids)
+        if end > len(self.ids):
+            capacity = max(end, 2 * len(self.ids))
+            new_ids = np.empty(capacity, dtype=np.int64)
+            new_vectors = np.empty((capacity, self.vectors.shape[1]), dtype=np.float32)
+            new_ids[:self.size] = self.ids[:self.size]
+            new_vectors[:self.size] = self.vectors[:self.size]
+            self.ids, self.vectors = new_ids, new_vectors
+        self.ids[self.size:end] = ids
+        self.vectors[self.size:end] = vectors
+        self.size = end
+
+
+class IVFIndex:
+    """
+    Inverted-file index: rows are bucketed by their nearest of `nlist` k-means
+    centroids and a query scans only the `nprobe` buckets whose centroids are
+    closest to it. Each bucket keeps its vectors contiguous in RAM so a probe
+    is a single small matmul.
+
+    The index is trained on the rows present at the first search (or on
+    train()); rows added later are assigned to the existing centroids. Retrain
+    (compact() or train()) if the data distribution drifts a lot.
+
+    Args:
+        gallery (Gallery): Owner of the vectors / alive flags.
+        nlist (int, optional): Number of cells. Defaults to ~4·sqrt(N) at training time.
+        nprobe (int): Cells scanned per query. Higher = better recall, slower.
+        min_train (int): Below this many rows search falls back to a flat scan.
+    """
+    def __init__(self, gallery, nlist=None, nprobe=NPROBE, min_train=4096):
+        self.gallery = gallery
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self.centroids = None
+        self.assign = np.empty(0, dtype=np.int32)  # cell of each row, -1 = not indexed
+        self.cells = []
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def reset(self):
+        self.centroids = None
+        self.assign = np.empty(0, dtype=np.int32)
+        self.cells = []
+
+    def train(self, seed=0):
+        """Runs spherical k-means on a sample of the live rows and (re)assigns every row."""
+        g = self.gallery
+        live = np.flatnonzero(g.meta["alive"][:g.count])
+        nlist = self.nlist or int(np.clip(4 * np.sqrt(len(live)), 1, 65536))
+        nlist = min(nlist, len(live))
+        if nlist == 0:
+            self.reset()
+            return
+
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(live), nlist * TRAIN_PER_LIST)
+        sample = g.vectors[np.sort(rng.choice(live, sample_size, replace=False))]
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(KMEANS_ITERS):
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            # re-seed empty cells with random sample points
+            sums[empty] = sample[rng.choice(sample_size, int(empty.sum()))]
+            centroids = _normalize(sums)
+
+        self.centroids = centroids.astype(np.float32)
+        self.assign = np.full(g.count, -1, dtype=np.int32)
+        self.cells = [_Cell(g.dim) for _ in range(nlist)]
+        self.add(live)
+
+    def add(self, rows):
+        if not self.trained or len(rows) == 0:
+            return
+        g = self.gallery
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(self.assign) < g.count:
+            grown = np.full(g.count, -1, dtype=np.int32)
+            grown[:len(self.assign)] = self.assign
+            self.assign = grown
+        for start in range(0, len(rows), ASSIGN_BLOCK):
+            block = rows[start:start + ASSIGN_BLOCK]
+            self.assign[block] = np.argmax(g.vectors[block] @ self.centroids.T, axis=1)
+        self._fill_cells(rows)
+
+    def _fill_cells(self, rows):
+        cells_of = self.assign[rows]
+        order = np.argsort(cells_of, kind="stable")
+        rows, cells_of = rows[order], cells_of[order]
+        bounds = np.flatnonzero(np.diff(cells_of)) + 1
+        for chunk in np.split(np.arange(len(rows)), bounds):
+            if len(chunk):
+                r = rows[chunk]
+                self.cells[cells_of[chunk[0]]].extend(r, self.gallery.vectors[r])
+
+    def load(self, centroids, assign):
+        """Restores a trained index from saved centroids / assignments (no k-means)."""
+        g = self.gallery
+        self.centroids = centroids.astype(np.float32)
+        self.assign = np.full(g.count, -1, dtype=np.int32)
+        self.assign[:len(assign)] = assign[:g.count]
+        self.cells = [_Cell(g.dim) for _ in range(len(centroids))]
+        live = np.flatnonzero((self.assign >= 0) & g.meta["alive"][:g.count])
+        self._fill_cells(live)
+        missing = np.flatnonzero((self.assign < 0) & g.meta["alive"][:g.count])
+        self.add(missing)
+
+    def search(self, queries, k):
+        g = self.gallery
+        if not self.trained:
+            if g.num_alive < self.min_train:
+                return FlatIndex(g).search(queries, k)
+            self.train()
+
+        alive = g.meta["alive"]
+        nprobe = min(self.nprobe, len(self.cells))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        out_s = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        out_i = np.full((len(queries), k), -1, dtype=np.int64)
+        for i, (q, cells) in enumerate(zip(queries, probes)):
+            scores, ids = [], []
+            for c in cells:
+                cell = self.cells[c]
+                if cell.size:
+                    scores.append(cell.vectors[:cell.size] @ q)
+                    ids.append(cell.ids[:cell.size])
+            if not scores:
+                continue
+            scores, ids = np.concatenate(scores), np.concatenate(ids)
+            live = alive[ids]
+            s, r = _topk(scores[live], ids[live], k)
+            out_s[i], out_i[i] = _pad(s, r, k)
+        return out_s, out_i
+
+
+class AttributeIndex:
+    """
+    Partitions the gallery by the tuple of clothing attributes and searches
+    partitions in order of how many attributes differ from the query.
+
+    Stage d scans every partition with at most d conflicting attributes (an
+    unknown value on either side never conflicts). The search stops after the
+    first stage that yields k live results with the k-th score >= min_score;
+    the last stage is the whole gallery, so a weak query degrades to an exact
+    full search rather than missing results.
+
+    Partitions are built from the stored metadata on first use and kept up to
+    date by Gallery.add().
+    """
+    def __init__(self, gallery):
+        self.gallery = gallery
+        self.built = False
+        self.keys = []        # partition key tuples (string code per field, 0 = unknown)
+        self.cells = []
+        self._key_to_cell = {}
+        self._key_array = None
+
+    def reset(self):
+        self.built = False
+        self.keys, self.cells, self._key_to_cell = [], [], {}
+        self._key_array = None
+
+    def build(self):
+        self.reset()
+        self.built = True
+        g = self.gallery
+        self.add(np.flatnonzero(g.meta["alive"][:g.count]))
+
+    def add(self, rows):
+        if not self.built or len(rows) == 0:
+            return
+        g = self.gallery
+        rows = np.asarray(rows, dtype=np.int64)
+        meta = g.meta[rows]
+        groups = {}
+        for i, key in enumerate(zip(*(meta[field] for field in ATTRIBUTE_FIELDS))):
+            groups.setdefault(key, []).append(i)
+        for key, idx in groups.items():
+            c = self._key_to_cell.get(key)
+            if c is None:
+                c = self._key_to_cell[key] = len(self.cells)
+                self.keys.append(key)
+                self.cells.append(_Cell(g.dim))
+                self._key_array = None
+            r = rows[idx]
+            self.cells[c].extend(r, g.vectors[r])
+
+    def distances(self, attributes):
+        """Number of conflicting attributes between `attributes` and every partition."""
+        strings = self.gallery.strings
+        # a value never stored gets -1: it conflicts with every known value
+        query = np.array([strings.lookup(_attribute(attributes.get(field, ""))) for field in ATTRIBUTE_FIELDS],
+                         dtype=np.int32)
+        if self._key_array is None:
+            self._key_array = np.array(self.keys, dtype=np.int32).reshape(-1, len(ATTRIBUTE_FIELDS))
+        keys = self._key_array
+        conflict = (query != 0) & (keys != 0) & (keys != query)
+        return conflict.sum(axis=1)
+
+    def search(self, query, attributes, k, min_score=MIN_SCORE, max_distance=None):
+        """
+        Returns:
+            tuple: (scores, rows, scanned) for one query; scanned is the number
+                   of candidate vectors scored.
+        """
+        if not self.built:
+            self.build()
+        alive = self.gallery.meta["alive"]
+        dist = self.distances(attributes or {})
+        max_distance = len(ATTRIBUTE_FIELDS) if max_distance is None else max_distance
+
+        scores, ids, scanned = [], [], 0
+        s, r = np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        for d in range(max_distance + 1):
+            stage = np.flatnonzero(dist == d)
+            if len(stage) == 0:
+                continue
+            for c in stage:
+                cell = self.cells[c]
+                if cell.size:
+                    scores.append(cell.vectors[:cell.size] @ query)
+                    ids.append(cell.ids[:cell.size])
+                    scanned += cell.size
+            if not scores:
+                continue
+            all_s, all_i = np.concatenate(scores), np.concatenate(ids)
+            live = alive[all_i]
+            s, r = _topk(all_s[live], all_i[live], k)
+            if len(s) >= k and s[-1] >= min_score:
+                break
+        s, r = _pad(s, r, k)
+        return s, r, scanned
+
+
+class Gallery:
+    """
+    Embedding store with exact or IVF top-k search.
+
+    Args:
+        path (str, optional): Gallery directory. Existing galleries are opened
+                              (memory-mapped), otherwise a new one is created.
+                              None keeps everything in RAM.
+        dim (int): Embedding size.
+        index (str): "ivf" (approximate) or "flat" (exact) default search.
+        nlist, nprobe: IVFIndex settings.
+        ttl (float, optional): Seconds an entry lives; expire() deletes older ones.
+    """
+    def __init__(self, path=None, dim=EMBED_DIM, index="ivf", nlist=None, nprobe=NPROBE, ttl=None):
+        if index not in ("ivf", "flat"):
+            raise ValueError(f"Unknown index type: {index} (expected 'ivf' or 'flat')")
+        self.path = path
+        self.dim = dim
+        self.index_type = index
+        self.ttl = ttl
+        self.count = 0
+        self.vectors = None
+        self.meta = None
+        self.strings = _StringTable()
+
+        info_path = os.path.join(path, INFO_FILE) if path else None
+        if info_path and os.path.exists(info_path):
+            with open(info_path, encoding="utf-8") as f:
+                info = json.load(f)
+            self.dim = info["dim"]
+            self.count = info["count"]
+            self.index_type = info.get("index", index)
+            self.ttl = info.get("ttl", ttl)
+            nlist = info.get("nlist", nlist)
+            nprobe = info.get("nprobe", nprobe)
+            self.vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode="r+")
+            self.meta = np.load(os.path.join(path, META_FILE), mmap_mode="r+")
+            strings_path = os.path.join(path, STRINGS_FILE)
+            if os.path.exists(strings_path):
+                with open(strings_path, encoding="utf-8") as f:
+                    self.strings = _StringTable(json.load(f))
+            if self.meta.dtype != META_DTYPE:
+                self._migrate_meta()
+        else:
+            if path:
+                os.makedirs(path, exist_ok=True)
+            self._allocate(INITIAL_CAPACITY)
+
+        self.flat = FlatIndex(self)
+        self.ivf = IVFIndex(self, nlist=nlist, nprobe=nprobe)
+        self.attributes = AttributeIndex(self)
+        ivf_path = os.path.join(path, IVF_FILE) if path else None
+        if ivf_path and os.path.exists(ivf_path):
+            saved = np.load(ivf_path)
+            self.ivf.load(saved["centroids"], saved["assign"])
+
+    # storage
+
+    def _allocate(self, capacity):
+        """(Re)allocates vector / metadata storage with room for `capacity` rows."""
+        old_vectors, old_meta = self.vectors, self.meta
+        if self.path:
+            names = {}
+            for name, dtype, shape in ((VECTORS_FILE, np.float32, (capacity, self.dim)),
+                                       (META_FILE, META_DTYPE, (capacity,))):
+                tmp = os.path.join(self.path, name + ".tmp.npy")
+                arr = np.lib.format.open_memmap(tmp, mode="w+", dtype=dtype, shape=shape)
+                names[name] = (tmp, arr)
+            vectors, meta = names[VECTORS_FILE][1], names[META_FILE][1]
+        else:
+            vectors = np.empty((capacity, self.dim), dtype=np.float32)
+            meta = np.zeros(capacity, dtype=META_DTYPE)
+
+        if old_vectors is not None:
+            vectors[:self.count] = old_vectors[:self.count]
+            meta[:self.count] = old_meta[:self.count]
+        meta["alive"][self.count:] = False
+
+        if self.path:
+            vectors.flush()
+            meta.flush()
+            del old_vectors, old_meta
+            for name, (tmp, _) in names.items():
+                os.replace(tmp, os.path.join(self.path, name))
+        self.vectors, self.meta = vectors, meta
+
+    def _migrate_meta(self):
+        """
+        Rewrites metadata saved with an older META_DTYPE (missing columns are
+        left empty). Fixed-width byte columns are moved into the string table.
+        """
+        old = self.meta
+        meta = np.zeros(len(old), dtype=META_DTYPE)
+        for name in old.dtype.names:
+            if name not in META_DTYPE.names:
+                continue
+            if old.dtype[name].kind == "S" and META_DTYPE[name].kind == "i":
+                meta[name][:self.count] = self.strings.encode([_text(v) for v in old[name][:self.count]])
+            else:
+                meta[name] = old[name]
+        self.meta = meta
+        self._allocate(len(self.vectors))
+        if self.path:
+            self._save_strings()
+
+    def _save_strings(self):
+        tmp = os.path.join(self.path, STRINGS_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.strings.strings, f, ensure_ascii=False)
+        os.replace(tmp, os.path.join(self.path, STRINGS_FILE))
+
+    @property
+    def capacity(self):
+        return len(self.vectors)
+
+    @property
+    def num_alive(self):
+        return int(self.meta["alive"][:self.count].sum())
+
+    def __len__(self):
+        return self.num_alive
+
+    # updates
+
+    def add(self, embeddings, pids, cameras=None, timestamps=None, attributes=None):
+        """
+        Appends embeddings (L2-normalized here) with their metadata.
+
+        Args:
+            embeddings: (N, dim) array / tensor.
+            pids: N pids (str).
+            cameras: N camera ids, a single id for all, or None.
+            timestamps: N UNIX timestamps, or None for now.
+            attributes: N dicts of ATTRIBUTE_FIELDS (e.g. parse_attributes() of
+                        the pid folder, or label_index rows), one dict for all,
+                        or None.
+
+        Returns:
+            np.ndarray: The row ids of the new entries.
+        """
+        if hasattr(embeddings, "detach"):
+            embeddings = embeddings.detach().cpu().numpy()
+        embeddings = _normalize(np.atleast_2d(embeddings))
+        n = len(embeddings)
+        if n == 0:
+            return np.empty(0, dtype=np.int64)
+        if timestamps is None:
+            timestamps = np.full(n, time.time())
+
+        end = self.count + n
+        if end > self.capacity:
+            capacity = self.capacity
+            while capacity < end:
+                capacity *= 2
+            self._allocate(capacity)
+
+        rows = np.arange(self.count, end)
+        self.vectors[self.count:end] = embeddings
+        new = self.meta[self.count:end]
+        new["pid"] = self.strings.encode(_strings(pids, n))
+        new["camera"] = self.strings.encode(_strings(cameras, n))
+        new["timestamp"] = timestamps
+        new["alive"] = True
+        for field, column in _attribute_columns(attributes, n).items():
+            new[field] = self.strings.encode(column)
+        self.count = end
+        self.ivf.add(rows)
+        self.attributes.add(rows)
+        return rows
+
+    def delete(self, rows):
+        """Marks rows as deleted. Returns how many were alive."""
+        rows = np.asarray(rows, dtype=np.int64)
+        rows = rows[(rows >= 0) & (rows < self.count)]
+        was_alive = int(self.meta["alive"][rows].sum())
+        self.meta["alive"][rows] = False
+        return was_alive
+
+    def delete_pid(self, pid):
+        code = self.strings.lookup(pid)
+        if code < 0:
+            return 0
+        return self.delete(np.flatnonzero(self.meta["pid"][:self.count] == code))
+
+    def expire(self, now=None, ttl=None):
+        """Deletes entries older than `ttl` seconds (default: self.ttl). Returns the count."""
+        ttl = ttl if ttl is not None else self.ttl
+        if ttl is None:
+            return 0
+        now = time.time() if now is None else now
+        old = self.meta["alive"][:self.count] & (self.meta["timestamp"][:self.count] < now - ttl)
+        return self.delete(np.flatnonzero(old))
+
+    def compact(self):
+        """Drops deleted rows from storage and retrains the IVF index. Row ids change."""
+        live = np.flatnonzero(self.meta["alive"][:self.count])
+        vectors = np.array(self.vectors[live])
+        meta = np.array(self.meta[live])
+        self.count = 0
+        self._allocate(max(INITIAL_CAPACITY, len(live)))
+        self.vectors[:len(live)] = vectors
+        self.meta[:len(live)] = meta
+        self.count = len(live)
+        self.ivf.reset()
+        self.attributes.reset()
+        if self.index_type == "ivf" and self.count >= self.ivf.min_train:
+            self.ivf.train()
+
+    def train(self, seed=0):
+        """Trains (or retrains) the IVF index on the current live rows."""
+        self.ivf.train(seed=seed)
+
+    # queries
+
+    def search(self, queries, k=10, exact=None):
+        """
+        Top-k cosine search.
+
+        Args:
+            queries: (dim,) or (Q, dim) embeddings.
+            k (int): Results per query.
+            exact (bool, optional): Force the flat (True) or IVF (False) index;
+                                    defaults to the gallery's index type.
+
+        Returns:
+            tuple: (scores, rows), each (Q, k); missing results are -inf / -1.
+        """
+        if hasattr(queries, "detach"):
+            queries = queries.detach().cpu().numpy()
+        queries = _normalize(np.atleast_2d(queries))
+        if exact is None:
+            exact = self.index_type == "flat"
+        index = self.flat if exact else self.ivf
+        return index.search(queries, k)
+
+    def search_attributes(self, queries, attributes, k=10, min_score=MIN_SCORE, max_distance=None,
+                          return_scanned=False):
+        """
+        Top-k search restricted to the clothing partitions closest to the query.
+
+        Args:
+            queries: (dim,) or (Q, dim) embeddings.
+            attributes: Attribute dict of the query (or Q dicts), e.g. from the
+                        detector's attribute head or parse_attributes().
+            k (int): Results per query.
+            min_score (float): A stage is good enough once its k-th score reaches this.
+            max_distance (int, optional): Never scan partitions with more
+                                          conflicting attributes than this.
+            return_scanned (bool): Also return the candidates scored per query.
+
+        Returns:
+            tuple: (scores, rows[, scanned]) like search().
+        """
+        if hasattr(queries, "detach"):
+            queries = queries.detach().cpu().numpy()
+        queries = _normalize(np.atleast_2d(queries))
+        if attributes is None or isinstance(attributes, dict):
+            attributes = [attributes] * len(queries)
+        out_s = np.empty((len(queries), k), dtype=np.float32)
+        out_i = np.empty((len(queries), k), dtype=np.int64)
+        scanned = np.zeros(len(queries), dtype=np.int64)
+        for i, (q, attrs) in enumerate(zip(queries, attributes)):
+            out_s[i], out_i[i], scanned[i] = self.attributes.search(
+                q, attrs, k, min_score=min_score, max_distance=max_distance)
+        if return_scanned:
+            return out_s, out_i, scanned
+        return out_s, out_i
+
+    def pids(self, rows):
+        """pid strings of `rows` (None for -1 padding)."""
+        return [self.strings[self.meta["pid"][r]] if r >= 0 else None for r in np.ravel(rows)]
+
+    def records(self, rows):
+        """Metadata dicts of `rows`."""
+        out = []
+        for r in np.ravel(rows):
+            if r < 0:
+                out.append(None)
+                continue
+            m = self.meta[r]
+            record = {"row": int(r), "pid": self.strings[m["pid"]], "camera": self.strings[m["camera"]],
+                      "timestamp": float(m["timestamp"]), "alive": bool(m["alive"])}
+            record.update((field, self.strings[m[field]]) for field in ATTRIBUTE_FIELDS)
+            out.append(record)
+        return out
+
+    # persistence
+
+    def save(self):
+        """Flushes the memory maps and writes strings.json / gallery.json / ivf.npz."""
+        if not self.path:
+            raise ValueError("In-memory gallery: pass a path to Gallery() to persist it")
+        self.vectors.flush()
+        self.meta.flush()
+        self._save_strings()
+        if self.ivf.trained:
+            tmp = os.path.join(self.path, IVF_FILE + ".tmp.npz")
+            np.savez(tmp, centroids=self.ivf.centroids, assign=self.ivf.assign[:self.count])
+            os.replace(tmp, os.path.join(self.path, IVF_FILE))
+        elif os.path.exists(os.path.join(self.path, IVF_FILE)):
+            os.remove(os.path.join(self.path, IVF_FILE))
+
+        info = {"dim": self.dim, "count": self.count, "index": self.index_type, "ttl": self.ttl,
+                "nlist": self.ivf.nlist, "nprobe": self.ivf.nprobe}
+        tmp = os.path.join(self.path, INFO_FILE + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(info, f)
+        os.replace(tmp, os.path.join(self.path, INFO_FILE))
@@ -0,0 +1,316 @@
+import bisect
+import functools
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Named stage timers for the hot paths (data decode / augmentation, forward,
+# loss, evaluation, stream stages, ...).
+#
+#   from reid import instrument
+#   instrument.enable()                       # or REID_INSTRUMENT=1
+#   with instrument.stage("forward"):
+#       emb = model(x)
+#   instrument.summary()                      # {stage: count, mean / p50 / p95 / p99 ms}
+#   instrument.interval_means()               # mean ms per stage since the last call, for the CSV log
+#   instrument.serve_prometheus(9108)         # GET /metrics, Prometheus text format
+#
+# Disabled (the default) a stage is one global check that returns a shared
+# no-op context manager, and @timed functions are called straight through.
+# Every stage keeps a cumulative histogram (fixed buckets, Prometheus-style)
+# and a rolling window of the last WINDOW durations for percentiles.
+#
+# In a training loop:
+#
+#   profiler = instrument.ProfilerWindow.from_env()   # REID_PROFILE=20:5 → trace steps 20-24
+#   for images, labels in instrument.timed_iter(loader, "data"):
+#       if profiler: profiler.step()
+#       with instrument.stage("forward"):
+#           emb = model(images)
+#       loss = combined_triplet_loss(emb, labels)      # "loss"
+#       with instrument.stage("backward"):
+#           loss.backward(); optimizer.step()
+#       ...
+#   log_row.update(instrument.interval_means())       # per-stage ms columns next to loss / similarity
+#
+# DataLoader workers are separate processes: stages timed inside them (decode,
+# augment) stay in the worker; "data" shows loader stalls from the main process.
+#
+# ProfilerWindow captures a torch.profiler trace of a window of steps; while a
+# window is recording, stages also show up as record_function ranges.
+
+WINDOW = 1024
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRIC = "reid_stage_seconds"
+
+_enabled = os.environ.get("REID_INSTRUMENT", "") not in ("", "0")
+_profiling = False
+_lock = threading.Lock()
+_stages = {}
+
+
+class RollingHistogram:
+    """Cumulative bucket counts / sum / count plus the last `window` values."""
+    def __init__(self, window=WINDOW, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.bucket_counts = [0] * (len(buckets) + 1)  # last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+        self._mark = (0, 0.0)  # (count, sum) at the last interval_means()
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.bucket_counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.sum += seconds
+            self.recent.append(seconds)
+
+    def percentiles(self, qs=(50, 95, 99)):
+        with self._lock:
+            values = np.array(self.recent)
+        if not len(values):
+            return [float("nan")] * len(qs)
+        return list(np.percentile(values, qs))
+
+    def interval_mean(self):
+        with self._lock:
+            count, total = self.count - self._mark[0], self.sum - self._mark[1]
+            self._mark = (self.count, self.sum)
+        return total / count if count else float("nan")
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = flag
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _stages.clear()
+
+
+def histogram(name):
+    h = _stages.get(name)
+    if h is None:
+        with _lock:
+            h = _stages.setdefault(name, RollingHistogram())
+    return h
+
+
+def record(name, seconds):
+    """Adds an externally measured duration to a stage."""
+    if _enabled:
+        histogram(name).add(seconds)
+
+
+class _Stage:
+    __slots__ = ("name", "start", "range")
+
+    def __init__(self, name):
+        self.name = name
+        self.range = None
+
+    def __enter__(self):
+        if _profiling:
+            import torch
+
+            self.range = torch.profiler.record_function(self.name)
+            self.range.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        histogram(self.name).add(time.perf_counter() - self.start)
+        if self.range is not None:
+            self.range.__exit__(*exc)
+        return False
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullStage()
+
+
+def stage(name):
+    """Context manager timing the enclosed block as `name` (no-op when disabled)."""
+    return _Stage(name) if _enabled else _NULL
+
+
+def timed(name):
+    """Decorator: times every call of the function as stage `name`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def timed_iter(iterable, name="data"):
+    """Yields from iterable, timing each wait for the next item as stage `name`."""
+    it = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(it)
+        except StopIteration:
+            return
+        record(name, time.perf_counter() - start)
+        yield item
+
+
+# export
+
+def summary():
+    """{stage: {"count", "total_s", "mean_ms", "p50_ms", "p95_ms", "p99_ms"}} (percentiles over the window)."""
+    out = {}
+    for name, h in sorted(_stages.items()):
+        p50, p95, p99 = h.percentiles()
+        out[name] = {"count": h.count, "total_s": h.sum, "mean_ms": h.sum / max(h.count, 1) * 1e3,
+                     "p50_ms": p50 * 1e3, "p95_ms": p95 * 1e3, "p99_ms": p99 * 1e3}
+    return out
+
+
+def interval_means(prefix="t_", suffix="_ms"):
+    """
+    Mean duration (ms) of every stage since the previous call, as flat
+    columns for the training CSV log, e.g. {"t_forward_ms": 41.2, ...}.
+    """
+    return {f"{prefix}{name}{suffix}": h.interval_mean() * 1e3 for name, h in sorted(_stages.items())}
+
+
+def print_summary():
+    rows = summary()
+    if not rows:
+        print("no stages recorded (instrument.enable() / REID_INSTRUMENT=1)")
+        return
+    print(f"{'stage':>20} {'count':>8} {'total s':>9} {'mean ms':>9} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for name, r in rows.items():
+        print(f"{name:>20} {r['count']:>8} {r['total_s']:>9.2f} {r['mean_ms']:>9.2f} "
+              f"{r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+
+def prometheus_text():
+    """All stages in the Prometheus text exposition format (histogram + rolling quantiles)."""
+    lines = [f"# HELP {METRIC} Duration of instrumented re-id stages.", f"# TYPE {METRIC} histogram"]
+    for name, h in sorted(_stages.items()):
+        with h._lock:
+            counts, total, count = list(h.bucket_counts), h.sum, h.count
+        cumulative = np.cumsum(counts)
+        for le, c in zip(h.buckets, cumulative[:-1]):
+            lines.append(f'{METRIC}_bucket{{stage="{name}",le="{le:g}"}} {c}')
+        lines.append(f'{METRIC}_bucket{{stage="{name}",le="+Inf"}} {cumulative[-1]}')
+        lines.append(f'{METRIC}_sum{{stage="{name}"}} {total:.6f}')
+        lines.append(f'{METRIC}_count{{stage="{name}"}} {count}')
+    lines += [f"# HELP {METRIC}_recent Rolling-window quantiles of the last {WINDOW} calls per stage.",
+              f"# TYPE {METRIC}_recent gauge"]
+    for name, h in sorted(_stages.items()):
+        for q, v in zip(("0.5", "0.95", "0.99"), h.percentiles()):
+            lines.append(f'{METRIC}_recent{{stage="{name}",quantile="{q}"}} {v:.6f}')
+    return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(port, host="0.0.0.0"):
+    """Serves prometheus_text() at http://host:port/metrics from a daemon thread; returns the server."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+# profiler
+
+class ProfilerWindow:
+    """
+    Records a torch.profiler trace for steps [start, start + steps) of a loop
+    and writes it to out_dir (TensorBoard / chrome trace). Call step() once per
+    iteration; outside the window it only counts.
+
+    Args:
+        start (int): First profiled step (earlier steps warm up caches / allocator).
+        steps (int): Number of profiled steps.
+        out_dir (str): Trace directory.
+        record_shapes, profile_memory, with_stack: passed to torch.profiler.profile.
+    """
+    def __init__(self, start=10, steps=5, out_dir="profiler_traces", record_shapes=True,
+                 profile_memory=False, with_stack=False):
+        self.start = start
+        self.steps = steps
+        self.out_dir = out_dir
+        self.kwargs = {"record_shapes": record_shapes, "profile_memory": profile_memory,
+                       "with_stack": with_stack}
+        self.step_num = 0
+        self.profiler = None
+
+    @classmethod
+    def from_env(cls, var="REID_PROFILE", out_dir="profiler_traces"):
+        """REID_PROFILE="<start>:<steps>" → ProfilerWindow, else None."""
+        spec = os.environ.get(var)
+        if not spec:
+            return None
+        start, _, steps = spec.partition(":")
+        return cls(int(start), int(steps or 5), out_dir)
+
+    def step(self):
+        global _profiling
+        if self.step_num == self.start and self.profiler is None:
+            import torch
+
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if torch.cuda.is_available():
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            os.makedirs(self.out_dir, exist_ok=True)
+            self.profiler = torch.profiler.profile(
+                activities=activities,
+                on_trace_ready=torch.profiler.tensorboard_trace_handler(self.out_dir),
+                **self.kwargs)
+            self.profiler.__enter__()
+            _profiling = True
+        elif self.profiler is not None and self.step_num == self.start + self.steps:
+            self.stop()
+        self.step_num += 1
+
+    def stop(self):
+        global _profiling
+        if self.profiler is not None:
+            _profiling = False
+            self.profiler.__exit__(None, None, None)
+            print(f"💾 profiler trace of steps {self.start}-{self.start + self.steps - 1} → {self.out_dir}")
+            self.profiler = None
+            self.start = -1  # done
@@ -0,0 +1,158 @@
+import torch
+import torch.nn.functional as F
+
+from . import instrument
+
+
+def pairwise_distances(embeddings):
+    # Compute cosine distance matrix
+    normed = F.normalize(embeddings, p=2, dim=1)
+    sim_matrix = torch.matmul(normed, normed.T)
+    dist_matrix = 1 - sim_matrix  # cosine distance
+    return dist_matrix
+
+
+def labels_to_tensor(labels, device=None):
+    """
+    List of str / int labels (or a tensor) → int64 tensor on `device`.
+    String labels are mapped to indices in sorted order.
+    """
+    if isinstance(labels, torch.Tensor):
+        return labels.to(device)
+    if len(labels) and isinstance(labels[0], str):
+        label_to_index = {label: idx for idx, label in enumerate(sorted(set(labels)))}
+        labels = [label_to_index[label] for label in labels]
+    return torch.as_tensor(labels, dtype=torch.long, device=device)
+
+
+def gather_embeddings(embeddings, labels):
+    """
+    All-gathers embeddings and int labels from every rank of the default
+    process group, so batch-hard mining sees the global P×K batch.
+
+    Only this rank's rows carry gradient (the others are gathered detached).
+    Every rank then computes the same global loss; scale it by the world size
+    before backward so DDP's gradient average equals the gradient of that loss.
+
+    Returns:
+        (embeddings [world_size × B, D], labels [world_size × B]), this rank's rows in place.
+    """
+    import torch.distributed as dist
+
+    if not dist.is_available() or not dist.is_initialized() or dist.get_world_size() == 1:
+        return embeddings, labels
+    labels = labels_to_tensor(labels, embeddings.device)
+    world, rank = dist.get_world_size(), dist.get_rank()
+    # batches can differ in size (pids with fewer than K images)
+    size = torch.tensor([embeddings.size(0)], device=embeddings.device)
+    sizes = [torch.zeros_like(size) for _ in range(world)]
+    dist.all_gather(sizes, size)
+    sizes = [int(s) for s in sizes]
+    pad = max(sizes) - embeddings.size(0)
+
+    local = embeddings.detach()
+    local_labels = labels
+    if pad:
+        local = F.pad(local, (0, 0, 0, pad))
+        local_labels = F.pad(labels, (0, pad), value=-1)
+    all_emb = [torch.empty_like(local) for _ in range(world)]
+    all_labels = [torch.empty_like(local_labels) for _ in range(world)]
+    dist.all_gather(all_emb, local)
+    dist.all_gather(all_labels, local_labels)
+
+    all_emb = [e[:n] for e, n in zip(all_emb, sizes)]
+    all_labels = [lab[:n] for lab, n in zip(all_labels, sizes)]
+    all_emb[rank] = embeddings
+    return torch.cat(all_emb), torch.cat(all_labels)
+
+
+@instrument.timed("loss")
+def combined_triplet_loss(embeddings, labels, margin=1.0, alpha=0.5, device=torch.device('cpu')):
+    """
+    Batch-hard + batch-mean triplet loss, computed for all anchors at once.
+
+    For every anchor: hard loss uses the farthest positive and the closest
+    negative, mean loss the mean positive and mean negative distance. Anchors
+    without a positive or without a negative in the batch are skipped.
+
+    Args:
+        embeddings: Tensor [N, D]
+        labels: List[str], List[int] or int Tensor of IDs. Int labels (e.g. from
+                PKBatchSampler / make_pk_loader) skip the string → index mapping.
+        margin: Triplet margin
+        alpha: Weight for hard vs mean loss. alpha=0.5 → 50% hard, 50% mean
+        device: Unused, kept for compatibility with the notebook signature.
+    """
+    labels = labels_to_tensor(labels, embeddings.device)
+    dist = pairwise_distances(embeddings)
+    N = dist.size(0)
+
+    same = labels.unsqueeze(0) == labels.unsqueeze(1)
+    is_pos = same & ~torch.eye(N, dtype=torch.bool, device=dist.device)
+    is_neg = ~same
+    n_pos = is_pos.sum(dim=1)
+    n_neg = is_neg.sum(dim=1)
+    valid = (n_pos > 0) & (n_neg > 0)
+
+    if not bool(valid.any()):
+        return torch.tensor(0.0, requires_grad=True, device=embeddings.device)
+
+    # Hardest positive and negative
+    hardest_pos = dist.masked_fill(~is_pos, float('-inf')).amax(dim=1)
+    hardest_neg = dist.masked_fill(~is_neg, float('inf')).amin(dim=1)
+    hard_loss = F.relu(hardest_pos - hardest_neg + margin)
+
+    # Mean-based variant
+    mean_pos = (dist * is_pos).sum(dim=1) / n_pos.clamp(min=1)
+    mean_neg = (dist * is_neg).sum(dim=1) / n_neg.clamp(min=1)
+    mean_loss = F.relu(mean_pos - mean_neg + margin)
+
+    # Combine
+    loss = alpha * hard_loss + (1 - alpha) * mean_loss
+    return loss[valid].mean()
+
+
+def combined_triplet_loss_loop(embeddings, labels, margin=1.0, alpha=0.5, device=torch.device('cpu')):
+    """
+    Reference per-anchor implementation from the training notebooks, kept for
+    equivalence checks and benchmarks against combined_triplet_loss.
+    """
+    labels = labels_to_tensor(labels, embeddings.device)
+
+    pairwise_dist = pairwise_distances(embeddings)
+    N = embeddings.size(0)
+
+    loss_hard = 0.0
+    loss_mean = 0.0
+    valid_triplets = 0
+
+    for i in range(N):
+        anchor_label = labels[i]
+        dists = pairwise_dist[i]
+
+        is_pos = (labels == anchor_label) & (torch.arange(N, device=embeddings.device) != i)
+        is_neg = labels != anchor_label
+
+        if torch.sum(is_pos) == 0 or torch.sum(is_neg) == 0:
+            continue  # skip if no valid pairs
+
+        # Hardest positive and negative
+        hardest_pos = dists[is_pos].max()
+        hardest_neg = dists[is_neg].min()
+        hard_loss = F.relu(hardest_pos - hardest_neg + margin)
+
+        # Mean-based variant
+        mean_pos = dists[is_pos].mean()
+        mean_neg = dists[is_neg].mean()
+        mean_loss = F.relu(mean_pos - mean_neg + margin)
+
+        # Combine
+        loss = alpha * hard_loss + (1 - alpha) * mean_loss
+        loss_hard += loss
+        valid_triplets += 1
+
+    if valid_triplets == 0:
+        return torch.tensor(0.0, requires_grad=True, device=embeddings.device)
+
+    return loss_hard / valid_triplets
+
@@ -0,0 +1,500 @@
+import copy
+import json
+import os
+import pickle
+import zipfile
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+# Re-id models without ultralytics.
+#
+# The notebooks build the backbone with `YOLO("yolo11n.pt").model.model[:n]`,
+# which imports all of ultralytics, may download yolo11n.pt and then runs a
+# dummy forward to find the feature size, only to overwrite every weight with
+# the trained state dict. The blocks below are the few ultralytics modules
+# those slices use (same attribute names, so the state dict keys match), the
+# yolo11n layer table is written out, and feature sizes come from the table.
+#
+# Checkpoint format: a plain dict
+#   {"format": CHECKPOINT_FORMAT, "version": 1, "config": {...}, "state_dict": {...}}
+# saved with torch.save and read back with weights_only=True (no pickled code),
+# or a .safetensors file with the config in its metadata.
+#
+# Legacy `torch.save(model)` files (saved_models/reid_model_full*.pth) are
+# pickles and can run code when loaded. They are only read by `convert` (or
+# read_checkpoint(..., allow_pickle=True)), through an unpickler that resolves
+# nothing but tensor rebuild helpers and replaces every other class with a stub.
+#
+#   python -m reid.model convert ReIDAttenv2_6000.pth reid_attenv2.pt
+#   python -m reid.model convert ../saved_models/reid_model_fullv2.pth reid_pool.safetensors
+#   python -m reid.model info reid_attenv2.pt
+#
+# prepare_for_inference() gives the serving variant of a loaded model: BN folded
+# into the convolutions, attention through F.scaled_dot_product_attention
+# (no materialised 512×512 score matrix per head, no dropout), channels_last
+# backbone and optionally bf16 autocast and torch.compile.
+
+CHECKPOINT_FORMAT = "reid-checkpoint"
+CHECKPOINT_VERSION = 1
+BN_EPS = 1e-3
+BN_MOMENTUM = 0.03
+
+# yolo11n backbone, width 0.25 / depth 0.5 already applied:
+# (block, c1, c2, kwargs)
+YOLO11N_LAYERS = [
+    ("Conv", 3, 16, {"k": 3, "s": 2}),
+    ("Conv", 16, 32, {"k": 3, "s": 2}),
+    ("C3k2", 32, 64, {"n": 1, "c3k": False, "e": 0.25}),
+    ("Conv", 64, 64, {"k": 3, "s": 2}),
+    ("C3k2", 64, 128, {"n": 1, "c3k": False, "e": 0.25}),
+    ("Conv", 128, 128, {"k": 3, "s": 2}),
+    ("C3k2", 128, 128, {"n": 1, "c3k": True}),
+    ("Conv", 128, 256, {"k": 3, "s": 2}),
+]
+
+DEFAULT_CONFIGS = {
+    # ReID_atten_v2.ipynb: yolo11n[:5] + attention head, 157,024 parameters
+    "atten_v2": {"arch": "atten_v2", "backbone_layers": 5, "emb_dim": 128, "heads": 4},
+    # RE_ID_valid.ipynb / re_identify_train.ipynb: yolo11n[:8] + average pool + fc
+    "pool": {"arch": "pool", "backbone_layers": 8, "emb_dim": 128},
+}
+
+
+class Conv(nn.Module):
+    """Conv2d (no bias, 'same' padding) + BatchNorm2d + SiLU, as ultralytics.nn.modules.Conv."""
+    def __init__(self, c1, c2, k=1, s=1):
+        super().__init__()
+        self.conv = nn.Conv2d(c1, c2, k, s, k // 2, bias=False)
+        self.bn = nn.BatchNorm2d(c2, eps=BN_EPS, momentum=BN_MOMENTUM)
+        self.act = nn.SiLU()
+
+    def forward(self, x):
+        return self.act(self.bn(self.conv(x)))
+
+
+class Bottleneck(nn.Module):
+    def __init__(self, c1, c2, shortcut=True, k=(3, 3), e=0.5):
+        super().__init__()
+        c_ = int(c2 * e)
+        self.cv1 = Conv(c1, c_, k[0], 1)
+        self.cv2 = Conv(c_, c2, k[1], 1)
+        self.add = shortcut and c1 == c2
+
+    def forward(self, x):
+        y = self.cv2(self.cv1(x))
+        return x + y if self.add else y
+
+
+class C3k(nn.Module):
+    """CSP block with two convolutions and n bottlenecks (ultralytics C3k)."""
+    def __init__(self, c1, c2, n=1, shortcut=True, e=0.5, k=3):
+        super().__init__()
+        c_ = int(c2 * e)
+        self.cv1 = Conv(c1, c_, 1, 1)
+        self.cv2 = Conv(c1, c_, 1, 1)
+        self.cv3 = Conv(2 * c_, c2, 1)
+        self.m = nn.Sequential(*(Bottleneck(c_, c_, shortcut, k=(k, k), e=1.0) for _ in range(n)))
+
+    def forward(self, x):
+        return self.cv3(torch.cat((self.m(self.cv1(x)), self.cv2(x)), 1))
+
+
+class C3k2(nn.Module):
+    """C2f-style split/concat block whose inner blocks are Bottleneck or C3k (ultralytics C3k2)."""
+    def __init__(self, c1, c2, n=1, c3k=False, e=0.5, shortcut=True):
+        super().__init__()
+        self.c = int(c2 * e)
+        self.cv1 = Conv(c1, 2 * self.c, 1, 1)
+        self.cv2 = Conv((2 + n) * self.c, c2, 1)
+        self.m = nn.ModuleList(
+            C3k(self.c, self.c, 2, shortcut) if c3k else Bottleneck(self.c, self.c, shortcut)
+            for _ in range(n)
+        )
+
+    def forward(self, x):
+        y = list(self.cv1(x).chunk(2, 1))
+        y.extend(m(y[-1]) for m in self.m)
+        return self.cv2(torch.cat(y, 1))
+
+
+_BLOCKS = {"Conv": Conv, "C3k2": C3k2}
+
+
+def build_backbone(num_layers):
+    """The first num_layers layers of yolo11n, returns (nn.Sequential, output channels)."""
+    if not 1 <= num_layers <= len(YOLO11N_LAYERS):
+        raise ValueError(f"backbone_layers must be in [1, {len(YOLO11N_LAYERS)}], got {num_layers}")
+    layers = [_BLOCKS[block](c1, c2, **kwargs) for block, c1, c2, kwargs in YOLO11N_LAYERS[:num_layers]]
+    return nn.Sequential(*layers), YOLO11N_LAYERS[num_layers - 1][2]
+
+
+class VisionAttentionLayer(nn.Module):
+    """
+    Multi-head self-attention over (B, N, dim) tokens, as in ReID_atten_v2.ipynb.
+
+    Args:
+        dim (int): The embedding dimension of the input tokens.
+        heads (int): The number of attention heads.
+        dim_head (int): The dimension of each attention head.
+        dropout (float, optional): Dropout rate. Defaults to 0.0.
+    """
+    def __init__(self, dim, heads=8, dim_head=64, dropout=0.0):
+        super().__init__()
+        inner_dim = dim_head * heads
+        project_out = not (heads == 1 and dim_head == dim)
+
+        self.heads = heads
+        self.scale = dim_head ** -0.5
+
+        self.to_qkv = nn.Linear(dim, inner_dim * 3, bias=False)
+        self.softmax = nn.Softmax(dim=-1)
+        self.dropout = nn.Dropout(dropout)
+
+        self.to_out = nn.Sequential(
+            nn.Linear(inner_dim, dim),
+            nn.Dropout(dropout)
+        ) if project_out else nn.Identity()
+        self.fused = False  # set by prepare_for_inference
+
+    def forward(self, x):
+        if self.fused:
+            return self._forward_fused(x)
+        qkv = self.to_qkv(x).chunk(3, dim=-1)
+        # (B, N, heads * dim_head) → (B, heads, N, dim_head)
+        q, k, v = map(
+            lambda t: t.reshape(t.shape[0], t.shape[1], self.heads, -1).permute(0, 2, 1, 3),
+            qkv
+        )
+        dots = torch.matmul(q, k.transpose(-1, -2)) * self.scale
+        attn_weights = self.dropout(self.softmax(dots))
+        out = torch.matmul(attn_weights, v)
+        out = out.permute(0, 2, 1, 3).reshape(x.shape[0], x.shape[1], -1)
+        return self.to_out(out)
+
+    def _forward_fused(self, x):
+        b, n, _ = x.shape
+        # one view for all of q, k, v: (B, N, 3 * heads * dim_head) → 3 × (B, heads, N, dim_head)
+        q, k, v = self.to_qkv(x).view(b, n, 3, self.heads, -1).permute(2, 0, 3, 1, 4).unbind(0)
+        out = F.scaled_dot_product_attention(q, k, v, scale=self.scale)
+        return self.to_out(out.transpose(1, 2).reshape(b, n, -1))
+
+
+class ReIDAtten_v2(nn.Module):
+    """
+    yolo11n backbone → tokens → self-attention → token mean → linear → L2 norm.
+    Same modules and state dict keys as the notebook class.
+
+    Args:
+        backbone_layers (int): yolo11n layers used as backbone.
+        emb_dim (int): Output embedding size.
+        heads (int): Attention heads; dim_head is feature channels // heads.
+    """
+    def __init__(self, backbone_layers=5, emb_dim=128, heads=4):
+        super().__init__()
+        self.backbone, self.backbone_output_dim = build_backbone(backbone_layers)
+        self.avg_pool = nn.AdaptiveAvgPool2d((1, 1))
+        self.max_pool = nn.AdaptiveMaxPool2d((1, 1))
+        self.attn = VisionAttentionLayer(
+            dim=self.backbone_output_dim,
+            heads=heads,
+            dim_head=self.backbone_output_dim // heads)
+        self.embed = nn.Linear(self.backbone_output_dim, emb_dim)
+
+    def forward(self, x):
+        x = self.backbone(x)                  # (B, C, H, W)
+        flat = x.permute(0, 2, 3, 1).flatten(1, 2)  # (B, H*W, C), a view for channels_last
+        att = self.attn(flat).mean(dim=1)           # (B, C)
+        return nn.functional.normalize(self.embed(att), dim=1)
+
+
+class YOLOv11ReID(nn.Module):
+    """
+    yolo11n backbone → global average pool → linear → L2 norm
+    (the pooling model of RE_ID_valid.ipynb, saved_models/reid_model_full*.pth).
+    """
+    def __init__(self, backbone_layers=8, emb_dim=128):
+        super().__init__()
+        self.backbone, feat_dim = build_backbone(backbone_layers)
+        self.pool = nn.AdaptiveAvgPool2d((1, 1))
+        self.fc = nn.Linear(feat_dim, emb_dim)
+
+    def forward(self, x):
+        pooled = self.pool(self.backbone(x)).flatten(1)
+        return nn.functional.normalize(self.fc(pooled), dim=1)
+
+
+class InferenceModel(nn.Module):
+    """
+    Wraps a prepared model: inputs go channels_last, the forward runs under
+    bf16 autocast if enabled, embeddings come back as float32.
+    """
+    def __init__(self, model, channels_last=True, bf16=False):
+        super().__init__()
+        self.model = model
+        self.channels_last = channels_last
+        self.bf16 = bf16
+
+    def forward(self, x):
+        if self.channels_last:
+            x = x.contiguous(memory_format=torch.channels_last)
+        with torch.autocast(x.device.type, dtype=torch.bfloat16, enabled=self.bf16):
+            out = self.model(x)
+        return F.normalize(out.float(), dim=1)  # re-normalize in fp32 after bf16
+
+
+def prepare_for_inference(model, channels_last=True, bf16=False, compile=False, fuse_bn=True):
+    """
+    Inference copy of a re-id model (the original is left untouched).
+
+    Args:
+        model: ReIDAtten_v2 or YOLOv11ReID.
+        channels_last (bool): Run the backbone in NHWC memory format.
+        bf16 (bool): bfloat16 autocast (CPUs with AVX512-BF16 / AMX, or GPU).
+        compile (bool): torch.compile the result.
+        fuse_bn (bool): Fold BatchNorm into the preceding convolutions.
+
+    Returns:
+        nn.Module: Takes the same (B, 3, H, W) input, returns (B, emb_dim) float32.
+    """
+    from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+    model = copy.deepcopy(model).eval()
+    for module in model.modules():
+        if fuse_bn and isinstance(module, Conv):
+            module.conv = fuse_conv_bn_eval(module.conv, module.bn)
+            module.bn = nn.Identity()
+        if isinstance(module, VisionAttentionLayer):
+            module.fused = True
+            module.dropout = nn.Identity()
+            if isinstance(module.to_out, nn.Sequential):
+                module.to_out = module.to_out[0]
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    model = InferenceModel(model, channels_last=channels_last, bf16=bf16)
+    for p in model.parameters():
+        p.requires_grad_(False)
+    return torch.compile(model, dynamic=True) if compile else model
+
+
+def build_model(config):
+    """Builds an untrained model from a checkpoint config dict."""
+    config = dict(config)
+    arch = config.pop("arch")
+    if arch == "atten_v2":
+        return ReIDAtten_v2(**config)
+    if arch == "pool":
+        return YOLOv11ReID(**config)
+    raise ValueError(f"Unknown re-id architecture: {arch}")
+
+
+def infer_config(state_dict):
+    """Architecture config of a notebook state dict, from its keys and shapes."""
+    layers = {int(k.split(".")[1]) for k in state_dict if k.startswith("backbone.")}
+    if not layers:
+        raise ValueError("State dict has no backbone.* weights")
+    if "attn.to_qkv.weight" in state_dict:
+        # to_out is only dropped for a single head of full width
+        heads = DEFAULT_CONFIGS["atten_v2"]["heads"] if "attn.to_out.0.weight" in state_dict else 1
+        return {"arch": "atten_v2", "backbone_layers": max(layers) + 1,
+                "emb_dim": state_dict["embed.weight"].shape[0], "heads": heads}
+    if "fc.weight" in state_dict:
+        return {"arch": "pool", "backbone_layers": max(layers) + 1,
+                "emb_dim": state_dict["fc.weight"].shape[0]}
+    raise ValueError("Unrecognized re-id state dict (expected attn.* or fc.* weights)")
+
+
+# checkpoint I/O
+
+def _is_safetensors(path):
+    return str(path).endswith(".safetensors")
+
+
+def save_checkpoint(model, path, config):
+    """
+    Writes a standalone checkpoint (architecture config + weights).
+
+    Args:
+        model: nn.Module or state dict.
+        path (str): Output file; a .safetensors suffix selects safetensors.
+        config (dict): Architecture config, as accepted by build_model.
+    """
+    state_dict = model.state_dict() if isinstance(model, nn.Module) else model
+    state_dict = {k: v.detach().cpu().contiguous() for k, v in state_dict.items()}
+    if _is_safetensors(path):
+        from safetensors.torch import save_file
+
+        metadata = {"format": CHECKPOINT_FORMAT, "version": str(CHECKPOINT_VERSION),
+                    "config": json.dumps(config)}
+        save_file(state_dict, path, metadata=metadata)
+    else:
+        torch.save({"format": CHECKPOINT_FORMAT, "version": CHECKPOINT_VERSION,
+                    "config": dict(config), "state_dict": state_dict}, path)
+
+
+class _StubModule:
+    """Stand-in for classes of a pickled full model; keeps only the attributes."""
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            self.__dict__.update(state)
+
+
+def _allowed_global(module, name):
+    """Globals a pickled model may resolve for real: tensor / storage rebuilding, dtypes, OrderedDict."""
+    if (module, name) in (("collections", "OrderedDict"), ("torch", "Size"), ("torch", "device")):
+        return True
+    if module in ("torch._utils", "torch._tensor") and name.startswith("_rebuild_"):
+        return True
+    if module in ("torch", "torch.storage") and name.endswith("Storage"):
+        return True
+    return module == "torch" and isinstance(getattr(torch, name, None), torch.dtype)
+
+
+class _StubUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if _allowed_global(module, name):
+            return super().find_class(module, name)
+        return type(name, (_StubModule,), {})  # calling a stub (e.g. a __reduce__ payload) only builds a stub
+
+
+def _stub_state_dict(module, prefix=""):
+    out = {}
+    attrs = module.__dict__
+    for group in ("_parameters", "_buffers"):
+        for name, value in attrs.get(group, {}).items():
+            if value is not None:
+                out[prefix + name] = value.detach()
+    for name, child in attrs.get("_modules", {}).items():
+        if child is not None:
+            out.update(_stub_state_dict(child, prefix + name + "."))
+    return out
+
+
+def _load_pickled_module(path):
+    """
+    State dict of a `torch.save(model)` file without importing the classes it
+    references (e.g. __main__.YOLOv11ReID, ultralytics blocks).
+    """
+    pickle_module = type("pickle_module", (), {"Unpickler": _StubUnpickler, "load": pickle.load})
+    module = torch.load(path, map_location="cpu", weights_only=False, pickle_module=pickle_module)
+    return _stub_state_dict(module)
+
+
+def _is_pickled_module(path):
+    if _is_safetensors(path) or not zipfile.is_zipfile(path):
+        return False
+    with zipfile.ZipFile(path) as zf:
+        pkl = next((n for n in zf.namelist() if n.endswith("/data.pkl")), None)
+        if pkl is None:
+            return False
+        head = zf.read(pkl)[:256]
+    # a full module pickle starts by referencing its class, a dict by building one
+    return b"torch.nn" in head or b"__main__" in head or b"ultralytics" in head
+
+
+def read_checkpoint(path, allow_pickle=False):
+    """
+    Returns (config, state_dict) from a standalone checkpoint, a notebook
+    state dict (ReIDAttenv2_*.pth) or, with allow_pickle=True, a pickled full
+    model (reid_model_full*.pth).
+
+    Args:
+        path (str): Checkpoint file.
+        allow_pickle (bool): Read legacy full-model pickles (stub unpickler, but
+                             still only for files from a trusted source).
+    """
+    if _is_safetensors(path):
+        from safetensors import safe_open
+
+        with safe_open(path, framework="pt") as f:
+            metadata = f.metadata() or {}
+            state_dict = {k: f.get_tensor(k) for k in f.keys()}
+        if "config" in metadata:
+            return json.loads(metadata["config"]), state_dict
+        return infer_config(state_dict), state_dict
+
+    if _is_pickled_module(path):
+        if not allow_pickle:
+            raise ValueError(f"{path} is a pickled full model; convert it first (trusted files only): "
+                             f"python -m reid.model convert {path} <out.pt>")
+        state_dict = _load_pickled_module(path)
+        return infer_config(state_dict), state_dict
+
+    ckpt = torch.load(path, map_location="cpu", weights_only=True)
+    if isinstance(ckpt, dict) and ckpt.get("format") == CHECKPOINT_FORMAT:
+        if ckpt["version"] > CHECKPOINT_VERSION:
+            raise ValueError(f"{path}: checkpoint version {ckpt['version']} is newer than "
+                             f"supported ({CHECKPOINT_VERSION})")
+        return ckpt["config"], ckpt["state_dict"]
+    return infer_config(ckpt), ckpt
+
+
+def load_model(path, device="cpu", allow_pickle=False):
+    """
+    Builds the re-id model of a checkpoint and loads its weights, in eval mode.
+    No ultralytics import and no forward pass.
+
+    Args:
+        path (str): Checkpoint (see read_checkpoint for the accepted kinds).
+        device: Target device.
+        allow_pickle (bool): See read_checkpoint.
+
+    Returns:
+        nn.Module: The model; its config is attached as `model.config`.
+    """
+    config, state_dict = read_checkpoint(path, allow_pickle=allow_pickle)
+    with torch.device("meta"):
+        model = build_model(config)
+    model.load_state_dict(state_dict, strict=True, assign=True)
+    model.config = config
+    return model.to(device).eval()
+
+
+def _is_torchscript(path):
+    if _is_safetensors(path) or not zipfile.is_zipfile(path):
+        return False
+    with zipfile.ZipFile(path) as zf:
+        return any(n.endswith("/constants.pkl") for n in zf.namelist())
+
+
+def load_reid_model(path, device="cpu"):
+    """load_model, or torch.jit.load for a TorchScript export; eval mode either way."""
+    if _is_torchscript(path):
+        return torch.jit.load(path, map_location=device).eval()
+    return load_model(path, device)
+
+
+def convert(src, dst):
+    """Rewrites any checkpoint read_checkpoint accepts as a standalone checkpoint."""
+    config, state_dict = read_checkpoint(src, allow_pickle=True)
+    build_model(config).load_state_dict(state_dict, strict=True)  # validate before writing
+    save_checkpoint(state_dict, dst, config)
+    return config
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Standalone re-id checkpoints")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("convert", help="notebook state dict / pickled model → standalone checkpoint")
+    p.add_argument("src")
+    p.add_argument("dst", help=".pt, or .safetensors (needs the safetensors package)")
+    p = sub.add_parser("info", help="print the config and parameter count of a checkpoint")
+    p.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        config = convert(args.src, args.dst)
+        print(f"💾 {args.dst}: {config} ({os.path.getsize(args.dst) / 1e6:.2f} MB)")
+    else:
+        model = load_model(args.path)
+        print(f"📦 {args.path}: {model.config}, {sum(p.numel() for p in model.parameters()):,} parameters")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import random
+
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Sampler
+
+
+class PKBatchSampler(Sampler):
+    """
+    Yields batches of dataset indices made of P identities × K images each,
+    the same selection FolderGroupedBatchTrainingDataset.sample(P, K) makes,
+    but as a torch BatchSampler so a DataLoader can decode and augment the
+    batch in worker processes while the model trains on the previous one.
+
+    Args:
+        pid_to_indices (dict): {pid: dataset indices of that pid}
+                               (FolderPKDataset / PackedShardDataset.pid_to_indices).
+        P (int): Identities per batch.
+        K (int): Images per identity (fewer if the pid has fewer than K images).
+        num_batches (int): Batches per epoch (= training steps per epoch).
+        seed (int): Base seed. Epoch e draws from random.Random(f"{seed}-{e}"), so a
+                    run is reproducible regardless of the number of workers and
+                    adjacent seeds don't replay each other's epochs.
+        min_images (int): Pids with fewer images are never sampled.
+    """
+    def __init__(self, pid_to_indices, P, K, num_batches, seed=0, min_images=2):
+        self.pid_to_indices = {pid: list(idx) for pid, idx in pid_to_indices.items()
+                               if len(idx) >= min_images}
+        self.pids = sorted(self.pid_to_indices)
+        assert len(self.pids) >= P, "Not enough unique IDs to sample."
+        self.P = P
+        self.K = K
+        self.num_batches = num_batches
+        self.seed = seed
+        self.epoch = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return self.num_batches
+
+    def _epoch_rng(self):
+        # string seed, not seed + epoch: (s, e + 1) and (s + 1, e) must give different streams
+        return random.Random(f"{self.seed}-{self.epoch}")
+
+    def __iter__(self):
+        rng = self._epoch_rng()
+        for _ in range(self.num_batches):
+            batch = []
+            for pid in rng.sample(self.pids, self.P):
+                indices = self.pid_to_indices[pid]
+                batch.extend(rng.sample(indices, min(self.K, len(indices))))
+            yield batch
+
+
+class DistributedPKBatchSampler(PKBatchSampler):
+    """
+    PKBatchSampler for data-parallel training: every step, all ranks draw the
+    same P × world_size identities from the shared seed and rank r takes the
+    r-th block of P, so the ranks' batches never share an identity.
+
+    Args:
+        rank (int): This process's rank.
+        world_size (int): Number of processes.
+        (others as PKBatchSampler; P is per rank)
+    """
+    def __init__(self, pid_to_indices, P, K, num_batches, rank, world_size, seed=0, min_images=2):
+        super().__init__(pid_to_indices, P, K, num_batches, seed=seed, min_images=min_images)
+        assert len(self.pids) >= P * world_size, (
+            f"Not enough unique IDs for {world_size} ranks × P={P} ({len(self.pids)} pids).")
+        self.rank = rank
+        self.world_size = world_size
+
+    def __iter__(self):
+        rng = self._epoch_rng()
+        first, last = self.rank * self.P, (self.rank + 1) * self.P
+        for _ in range(self.num_batches):
+            batch = []
+            for j, pid in enumerate(rng.sample(self.pids, self.P * self.world_size)):
+                indices = self.pid_to_indices[pid]
+                picks = rng.sample(indices, min(self.K, len(indices)))  # drawn on every rank to keep rng in step
+                if first <= j < last:
+                    batch.extend(picks)
+            yield batch
+
+
+def seed_worker(worker_id):
+    """
+    DataLoader worker_init_fn: seeds `random` and NumPy from the per-worker torch
+    seed so augmentation differs between workers but is reproducible when the
+    loader is given a seeded generator.
+    """
+    worker_seed = torch.initial_seed() % 2**32
+    random.seed(worker_seed)
+    np.random.seed(worker_seed)
+
+
+def make_pk_loader(dataset, P, K, num_batches, seed=0, num_workers=4, pin_memory=None,
+                   prefetch_factor=2, persistent_workers=True, min_images=2, rank=0, world_size=1):
+    """
+    Builds a DataLoader over a map-style re-id dataset (FolderPKDataset or
+    PackedShardDataset) that yields (images, labels) batches of P×K samples.
+    Labels are int tensors that can be passed straight to combined_triplet_loss.
+
+    With world_size > 1 the batches come from a DistributedPKBatchSampler
+    (disjoint identities per rank) and augmentation is seeded per rank.
+
+    Call `loader.batch_sampler.set_epoch(e)` before each epoch for a new draw.
+    """
+    if world_size > 1:
+        sampler = DistributedPKBatchSampler(dataset.pid_to_indices, P, K, num_batches, rank, world_size,
+                                            seed=seed, min_images=min_images)
+    else:
+        sampler = PKBatchSampler(dataset.pid_to_indices, P, K, num_batches, seed=seed, min_images=min_images)
+    generator = torch.Generator()
+    generator.manual_seed(seed + rank)
+    if pin_memory is None:
+        pin_memory = torch.cuda.is_available()
+
+    kwargs = {}
+    if num_workers > 0:
+        kwargs.update(prefetch_factor=prefetch_factor, persistent_workers=persistent_workers)
+    return DataLoader(
+        dataset,
+        batch_sampler=sampler,
+        num_workers=num_workers,
+        pin_memory=pin_memory,
+        worker_init_fn=seed_worker,
+        generator=generator,
+        **kwargs,
+    )
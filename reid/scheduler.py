@@ -0,0 +1,234 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# Frame scheduling for more cameras than the box can process in real time.
+#
+# For every frame the capture threads hand over, FrameScheduler.select() decides
+# whether it is worth a detector + re-id pass:
+#   1. shed   - the frame is already too old to finish within the latency SLO
+#   2. budget - the camera has used up its share of the measured throughput
+#   3. static - the scene has not changed since the last processed frame
+# Throughput is estimated from the measured detector cost per frame and re-id
+# cost per crop (the two stages run in parallel, so the slower one bounds it)
+# and split between cameras by weight: cameras with active
+# tracks weigh more, cameras showing a static scene less. If the observed p95
+# latency exceeds the SLO, the budget shrinks multiplicatively and then creeps
+# back up (AIMD), so overload turns into dropped frames rather than a backlog.
+#
+# select() / record_detect() run on the detector thread of StreamPipeline and
+# record_reid() / record_result() on the re-id thread; one lock guards the
+# shared state (in_flight, latencies, costs, per-camera counters).
+
+SLO_MS = 250.0
+MOTION_THRESHOLD = 3.0      # mean abs grey-level difference on the thumbnail
+MOTION_SIZE = (64, 36)      # (W, H) thumbnail compared by the gate
+STATIC_REFRESH = 2.0        # seconds; a static camera is still processed this often
+ACTIVE_WEIGHT = 3.0         # extra weight of a camera with active tracks
+STATIC_WEIGHT = 0.25        # weight of a camera whose scene is static
+COST_EMA = 0.2
+LATENCY_WINDOW = 50         # recent latencies used for the SLO check
+LOAD_DECREASE = 0.8
+LOAD_INCREASE = 0.02
+
+
+class MotionGate:
+    """
+    Cheap frame-difference gate: a frame passes if its grey thumbnail differs
+    from that of the last passed frame of the camera by at least `threshold`
+    grey levels on average, or if the last pass is older than `refresh` seconds.
+    """
+    def __init__(self, threshold=MOTION_THRESHOLD, size=MOTION_SIZE, refresh=STATIC_REFRESH):
+        self.threshold = threshold
+        self.size = size
+        self.refresh = refresh
+        self._reference = {}  # camera → (thumbnail, time)
+
+    def thumbnail(self, image):
+        import cv2
+
+        grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        return cv2.resize(grey, self.size, interpolation=cv2.INTER_AREA).astype(np.int16)
+
+    def changed(self, camera, image, now):
+        small = self.thumbnail(image)
+        ref = self._reference.get(camera)
+        if (ref is None or now - ref[1] >= self.refresh
+                or np.abs(small - ref[0]).mean() >= self.threshold):
+            self._reference[camera] = (small, now)
+            return True
+        return False
+
+
+class CameraSchedule:
+    """Per-camera scheduler state and counters."""
+    def __init__(self):
+        self.offered = 0
+        self.processed = 0
+        self.skipped_static = 0
+        self.skipped_budget = 0
+        self.shed_slo = 0
+        self.active = 0          # tracks / detections in the last processed frame
+        self.static = False
+        self.credit = 1.0
+        self.budget_fps = float("inf")
+        self.last_update = None
+
+    def counters(self):
+        return {"offered": self.offered, "processed": self.processed,
+                "skipped_static": self.skipped_static, "skipped_budget": self.skipped_budget,
+                "shed_slo": self.shed_slo, "budget_fps": self.budget_fps}
+
+
+class FrameScheduler:
+    """
+    Decides which captured frames get processed (see module comment).
+
+    Args:
+        slo_ms (float): End-to-end latency target (capture → embedding).
+        motion_gate (MotionGate, optional): Static-scene gate (default MotionGate());
+                                            False disables it.
+        active_weight (float): Extra weight of cameras with active tracks.
+        static_weight (float): Weight of cameras with a static scene.
+        max_fps (float, optional): Upper bound of any camera's budget.
+    """
+    def __init__(self, slo_ms=SLO_MS, motion_gate=None, active_weight=ACTIVE_WEIGHT,
+                 static_weight=STATIC_WEIGHT, max_fps=None):
+        self.slo = slo_ms / 1000.0
+        self.motion_gate = MotionGate() if motion_gate is None else motion_gate
+        self.active_weight = active_weight
+        self.static_weight = static_weight
+        self.max_fps = max_fps
+        self.cameras = {}
+        self.detect_cost = None   # seconds per frame
+        self.reid_cost = None     # seconds per crop
+        self.crops_per_frame = 0.0
+        self.load = 0.9           # share of the estimated capacity handed out
+        self.in_flight = 0        # selected frames not yet embedded
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def camera(self, name):
+        if name not in self.cameras:
+            self.cameras[name] = CameraSchedule()
+        return self.cameras[name]
+
+    # cost model
+
+    @staticmethod
+    def _ema(old, new):
+        return new if old is None else (1 - COST_EMA) * old + COST_EMA * new
+
+    def record_detect(self, n_frames, seconds):
+        if n_frames:
+            with self._lock:
+                self.detect_cost = self._ema(self.detect_cost, seconds / n_frames)
+
+    def record_reid(self, n_frames, n_crops, seconds):
+        with self._lock:
+            if n_frames:
+                self.crops_per_frame = self._ema(self.crops_per_frame, n_crops / n_frames)
+            if n_crops:
+                self.reid_cost = self._ema(self.reid_cost, seconds / n_crops)
+
+    def record_result(self, camera, n_active, latency):
+        """Called once per processed frame with its track / detection count and latency."""
+        with self._lock:
+            self.camera(camera).active = n_active
+            self.in_flight = max(0, self.in_flight - 1)
+            self.latencies.append(latency)
+
+    def reid_frame_cost(self):
+        return (self.reid_cost or 0.0) * self.crops_per_frame
+
+    def frame_cost(self):
+        """Seconds per processed frame of the slower stage (None until measured)."""
+        if self.detect_cost is None:
+            return None
+        return max(self.detect_cost, self.reid_frame_cost())
+
+    def expected_latency(self, age, n):
+        """Latency of a frame of this age processed in a tick of n frames, behind the re-id backlog."""
+        detect = (self.detect_cost or 0.0) * n
+        reid = self.reid_frame_cost() * (self.in_flight + n)
+        return age + detect + reid
+
+    def _update_budgets(self):
+        # one AIMD step per batch of fresh latencies
+        if len(self.latencies) >= LATENCY_WINDOW // 5:
+            if np.percentile(self.latencies, 95) > self.slo:
+                self.load = max(0.05, self.load * LOAD_DECREASE)
+            else:
+                self.load = min(1.0, self.load + LOAD_INCREASE)
+            self.latencies.clear()
+
+        cost = self.frame_cost()
+        if not cost:
+            return
+        capacity = self.load / cost  # frames per second the box can process
+        weights = {}
+        for name, cam in self.cameras.items():
+            w = self.static_weight if cam.static else 1.0
+            if cam.active:
+                w += self.active_weight
+            weights[name] = w
+        total = sum(weights.values())
+        for name, cam in self.cameras.items():
+            budget = capacity * weights[name] / total
+            cam.budget_fps = min(budget, self.max_fps) if self.max_fps else budget
+
+    # decision
+
+    def select(self, frames, now=None):
+        """
+        Filters a tick's frames (objects with .camera, .capture_time, .image).
+        Cameras with active tracks get the first slots of the tick.
+
+        Returns:
+            list: The frames to process, in input order.
+        """
+        now = time.perf_counter() if now is None else now
+        with self._lock:
+            return self._select(frames, now)
+
+    def _select(self, frames, now):
+        self._update_budgets()
+        order = sorted(range(len(frames)), key=lambda i: -self.camera(frames[i].camera).active)
+        selected = []
+        for i in order:
+            frame = frames[i]
+            cam = self.camera(frame.camera)
+            cam.offered += 1
+            if cam.last_update is not None:
+                cam.credit = min(1.0, cam.credit + (now - cam.last_update) * cam.budget_fps)
+            cam.last_update = now
+
+            # the tick is processed as one batch, so each selected frame adds to everyone's latency
+            if self.expected_latency(now - frame.capture_time, len(selected) + 1) > self.slo:
+                cam.shed_slo += 1
+                continue
+            if cam.credit < 1.0:
+                cam.skipped_budget += 1
+                continue
+            if self.motion_gate and not self.motion_gate.changed(frame.camera, frame.image, now):
+                cam.static = True
+                cam.skipped_static += 1
+                continue
+            cam.static = False
+            cam.credit -= 1.0
+            cam.processed += 1
+            selected.append(i)
+        self.in_flight += len(selected)
+        return [frames[i] for i in sorted(selected)]
+
+    def report(self):
+        """{camera: counters} plus the current cost estimates under "_scheduler"."""
+        with self._lock:
+            out = {name: cam.counters() for name, cam in self.cameras.items()}
+            out["_scheduler"] = {"detect_ms_per_frame": (self.detect_cost or 0.0) * 1e3,
+                                 "reid_ms_per_crop": (self.reid_cost or 0.0) * 1e3,
+                                 "crops_per_frame": self.crops_per_frame, "load": self.load,
+                                 "in_flight": self.in_flight}
+        return out
@@ -0,0 +1,214 @@
+import os
+import json
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from torch.utils.data import Dataset
+from PIL import Image
+
+from . import instrument
+from .transforms import INPUT_SIZE, ResizePad, occlude_batch_, uint8_to_tensor
+
+# Packed training shards.
+#
+# A shard is one set/part folder (root/<pid>/*.png) decoded once and stored as
+#   <prefix>.images.npy  uint8 (N, 256, 128, 3), already ResizePad-ed, memory-mappable
+#   <prefix>.index.json  pid → [start, end) row range, source paths, shape
+# Rows of the same pid are contiguous, so a P×K batch is P small slices of the
+# mmap. Reading it is a page-cache hit after the first epoch, and every
+# DataLoader worker / training process maps the same pages instead of holding
+# its own copy.
+#
+#   python -m reid.shards /content/dataset/train/set1 /content/dataset/train/set2 -o shards/ -w 8
+
+IMAGES_SUFFIX = ".images.npy"
+INDEX_SUFFIX = ".index.json"
+PACK_CHUNK = 256  # images decoded per worker task
+
+
+def list_pid_images(root_dir, ext=".png"):
+    """Returns {pid: sorted image paths} for every pid folder under root_dir."""
+    pid_to_paths = {}
+    for pid in sorted(os.listdir(root_dir)):
+        folder = os.path.join(root_dir, pid)
+        if not os.path.isdir(folder):
+            continue
+        paths = sorted(os.path.join(folder, f) for f in os.listdir(folder) if f.endswith(ext))
+        if paths:
+            pid_to_paths[pid] = paths
+    return pid_to_paths
+
+
+def _pack_rows(images_path, start, paths, size, fill):
+    images = np.load(images_path, mmap_mode="r+")
+    pad = ResizePad(size, fill)
+    failed = []
+    for i, path in enumerate(paths):
+        try:
+            images[start + i] = np.asarray(pad(Image.open(path).convert("RGB")))
+        except (OSError, ValueError) as e:
+            print(f"❌ Failed to decode {path} → {e}")
+            failed.append(start + i)
+    images.flush()
+    return failed
+
+
+def pack_shard(root_dir, prefix, size=INPUT_SIZE, fill=0, workers=None):
+    """
+    Decodes and letterboxes every image under root_dir into a packed shard.
+
+    Args:
+        root_dir (str): Folder with one sub-folder of .png crops per pid.
+        prefix (str): Output path prefix; writes prefix + IMAGES_SUFFIX / INDEX_SUFFIX.
+        size (tuple): (H, W) of the stored crops.
+        fill (int): Padding value used by ResizePad.
+        workers (int, optional): Decode processes. Defaults to os.cpu_count().
+
+    Returns:
+        dict: The shard index (also written to prefix + INDEX_SUFFIX).
+    """
+    pid_to_paths = list_pid_images(root_dir)
+    pids, paths = [], []
+    for pid, pid_paths in pid_to_paths.items():
+        pids.append({"pid": pid, "start": len(paths), "end": len(paths) + len(pid_paths)})
+        paths.extend(pid_paths)
+
+    h, w = size
+    images_path = prefix + IMAGES_SUFFIX
+    os.makedirs(os.path.dirname(os.path.abspath(prefix)), exist_ok=True)
+    images = np.lib.format.open_memmap(images_path, mode="w+", dtype=np.uint8, shape=(len(paths), h, w, 3))
+    del images  # header + zeroed file on disk; workers map it r+
+
+    tasks = [(start, paths[start:start + PACK_CHUNK]) for start in range(0, len(paths), PACK_CHUNK)]
+    failed = []
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for start, chunk in tasks:
+            failed += _pack_rows(images_path, start, chunk, size, fill)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_pack_rows, images_path, start, chunk, size, fill) for start, chunk in tasks]
+            for future in futures:
+                failed += future.result()
+
+    index = {
+        "root_dir": os.path.abspath(root_dir),
+        "size": [h, w],
+        "fill": fill,
+        "count": len(paths),
+        "pids": pids,
+        "paths": [os.path.relpath(p, root_dir) for p in paths],
+        "failed_rows": sorted(failed),
+    }
+    with open(prefix + INDEX_SUFFIX, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    print(f"📦 Packed {len(paths)} images / {len(pids)} pids → {images_path} ({len(failed)} failed)")
+    return index
+
+
+def load_shard_index(prefix):
+    with open(prefix + INDEX_SUFFIX, encoding="utf-8") as f:
+        return json.load(f)
+
+
+class PackedShardDataset(Dataset):
+    """
+    P×K sampling straight from a packed shard, with no image decoding.
+
+    Drop-in for FolderGroupedBatchTrainingDataset: same `pids` / `sample(P, K)`
+    interface. It is also a map-style Dataset (`ds[i]` → (tensor, label) with
+    label an int index into `pid_names`) so it can be used with a DataLoader
+    and PKBatchSampler.
+
+    The mmap is opened lazily and is not pickled, so DataLoader workers (fork
+    or spawn) each re-open the same file and share its page cache.
+
+    Args:
+        prefix (str): Shard path prefix given to pack_shard().
+        augment_prob (float): Probability of the obstacle / bottom-crop
+                              augmentation from get_custom_transform. It is
+                              applied to the letterboxed crop.
+        min_images (int): Pids with fewer images are not sampled.
+    """
+    def __init__(self, prefix, augment_prob=0.0, min_images=2):
+        self.prefix = prefix
+        self.augment_prob = augment_prob
+        self.index = load_shard_index(prefix)
+        self.pid_ranges = {p["pid"]: (p["start"], p["end"]) for p in self.index["pids"]}
+        self.pids = [pid for pid, (s, e) in self.pid_ranges.items() if e - s >= min_images]
+        self.row_pid = np.empty(self.index["count"], dtype=np.int64)
+        self.pid_names = [p["pid"] for p in self.index["pids"]]
+        for i, p in enumerate(self.index["pids"]):
+            self.row_pid[p["start"]:p["end"]] = i
+        self._images = None
+
+    @property
+    def images(self):
+        if self._images is None:
+            self._images = np.load(self.prefix + IMAGES_SUFFIX, mmap_mode="r")
+        return self._images
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_images"] = None
+        return state
+
+    def __len__(self):
+        return self.index["count"]
+
+    @property
+    def pid_to_indices(self):
+        """{pid: row indices}, the grouping PKBatchSampler draws from."""
+        return {pid: range(s, e) for pid, (s, e) in self.pid_ranges.items()}
+
+    def __getitem__(self, index):
+        batch = self.load_rows([index])
+        return batch[0], int(self.row_pid[index])
+
+    def __getitems__(self, indices):
+        # DataLoader fetches a whole P×K batch with one mmap gather instead of B lookups
+        batch = self.load_rows(indices)
+        return [(img, int(self.row_pid[i])) for img, i in zip(batch, indices)]
+
+    def load_rows(self, rows):
+        """Gathers `rows` from the mmap, applies augmentation, returns a (B, 3, H, W) tensor."""
+        with instrument.stage("decode"):
+            batch = self.images[np.asarray(rows, dtype=np.int64)]  # fancy indexing → private copy
+        with instrument.stage("augment"):
+            if self.augment_prob > 0:
+                occlude_batch_(batch, self.augment_prob)
+            return uint8_to_tensor(batch)
+
+    def sample_rows(self, P, K, rng=random):
+        """Picks P pids and up to K rows of each, like FolderGroupedBatchTrainingDataset.sample."""
+        assert len(self.pids) >= P, "Not enough unique IDs to sample."
+        rows, labels = [], []
+        for pid in rng.sample(self.pids, P):
+            start, end = self.pid_ranges[pid]
+            chosen = rng.sample(range(start, end), min(K, end - start))
+            rows.extend(chosen)
+            labels.extend([pid] * len(chosen))
+        return rows, labels
+
+    def sample(self, P, K):
+        """
+        Sample a batch of P identities with K images each.
+        Returns: images (B, 3, H, W) tensor, labels (list of pids)
+        """
+        rows, labels = self.sample_rows(P, K)
+        return self.load_rows(rows), labels
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Pack set/part folders into memory-mapped training shards.")
+    parser.add_argument("root_dirs", nargs="+", help="set/part folders (one sub-folder per pid)")
+    parser.add_argument("-o", "--output", default="shards", help="output directory")
+    parser.add_argument("-w", "--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    for root in args.root_dirs:
+        name = os.path.basename(os.path.normpath(root))
+        pack_shard(root, os.path.join(args.output, name), workers=args.workers)
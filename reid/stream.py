@@ -0,0 +1,533 @@
+import configparser
+import os
+import queue
+import threading
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+import torch
+from torchvision.ops import RoIAlign
+
+from . import instrument
+from .transforms import INPUT_SIZE
+
+# Multi-camera detect → crop → embed pipeline.
+#
+#   capture threads (one per camera, keep only the newest frame)
+#     → detect stage (one batch with the newest frame of every camera)
+#     → re-id stage (RoIAlign crops of every box of the tick, one model batch)
+#
+# With a tracker, boxes are associated to per-camera tracks first and only the
+# crops the tracker asks for (new tracks, periodic refresh, better view) are
+# embedded; every detection is reported with its track's aggregated embedding.
+#
+# The stages are connected by bounded queues. When the re-id stage falls behind,
+# the detect stage blocks on put(), and the capture threads keep overwriting
+# their single-frame slot, so stale frames are dropped at the source instead
+# of piling up latency.
+#
+# Local video files stand in for RTSP cameras; with realtime=True they are
+# read at their native frame rate, like a live stream:
+#   python -m reid.stream cam1.mp4 cam2.mp4 --detector yolo11n.pt --reid-model reid_ts.pt --duration 30
+
+STAGE_QUEUE_SIZE = 2      # ticks buffered between detect and re-id
+MAX_REID_BATCH = 256      # crops per model call
+REPORT_WINDOW = 1000      # latencies kept per camera for the report
+ROI_SAMPLING_RATIO = 2
+
+Frame = namedtuple("Frame", "camera index capture_time image")
+Detection = namedtuple("Detection", "camera frame_index box score embedding capture_time done_time track_id",
+                       defaults=(None,))
+
+
+def rtsp_sources_from_config(path, cameras=None, path_key="path2"):
+    """
+    RTSP URLs from a camera_config.ini as used in cam_test.ipynb
+    ([cameraN] sections with ip / username / password / path keys).
+
+    Returns:
+        dict: {section name: rtsp url}
+    """
+    config = configparser.ConfigParser()
+    config.read(path)
+    sources = {}
+    for name in cameras or config.sections():
+        cam = config[name]
+        sources[name] = f"rtsp://{cam['username']}:{cam['password']}@{cam['ip']}/{cam[path_key]}"
+    return sources
+
+
+class CameraStream(threading.Thread):
+    """
+    Reads one camera (RTSP url, device index or video file) on its own thread
+    and keeps only the newest frame; a frame that is replaced before the
+    pipeline takes it is counted as dropped.
+
+    Args:
+        name (str): Camera id reported with every frame.
+        source: Anything cv2.VideoCapture accepts.
+        realtime (bool): For files, pace reads at the file's FPS.
+        loop (bool): For files, restart at the end instead of stopping.
+        on_frame (callable, optional): Called after every new frame (used to wake the detector).
+    """
+    def __init__(self, name, source, realtime=True, loop=False, on_frame=None):
+        super().__init__(name=f"capture-{name}", daemon=True)
+        self.camera = name
+        self.source = source
+        self.is_file = isinstance(source, str) and os.path.isfile(source)
+        self.realtime = realtime
+        self.loop = loop
+        self.on_frame = on_frame
+        self.finished = threading.Event()
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+        self._latest = None
+        self.captured = 0
+        self.dropped = 0
+
+    def stop(self):
+        self._stop_event.set()
+
+    def take(self):
+        """Returns the newest unread Frame, or None."""
+        with self._lock:
+            frame, self._latest = self._latest, None
+        return frame
+
+    def run(self):
+        import cv2
+
+        cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            print(f"❌ Cannot open stream: {self.camera}")
+            self.finished.set()
+            return
+        fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+        period = 1.0 / fps if self.is_file and self.realtime and fps > 0 else 0.0
+        start = time.perf_counter()
+        index = 0
+        try:
+            while not self._stop_event.is_set():
+                ret, image = cap.read()
+                if not ret:
+                    if self.is_file and self.loop:
+                        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        continue
+                    if not self.is_file:
+                        print(f"⚠️ Failed to grab frame: {self.camera}")
+                    break
+                if period:
+                    delay = start + index * period - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                frame = Frame(self.camera, index, time.perf_counter(), image)
+                with self._lock:
+                    if self._latest is not None:
+                        self.dropped += 1
+                    self._latest = frame
+                self.captured += 1
+                index += 1
+                if self.on_frame:
+                    self.on_frame()
+        finally:
+            cap.release()
+            self.finished.set()
+            if self.on_frame:
+                self.on_frame()
+
+
+class YOLODetector:
+    """
+    Person detector on a batch of BGR frames with an ultralytics YOLO model
+    (.pt, or an exported OpenVINO / ONNX model directory / file).
+
+    Returns, per frame, (boxes (n, 4) xyxy float32, scores (n,) float32).
+    """
+    def __init__(self, weights="yolo11n.pt", conf=0.4, imgsz=640, device=None):
+        from ultralytics import YOLO
+
+        self.model = YOLO(weights)
+        self.conf = conf
+        self.imgsz = imgsz
+        self.device = device
+
+    def __call__(self, images):
+        results = self.model.predict(images, classes=[0], conf=self.conf, imgsz=self.imgsz,
+                                     device=self.device, verbose=False)
+        return [(r.boxes.xyxy.cpu().numpy().astype(np.float32),
+                 r.boxes.conf.cpu().numpy().astype(np.float32)) for r in results]
+
+
+class FullFrameDetector:
+    """Treats every frame as one person box, for videos that are already person crops."""
+    def __call__(self, images):
+        return [(np.array([[0, 0, img.shape[1], img.shape[0]]], dtype=np.float32),
+                 np.ones(1, dtype=np.float32)) for img in images]
+
+
+def letterbox_boxes(boxes, size=INPUT_SIZE):
+    """
+    Grows each xyxy box around its centre to the H:W ratio of `size`, so that
+    RoIAlign resamples it without distortion.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    h, w = size
+    bw = boxes[:, 2] - boxes[:, 0]
+    bh = boxes[:, 3] - boxes[:, 1]
+    cx = (boxes[:, 0] + boxes[:, 2]) / 2
+    cy = (boxes[:, 1] + boxes[:, 3]) / 2
+    out_w = np.maximum(bw, bh * w / h)
+    out_h = np.maximum(bh, bw * h / w)
+    return np.stack([cx - out_w / 2, cy - out_h / 2, cx + out_w / 2, cy + out_h / 2], axis=1)
+
+
+def _padding_mask(boxes, letterboxed, size):
+    """(N, 1, H, W) mask of the output pixels that fall inside the original box."""
+    h, w = size
+    lw = letterboxed[:, 2] - letterboxed[:, 0]
+    lh = letterboxed[:, 3] - letterboxed[:, 1]
+    x0 = (boxes[:, 0] - letterboxed[:, 0]) / lw * w
+    x1 = (boxes[:, 2] - letterboxed[:, 0]) / lw * w
+    y0 = (boxes[:, 1] - letterboxed[:, 1]) / lh * h
+    y1 = (boxes[:, 3] - letterboxed[:, 1]) / lh * h
+    cols = torch.arange(w) + 0.5
+    rows = torch.arange(h) + 0.5
+    in_x = (cols >= x0[:, None]) & (cols <= x1[:, None])
+    in_y = (rows >= y0[:, None]) & (rows <= y1[:, None])
+    return (in_y[:, :, None] & in_x[:, None, :]).unsqueeze(1)
+
+
+class RoICropper:
+    """
+    Cuts every box of a tick out of the full frames with RoIAlign and returns
+    a normalized (N, 3, H, W) batch ready for the re-id model (RGB, x / 127.5 - 1,
+    the same scaling as ToTensor + Normalize(0.5, 0.5)).
+
+    Like ResizePad, the box keeps its aspect ratio and the rest of the crop is
+    black: the letterboxed RoI is sampled, then everything outside the
+    original box is zeroed.
+    """
+    def __init__(self, size=INPUT_SIZE, device="cpu"):
+        self.size = size
+        self.device = torch.device(device)
+        self.roi_align = RoIAlign(output_size=size, spatial_scale=1.0,
+                                  sampling_ratio=ROI_SAMPLING_RATIO, aligned=True)
+
+    @torch.no_grad()
+    def __call__(self, images, boxes):
+        """
+        Args:
+            images (list[np.ndarray]): BGR uint8 frames (sizes may differ between cameras).
+            boxes (list[np.ndarray]): xyxy boxes per frame.
+
+        Returns:
+            torch.Tensor: (sum of boxes, 3, H, W) crops in frame / box order.
+        """
+        total = sum(len(b) for b in boxes)
+        h, w = self.size
+        out = torch.empty((total, 3, h, w), device=self.device)
+        offsets = np.cumsum([0] + [len(b) for b in boxes])
+
+        # frames of the same size are resampled together
+        by_shape = {}
+        for i, img in enumerate(images):
+            if len(boxes[i]):
+                by_shape.setdefault(img.shape, []).append(i)
+        for frame_ids in by_shape.values():
+            batch = torch.from_numpy(np.stack([images[i] for i in frame_ids])).to(self.device)
+            batch = batch.permute(0, 3, 1, 2).flip(1).float()  # BHWC BGR → BCHW RGB
+            rois, masks, targets = [], [], []
+            for j, i in enumerate(frame_ids):
+                b = torch.from_numpy(np.asarray(boxes[i], dtype=np.float32).reshape(-1, 4))
+                lb = torch.from_numpy(letterbox_boxes(boxes[i], self.size))
+                rois.append(torch.cat([torch.full((len(lb), 1), float(j)), lb], dim=1))
+                masks.append(_padding_mask(b, lb, self.size))
+                targets.append(torch.arange(offsets[i], offsets[i + 1]))
+            crops = self.roi_align(batch, torch.cat(rois).to(self.device))
+            crops *= torch.cat(masks).to(self.device)
+            out[torch.cat(targets).to(self.device)] = crops
+        return out.div_(127.5).sub_(1.0)
+
+
+class CameraStats:
+    def __init__(self):
+        self.processed = 0
+        self.detections = 0
+        self.embedded = 0
+        self.latencies = deque(maxlen=REPORT_WINDOW)
+
+
+class StreamPipeline:
+    """
+    Runs capture threads, a detect thread and a re-id thread over several cameras.
+
+    Args:
+        sources (dict): {camera name: cv2.VideoCapture source}.
+        detector (callable): list of BGR frames → [(boxes, scores)] per frame
+                             (YOLODetector, FullFrameDetector).
+        model (nn.Module): Re-id model, (N, 3, 256, 128) → (N, D) embeddings.
+        device (str): Device for cropping and the re-id model.
+        on_results (callable, optional): Called from the re-id thread with the
+                                         list of Detection of every tick.
+        realtime, loop: Passed to CameraStream for file sources.
+        max_batch (int): Largest re-id model batch; bigger ticks are split.
+        scheduler (FrameScheduler, optional): Picks which frames are processed
+                                              (budgets, static-scene gate, latency SLO).
+        tracker_factory (callable, optional): Builds one tracker per camera
+                                              (e.g. reid.tracker.Tracker) so that
+                                              embeddings are reused along tracks.
+    """
+    def __init__(self, sources, detector, model, device="cpu", on_results=None,
+                 realtime=True, loop=False, max_batch=MAX_REID_BATCH, scheduler=None,
+                 tracker_factory=None):
+        self.detector = detector
+        self.model = model.to(device).eval()
+        self.device = device
+        self.cropper = RoICropper(device=device)
+        self.on_results = on_results
+        self.max_batch = max_batch
+        self.scheduler = scheduler
+        self._wake = threading.Event()
+        self.cameras = [CameraStream(name, src, realtime=realtime, loop=loop, on_frame=self._wake.set)
+                        for name, src in sources.items()]
+        self.stats = {cam.camera: CameraStats() for cam in self.cameras}
+        self.trackers = ({cam.camera: tracker_factory() for cam in self.cameras}
+                         if tracker_factory else None)
+        self._ticks = queue.Queue(maxsize=STAGE_QUEUE_SIZE)
+        self._stop_event = threading.Event()
+        self._threads = []
+        self.started = None
+        self.errors = []
+
+    # stages
+
+    def _detect_loop(self):
+        try:
+            while not self._stop_event.is_set():
+                frames = [f for f in (cam.take() for cam in self.cameras) if f is not None]
+                if not frames:
+                    if all(cam.finished.is_set() for cam in self.cameras):
+                        break
+                    self._wake.wait(0.05)
+                    self._wake.clear()
+                    continue
+                if self.scheduler:
+                    frames = self.scheduler.select(frames)
+                    if not frames:
+                        continue
+                start = time.perf_counter()
+                with instrument.stage("detect"):
+                    detections = self.detector([f.image for f in frames])
+                if self.scheduler:
+                    self.scheduler.record_detect(len(frames), time.perf_counter() - start)
+                self._put((frames, detections))
+        except Exception as e:  # surfaced by run()/stop()
+            self.errors.append(e)
+        finally:
+            self._put(None)
+
+    def _put(self, item):
+        while not self._stop_event.is_set():
+            try:
+                self._ticks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    @torch.no_grad()
+    def _reid_loop(self):
+        try:
+            while True:
+                try:
+                    item = self._ticks.get(timeout=0.1)
+                except queue.Empty:
+                    if self._stop_event.is_set():
+                        return
+                    continue
+                if item is None:
+                    return
+                self._embed_tick(*item)
+        except Exception as e:
+            self.errors.append(e)
+            self._stop_event.set()
+
+    def _embed_tick(self, frames, detections):
+        start = time.perf_counter()
+        boxes = [np.asarray(d[0], dtype=np.float32).reshape(-1, 4) for d in detections]
+        plans = None
+        if self.trackers is not None:
+            with instrument.stage("track"):
+                plans = [self.trackers[f.camera].update(b, f.index, f.image.shape) for f, b in zip(frames, boxes)]
+            embed_boxes = [b[np.asarray(needs, dtype=bool)] for b, (_, needs, _) in zip(boxes, plans)]
+        else:
+            embed_boxes = boxes
+        with instrument.stage("crop"):
+            crops = self.cropper([f.image for f in frames], embed_boxes)
+        with instrument.stage("reid_forward"):
+            embeddings = [self.model(crops[i:i + self.max_batch]) for i in range(0, len(crops), self.max_batch)]
+            embeddings = torch.cat(embeddings).cpu().numpy() if embeddings else np.empty((0, 0), np.float32)
+        done = time.perf_counter()
+        if self.scheduler:
+            self.scheduler.record_reid(len(frames), len(crops), done - start)
+
+        results, row = [], 0
+        for i, (frame, (_, scores)) in enumerate(zip(frames, detections)):
+            stats = self.stats[frame.camera]
+            stats.processed += 1
+            stats.detections += len(boxes[i])
+            stats.embedded += len(embed_boxes[i])
+            stats.latencies.append(done - frame.capture_time)
+            instrument.record("stream_latency", done - frame.capture_time)
+            for j, (box, score) in enumerate(zip(boxes[i], scores)):
+                if plans is None:
+                    embedding, track_id = embeddings[row], None
+                    row += 1
+                else:
+                    tracks, needs, quality = plans[i]
+                    track = tracks[j]
+                    if needs[j]:
+                        track.add_embedding(embeddings[row], quality[j], frame.index)
+                        row += 1
+                    embedding, track_id = track.embedding, track.track_id
+                results.append(Detection(frame.camera, frame.index, box, float(score),
+                                         embedding, frame.capture_time, done, track_id))
+            if self.scheduler:
+                active = len(self.trackers[frame.camera].active_tracks) if plans is not None else len(boxes[i])
+                self.scheduler.record_result(frame.camera, active, done - frame.capture_time)
+        if self.on_results:
+            self.on_results(results)
+
+    # control
+
+    def start(self):
+        self.started = time.perf_counter()
+        for cam in self.cameras:
+            cam.start()
+        self._threads = [threading.Thread(target=self._detect_loop, name="detect", daemon=True),
+                         threading.Thread(target=self._reid_loop, name="reid", daemon=True)]
+        for t in self._threads:
+            t.start()
+        return self
+
+    def stop(self):
+        for cam in self.cameras:
+            cam.stop()
+        self._stop_event.set()
+        for t in self._threads + self.cameras:
+            t.join(timeout=5)
+        if self.errors:
+            raise self.errors[0]
+
+    def run(self, duration=None):
+        """Runs until every (non-looping) source ends or `duration` seconds pass."""
+        self.start()
+        try:
+            deadline = None if duration is None else self.started + duration
+            while self._threads[1].is_alive():
+                if deadline is not None and time.perf_counter() >= deadline:
+                    break
+                self._threads[1].join(timeout=0.1)
+        finally:
+            self.stop()
+        return self.report()
+
+    def report(self):
+        """
+        Per-camera statistics.
+
+        Returns:
+            dict: {camera: {captured, dropped, processed, detections, embedded, fps,
+                            latency_ms_mean, latency_ms_p50, latency_ms_p95}},
+                  plus the FrameScheduler counters (skipped_static,
+                  skipped_budget, shed_slo, budget_fps) when a scheduler is used.
+        """
+        schedule = self.scheduler.report() if self.scheduler else {}
+        elapsed = max(time.perf_counter() - (self.started or time.perf_counter()), 1e-9)
+        out = {}
+        for cam in self.cameras:
+            stats = self.stats[cam.camera]
+            lat = np.array(stats.latencies) * 1e3
+            out[cam.camera] = {
+                "captured": cam.captured,
+                "dropped": cam.dropped,
+                "processed": stats.processed,
+                "detections": stats.detections,
+                "embedded": stats.embedded,
+                "fps": stats.processed / elapsed,
+                "latency_ms_mean": float(lat.mean()) if len(lat) else 0.0,
+                "latency_ms_p50": float(np.percentile(lat, 50)) if len(lat) else 0.0,
+                "latency_ms_p95": float(np.percentile(lat, 95)) if len(lat) else 0.0,
+            }
+            counters = schedule.get(cam.camera)
+            if counters:
+                out[cam.camera].update((k, counters[k]) for k in
+                                       ("skipped_static", "skipped_budget", "shed_slo", "budget_fps"))
+        return out
+
+
+def print_report(report):
+    scheduled = any("shed_slo" in r for r in report.values())
+    extra = f" {'static':>7} {'budget':>7} {'shed':>6} {'bud fps':>8}" if scheduled else ""
+    print(f"{'camera':>12} {'captured':>9} {'dropped':>8} {'processed':>10} {'dets':>6} {'embeds':>7} {'fps':>6} "
+          f"{'lat ms':>8} {'p50':>8} {'p95':>8}" + extra)
+    for cam, r in report.items():
+        line = (f"{cam:>12} {r['captured']:>9} {r['dropped']:>8} {r['processed']:>10} {r['detections']:>6} "
+                f"{r['embedded']:>7} "
+                f"{r['fps']:>6.1f} {r['latency_ms_mean']:>8.1f} {r['latency_ms_p50']:>8.1f} {r['latency_ms_p95']:>8.1f}")
+        if scheduled and "shed_slo" in r:
+            line += (f" {r['skipped_static']:>7} {r['skipped_budget']:>7} {r['shed_slo']:>6} "
+                     f"{r['budget_fps']:>8.1f}")
+        print(line)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from .engines import ENGINES, create_engine
+    from .model import load_reid_model
+    from .tracker import Tracker
+
+    parser = argparse.ArgumentParser(description="Detect → crop → embed over several camera streams.")
+    parser.add_argument("sources", nargs="*", help="video files / RTSP urls (one camera each)")
+    parser.add_argument("--config", default=None, help="camera_config.ini with RTSP cameras")
+    parser.add_argument("--cameras", nargs="*", default=None, help="config sections to use")
+    parser.add_argument("--detector", default="yolo11n.pt", help="YOLO weights, or 'none' for pre-cropped videos")
+    parser.add_argument("--reid-model", required=True, help="re-id checkpoint (reid.model) or TorchScript export")
+    parser.add_argument("--duration", type=float, default=None)
+    parser.add_argument("--loop", action="store_true")
+    parser.add_argument("--no-realtime", action="store_true", help="read files as fast as possible")
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--slo-ms", type=float, default=None, help="enable the FrameScheduler with this latency SLO")
+    parser.add_argument("--track", action="store_true", help="reuse embeddings along IoU/Kalman tracks")
+    parser.add_argument("--engine", default=None, choices=ENGINES, help="re-id inference engine (see reid.engines)")
+    parser.add_argument("--engine-dir", default=None,
+                        help="exported engine files; -int8 engines need the model_<fingerprint>_int8.onnx "
+                             "of the same weights from benchmarks.engines --workdir")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                        help="serve per-stage timings at :PORT/metrics (Prometheus)")
+    args = parser.parse_args()
+
+    if args.metrics_port:
+        instrument.enable()
+        instrument.serve_prometheus(args.metrics_port)
+
+    sources = {f"cam{i}": src for i, src in enumerate(args.sources)}
+    if args.config:
+        sources.update(rtsp_sources_from_config(args.config, args.cameras))
+    detector = FullFrameDetector() if args.detector == "none" else YOLODetector(args.detector, device=args.device)
+    model = load_reid_model(args.reid_model, device=args.device)
+    if args.engine:
+        model = create_engine(args.engine, model, workdir=args.engine_dir)
+
+    scheduler = None
+    if args.slo_ms:
+        from .scheduler import FrameScheduler
+
+        scheduler = FrameScheduler(slo_ms=args.slo_ms)
+    pipeline = StreamPipeline(sources, detector, model, device=args.device,
+                              realtime=not args.no_realtime, loop=args.loop, scheduler=scheduler,
+                              tracker_factory=Tracker if args.track else None)
+    print_report(pipeline.run(duration=args.duration))
+    if instrument.enabled():
+        instrument.print_summary()
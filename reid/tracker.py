@@ -0,0 +1,211 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+# Per-camera multi-object tracker that decides when a person needs a new
+# re-id embedding.
+#
+# Detector boxes are associated to tracks by IoU with Kalman-predicted boxes
+# (constant velocity on centre and size, as in SORT / DeepSORT). A track is
+# embedded when it is born, and after that only when
+#   - `embed_interval` frames have passed since its last embedding, or
+#   - the crop is clearly better than the best one embedded so far
+#     (quality = box area × visible fraction, so bigger, unoccluded and
+#     not cut off by the frame edge).
+# Every embedding is folded into a quality-weighted running mean, the track
+# embedding that is used for gallery matching.
+
+IOU_THRESHOLD = 0.3
+MAX_MISSES = 30          # tracker updates a track survives without a matched detection
+MIN_HITS = 2             # matches before a track counts as confirmed
+EMBED_INTERVAL = 15      # frames between refresh embeddings of a track
+QUALITY_GAIN = 1.5       # re-embed when quality exceeds best embedded quality × this
+
+# Kalman noise, relative to the box height (DeepSORT defaults)
+STD_POSITION = 1.0 / 20
+STD_VELOCITY = 1.0 / 160
+
+
+def box_iou(a, b):
+    """IoU matrix between (N, 4) and (M, 4) xyxy boxes."""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    lt = np.maximum(a[:, None, :2], b[None, :, :2])
+    rb = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=2)
+    area_a = np.prod(a[:, 2:] - a[:, :2], axis=1)
+    area_b = np.prod(b[:, 2:] - b[:, :2], axis=1)
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def crop_quality(boxes, frame_shape):
+    """
+    Quality of each detection crop for re-id: box area × the fraction of the
+    box that is inside the frame and not covered by another detection.
+    """
+    boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    if len(boxes) == 0:
+        return np.zeros(0, dtype=np.float32)
+    h, w = frame_shape[:2]
+    area = np.prod(np.clip(boxes[:, 2:] - boxes[:, :2], 0, None), axis=1)
+    clipped = np.clip(boxes, 0, [w, h, w, h])
+    inside = np.prod(np.clip(clipped[:, 2:] - clipped[:, :2], 0, None), axis=1)
+
+    # share of each box covered by the other boxes (pairwise, so overlaps may double count)
+    lt = np.maximum(boxes[:, None, :2], boxes[None, :, :2])
+    rb = np.minimum(boxes[:, None, 2:], boxes[None, :, 2:])
+    inter = np.prod(np.clip(rb - lt, 0, None), axis=2)
+    np.fill_diagonal(inter, 0)
+    covered = np.minimum(inter.sum(axis=1), area)
+
+    visible = np.clip(inside - covered, 0, None) / np.maximum(area, 1e-9)
+    return area * visible
+
+
+def _xyxy_to_z(box):
+    x1, y1, x2, y2 = box
+    return np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], dtype=np.float64)
+
+
+def _z_to_xyxy(z):
+    cx, cy, w, h = z[:4]
+    return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], dtype=np.float32)
+
+
+class KalmanBox:
+    """Constant-velocity Kalman filter on (cx, cy, w, h)."""
+    _H = np.hstack([np.eye(4), np.zeros((4, 4))])
+
+    def __init__(self, box):
+        z = _xyxy_to_z(box)
+        self.mean = np.concatenate([z, np.zeros(4)])
+        s = max(z[3], 1.0)
+        std = np.array([2 * STD_POSITION * s] * 4 + [10 * STD_VELOCITY * s] * 4)
+        self.cov = np.diag(std ** 2)
+
+    def predict(self, steps=1):
+        if steps <= 0:
+            return
+        F = np.eye(8)
+        F[:4, 4:] = steps * np.eye(4)
+        s = max(self.mean[3], 1.0)
+        q = np.array([STD_POSITION * s] * 4 + [STD_VELOCITY * s] * 4) ** 2 * steps
+        self.mean = F @ self.mean
+        self.cov = F @ self.cov @ F.T + np.diag(q)
+
+    def update(self, box):
+        z = _xyxy_to_z(box)
+        s = max(self.mean[3], 1.0)
+        R = np.diag(np.full(4, (STD_POSITION * s) ** 2))
+        H = self._H
+        S = H @ self.cov @ H.T + R
+        K = self.cov @ H.T @ np.linalg.inv(S)
+        self.mean = self.mean + K @ (z - H @ self.mean)
+        self.cov = (np.eye(8) - K @ H) @ self.cov
+
+    @property
+    def box(self):
+        return _z_to_xyxy(self.mean)
+
+
+class Track:
+    def __init__(self, track_id, box, frame_index):
+        self.track_id = track_id
+        self.kf = KalmanBox(box)
+        self.box = np.asarray(box, dtype=np.float32)
+        self.hits = 1
+        self.misses = 0
+        self.last_frame = frame_index
+        self.embedding = None        # quality-weighted mean, L2-normalized
+        self._embedding_sum = None
+        self.num_embeddings = 0
+        self.last_embed_frame = None
+        self.best_quality = 0.0
+
+    @property
+    def confirmed(self):
+        return self.hits >= MIN_HITS
+
+    def add_embedding(self, embedding, quality, frame_index):
+        weighted = np.asarray(embedding, dtype=np.float32) * max(float(quality), 1e-6)
+        self._embedding_sum = weighted if self._embedding_sum is None else self._embedding_sum + weighted
+        self.embedding = self._embedding_sum / max(np.linalg.norm(self._embedding_sum), 1e-12)
+        self.num_embeddings += 1
+        self.last_embed_frame = frame_index
+        self.best_quality = max(self.best_quality, float(quality))
+
+
+class Tracker:
+    """
+    IoU / Kalman tracker for one camera.
+
+    Args:
+        iou_threshold (float): Minimum IoU between a predicted track box and a detection.
+        max_misses (int): Updates a track is kept without a matched detection.
+        embed_interval (int): Frames between refresh embeddings (None = birth and quality only).
+        quality_gain (float): Re-embed when the crop quality beats the best embedded one by this factor.
+    """
+    def __init__(self, iou_threshold=IOU_THRESHOLD, max_misses=MAX_MISSES,
+                 embed_interval=EMBED_INTERVAL, quality_gain=QUALITY_GAIN):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.embed_interval = embed_interval
+        self.quality_gain = quality_gain
+        self.tracks = []
+        self._next_id = 1
+
+    @property
+    def active_tracks(self):
+        return [t for t in self.tracks if t.confirmed and t.misses == 0]
+
+    def update(self, boxes, frame_index, frame_shape):
+        """
+        Associates this frame's detections with the tracks.
+
+        Args:
+            boxes: (N, 4) xyxy detections.
+            frame_index (int): Frame number (gaps from skipped frames are allowed).
+            frame_shape (tuple): (H, W, ...) of the frame.
+
+        Returns:
+            tuple: (tracks, needs_embedding, quality) with one entry per detection.
+        """
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        for t in self.tracks:
+            t.kf.predict(frame_index - t.last_frame)
+            t.last_frame = frame_index
+
+        matches = {}
+        if self.tracks and len(boxes):
+            iou = box_iou(np.stack([t.kf.box for t in self.tracks]), boxes)
+            rows, cols = linear_sum_assignment(-iou)
+            for r, c in zip(rows, cols):
+                if iou[r, c] >= self.iou_threshold:
+                    matches[c] = self.tracks[r]
+
+        for t in self.tracks:
+            t.misses += 1
+        out_tracks = []
+        for i, box in enumerate(boxes):
+            t = matches.get(i)
+            if t is None:
+                t = Track(self._next_id, box, frame_index)
+                self._next_id += 1
+                self.tracks.append(t)
+            else:
+                t.kf.update(box)
+                t.hits += 1
+            t.box = box
+            t.misses = 0
+            out_tracks.append(t)
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        quality = crop_quality(boxes, frame_shape)
+        needs = [self._needs_embedding(t, q, frame_index) for t, q in zip(out_tracks, quality)]
+        return out_tracks, needs, quality
+
+    def _needs_embedding(self, track, quality, frame_index):
+        if track.embedding is None:
+            return True
+        if self.embed_interval and frame_index - track.last_embed_frame >= self.embed_interval:
+            return True
+        return quality > track.best_quality * self.quality_gain
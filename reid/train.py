@@ -0,0 +1,240 @@
+import argparse
+import csv
+import json
+import os
+import random
+import re
+import socket
+import time
+
+import numpy as np
+import torch
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+
+from . import instrument
+from .datasets import FolderGroupedBatchDataset, FolderPKDataset
+from .losses import combined_triplet_loss, gather_embeddings
+from .model import DEFAULT_CONFIGS, build_model, read_checkpoint
+from .samplers import make_pk_loader
+from .shards import PackedShardDataset
+from .transforms import get_custom_transform
+from .validation import validate_similarity
+
+# Scripted P×K triplet training (the loop of ReID_atten_v2_0_1.ipynb), in one
+# process or data-parallel over CPU processes with torch.distributed (gloo).
+#
+#   python -m reid.train --data dataset/train --train-val dataset/train --val dataset/valid --out-dir ReID_attenv2/
+#   python -m reid.train --data dataset/train --nproc 4 --gather          # 4 processes on this machine
+#   torchrun --nnodes 2 --nproc-per-node 4 --rdzv-backend c10d --rdzv-endpoint node0:29500 \
+#       -m reid.train --data dataset/train --gather                       # several nodes
+#
+# --data is a pid-folder root (FolderPKDataset + get_custom_transform) or a
+# packed shard prefix (reid.shards). Each step every rank draws P identities,
+# disjoint from the other ranks' (DistributedPKBatchSampler), × K images, so
+# the global batch is P × world_size identities. With --gather the embeddings
+# are all-gathered before the loss and batch-hard mining sees the global batch;
+# without it each rank mines within its own P×K.
+#
+# Rank 0 saves the weights every --save-every steps as plain state dicts with
+# the notebook names (ReIDAttenv2_<step>.pth, reid.model.load_model reads them)
+# and every --log-every steps appends a row to the CSV log with the ReID_csv
+# columns. --instrument adds mean ms per training stage as extra columns.
+#
+# Each process gets cpu_count // local processes intra-op threads unless
+# --threads is given; oversubscribed cores make every rank slower.
+
+CSV_COLUMNS = ["epoch", "loss", "train_intra", "train_inter", "val_intra", "val_inter"]
+LOG_STAGES = ("data", "forward", "gather", "loss", "backward", "optimizer", "step", "validate")
+CHECKPOINT_PREFIX = {"atten_v2": "ReIDAttenv2", "pool": "ReIDPooling"}
+CSV_PREFIX = {"atten_v2": "ReID_atten_train_log", "pool": "ReID_pooling_train_log"}
+STATS_WARMUP = 3  # steps left out of the step-time statistics
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="P×K triplet training, optionally distributed (gloo).")
+    parser.add_argument("--data", required=True, help="training pid folders, or a packed shard prefix")
+    parser.add_argument("--train-val", default=None, help="pid folders for train_intra / train_inter")
+    parser.add_argument("--val", default=None, help="pid folders for val_intra / val_inter")
+    parser.add_argument("--arch", default="atten_v2", choices=sorted(DEFAULT_CONFIGS))
+    parser.add_argument("--resume", default=None, help="checkpoint to start from")
+    parser.add_argument("--start-step", type=int, default=None,
+                        help="default: the number in a ReIDAttenv2_<step>.pth --resume name, else 0")
+    parser.add_argument("--steps", type=int, default=50000, help="last step (total, not additional)")
+    parser.add_argument("-P", type=int, default=16, help="identities per rank and step")
+    parser.add_argument("-K", type=int, default=16, help="images per identity")
+    parser.add_argument("--lr", type=float, default=1e-4)
+    parser.add_argument("--margin", type=float, default=1.0)
+    parser.add_argument("--alpha", type=float, default=0.5)
+    parser.add_argument("--augment-prob", type=float, default=0.3)
+    parser.add_argument("--gather", action="store_true", help="mine triplets over the global batch")
+    parser.add_argument("--seed", type=int, default=2356)
+    parser.add_argument("--workers", type=int, default=2, help="DataLoader workers per rank")
+    parser.add_argument("--threads", type=int, default=None, help="intra-op threads per rank")
+    parser.add_argument("--nproc", type=int, default=1, help="processes to start on this machine")
+    parser.add_argument("--backend", default="gloo")
+    parser.add_argument("--out-dir", default="checkpoints")
+    parser.add_argument("--csv", default=None, help="default: <out-dir>/<arch log name>_<start step>.csv")
+    parser.add_argument("--log-every", type=int, default=20)
+    parser.add_argument("--save-every", type=int, default=500)
+    parser.add_argument("--instrument", action="store_true", help="per-stage timing columns in the CSV")
+    parser.add_argument("--stats-out", default=None, help="JSON with step-time statistics (rank 0)")
+    return parser.parse_args(argv)
+
+
+def build_dataset(path, augment_prob):
+    if os.path.isdir(path):
+        return FolderPKDataset(path, transform=get_custom_transform(apply_prob=augment_prob))
+    return PackedShardDataset(path, augment_prob=augment_prob)
+
+
+def start_step(args):
+    if args.start_step is not None:
+        return args.start_step
+    m = re.search(r"_(\d+)\.\w+$", os.path.basename(args.resume or ""))
+    return int(m.group(1)) if m else 0
+
+
+def setup_distributed(backend):
+    """Joins the process group described by the torchrun / --nproc environment; (rank, world, local world)."""
+    world = int(os.environ.get("WORLD_SIZE", 1))
+    if world == 1:
+        return 0, 1, 1
+    dist.init_process_group(backend)
+    return dist.get_rank(), world, int(os.environ.get("LOCAL_WORLD_SIZE", world))
+
+
+def _mean_over_ranks(value, world):
+    value = value.detach().clone()
+    if world > 1:
+        dist.all_reduce(value)
+        value /= world
+    return value.item()
+
+
+def train(args):
+    """Runs the training loop in this process (one rank); returns step-time stats on rank 0."""
+    rank, world, local_world = setup_distributed(args.backend)
+    torch.set_num_threads(args.threads or max(1, (os.cpu_count() or 1) // local_world))
+    torch.manual_seed(args.seed)  # same initial weights on every rank (DDP also broadcasts rank 0's)
+    random.seed(args.seed + rank)
+    np.random.seed(args.seed + rank)
+
+    first = start_step(args)
+    config = dict(DEFAULT_CONFIGS[args.arch])
+    if args.resume:
+        config, state_dict = read_checkpoint(args.resume)
+    model = build_model(config)
+    if args.resume:
+        model.load_state_dict(state_dict)
+    model.train()
+    net = DistributedDataParallel(model) if world > 1 else model
+    optimizer = torch.optim.Adam(model.parameters(), lr=args.lr)
+
+    dataset = build_dataset(args.data, args.augment_prob)
+    loader = make_pk_loader(dataset, args.P, args.K, num_batches=max(args.steps - first, 0),
+                            seed=args.seed + first, num_workers=args.workers, persistent_workers=False,
+                            rank=rank, world_size=world)
+
+    writer = csv_file = profiler = None
+    train_val = val = None
+    if rank == 0:
+        os.makedirs(args.out_dir, exist_ok=True)
+        train_val = FolderGroupedBatchDataset(args.train_val) if args.train_val else None
+        val = FolderGroupedBatchDataset(args.val) if args.val else None
+        csv_path = args.csv or os.path.join(args.out_dir, f"{CSV_PREFIX[config['arch']]}_{first}.csv")
+        csv_file = open(csv_path, "w", newline="")
+        writer = csv.writer(csv_file)
+        writer.writerow(CSV_COLUMNS + ([f"t_{s}_ms" for s in LOG_STAGES] if args.instrument else []))
+        profiler = instrument.ProfilerWindow.from_env(out_dir=os.path.join(args.out_dir, "profiler"))
+        print(f"🚀 {config['arch']}: {world} rank(s) × {torch.get_num_threads()} threads, "
+              f"P={args.P}×{world} K={args.K}, gather={args.gather}, steps {first} → {args.steps}")
+    if args.instrument:
+        instrument.enable()
+
+    step_times = []
+    images_seen = 0
+    last = time.perf_counter()
+    for step, (images, labels) in enumerate(instrument.timed_iter(loader, "data"), start=first):
+        if profiler:
+            profiler.step()
+        with instrument.stage("forward"):
+            embeddings = net(images)
+        if args.gather and world > 1:
+            with instrument.stage("gather"):
+                embeddings, labels = gather_embeddings(embeddings, labels)
+        loss = combined_triplet_loss(embeddings, labels, margin=args.margin, alpha=args.alpha)
+
+        with instrument.stage("backward"):
+            optimizer.zero_grad()
+            # every rank holds the same global loss; × world so DDP's gradient mean is its gradient
+            (loss * world if args.gather else loss).backward()
+        with instrument.stage("optimizer"):
+            optimizer.step()
+        now = time.perf_counter()
+        step_times.append(now - last)
+        images_seen += len(images)
+        instrument.record("step", now - last)
+
+        if (step + 1) % args.log_every == 0:
+            loss_value = _mean_over_ranks(loss, world)
+            if rank == 0:
+                print(f"[Step {step + 1}] Loss: {loss_value:.4f}")
+                train_intra, train_inter = validate_similarity(model, train_val, "cpu") if train_val else ("", "")
+                val_intra, val_inter = validate_similarity(model, val, "cpu") if val else ("", "")
+                row = [step + 1, loss_value, train_intra, train_inter, val_intra, val_inter]
+                if args.instrument:
+                    means = instrument.interval_means()
+                    row += [means.get(f"t_{s}_ms", "") for s in LOG_STAGES]
+                writer.writerow(row)
+                csv_file.flush()
+        if rank == 0 and (step + 1) % args.save_every == 0:
+            path = os.path.join(args.out_dir, f"{CHECKPOINT_PREFIX[config['arch']]}_{step + 1}.pth")
+            torch.save(model.state_dict(), path)
+        last = time.perf_counter()
+
+    stats = None
+    if rank == 0:
+        if profiler:
+            profiler.stop()
+        csv_file.close()
+        times = np.array(step_times[STATS_WARMUP:] or step_times or [float("nan")])
+        batch = images_seen / max(len(step_times), 1) * world  # global images per step
+        stats = {"world_size": world, "threads": torch.get_num_threads(), "P": args.P, "K": args.K,
+                 "gather": args.gather, "steps": len(step_times), "step_s_median": float(np.median(times)),
+                 "step_s_mean": float(times.mean()), "images_per_step": batch,
+                 "images_per_s": batch / float(np.median(times))}
+        print(f"✅ {stats['steps']} steps, median {stats['step_s_median'] * 1e3:.1f} ms/step, "
+              f"{stats['images_per_s']:.1f} images/s")
+        if args.instrument:
+            instrument.print_summary()
+        if args.stats_out:
+            with open(args.stats_out, "w", encoding="utf-8") as f:
+                json.dump(stats, f, indent=2)
+    if world > 1:
+        dist.destroy_process_group()
+    return stats
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _spawned(local_rank, args, nproc, port):
+    os.environ.update(RANK=str(local_rank), LOCAL_RANK=str(local_rank), WORLD_SIZE=str(nproc),
+                      LOCAL_WORLD_SIZE=str(nproc), MASTER_ADDR="127.0.0.1", MASTER_PORT=str(port))
+    train(args)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.nproc > 1 and "WORLD_SIZE" not in os.environ:
+        torch.multiprocessing.spawn(_spawned, args=(args, args.nproc, _free_port()), nprocs=args.nproc)
+    else:
+        train(args)
+
+
+if __name__ == "__main__":
+    main()
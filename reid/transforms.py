@@ -0,0 +1,210 @@
+import random
+
+import numpy as np
+import torch
+from PIL import Image, ImageDraw
+import torchvision.transforms as transforms
+
+
+INPUT_SIZE = (256, 128)  # (H, W) fed to the re-id models
+NORM_MEAN = [0.5] * 3
+NORM_STD = [0.5] * 3
+
+
+class ResizePad:
+    """
+    Letterbox resize: keeps the aspect ratio and pads the rest with `fill`.
+    """
+    def __init__(self,size=(256,128),fill=0):
+        self.target_h, self.target_w = size
+        self.fill = fill
+    def __repr__(self):
+        return f"{type(self).__name__}(size={(self.target_h, self.target_w)}, fill={self.fill})"
+    def __call__(self,img):
+        orig_w, orig_h = img.size
+        scale = min(self.target_w/orig_w, self.target_h/orig_h)
+        new_w, new_h = int(orig_w * scale),int(orig_h*scale)
+
+        img = img.resize((new_w,new_h), Image.BILINEAR)
+
+        new_img = Image.new("RGB",(self.target_w,self.target_h),(self.fill,)*3)
+        paste_x = (self.target_w-new_w)//2
+        paste_y = (self.target_h-new_h)//2
+        new_img.paste(img,(paste_x,paste_y))
+
+        return new_img
+
+
+class BatchResizePad:
+    """
+    Batched ResizePad + ToTensor + Normalize for inference.
+
+    Every crop is letterboxed (same scale, size and offsets as ResizePad) with
+    cv2 straight into a preallocated uint8 (B, H, W, 3) staging buffer, then
+    the whole batch is converted and transposed to (B, 3, H, W) by one copy
+    into a preallocated float buffer and normalized in place there. cv2 uses INTER_AREA
+    to shrink and INTER_LINEAR to enlarge, which is what PIL's (antialiased)
+    BILINEAR amounts to; the result matches default_transform to about one grey
+    level.
+
+    The returned tensor is a view of the internal buffer and is overwritten by
+    the next call (pass clone() / copy it if it must outlive the call).
+
+    Args:
+        size (tuple): (H, W) output size.
+        fill (int): Padding grey level (0 like ResizePad).
+        max_batch (int): Initial buffer capacity; grows on demand.
+    """
+    def __init__(self, size=INPUT_SIZE, fill=0, max_batch=64):
+        self.size = size
+        self.fill = fill
+        self._allocate(max_batch)
+
+    def _allocate(self, n):
+        h, w = self.size
+        self._staging = np.empty((n, h, w, 3), dtype=np.uint8)
+        self._out = torch.empty((n, 3, h, w), dtype=torch.float32)
+
+    def _letterbox(self, crop, slot, bgr):
+        import cv2
+
+        th, tw = self.size
+        oh, ow = crop.shape[:2]
+        scale = min(tw / ow, th / oh)
+        nw, nh = max(int(ow * scale), 1), max(int(oh * scale), 1)
+        x0, y0 = (tw - nw) // 2, (th - nh) // 2
+        slot[:y0] = self.fill
+        slot[y0 + nh:] = self.fill
+        slot[y0:y0 + nh, :x0] = self.fill
+        slot[y0:y0 + nh, x0 + nw:] = self.fill
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        if bgr:
+            crop = crop[..., ::-1]
+        slot[y0:y0 + nh, x0:x0 + nw] = cv2.resize(np.ascontiguousarray(crop), (nw, nh),
+                                                  interpolation=interpolation)
+
+    def __call__(self, crops, bgr=False):
+        """
+        Args:
+            crops (list[np.ndarray]): (h, w, 3) uint8 crops of any size (PIL images are converted).
+            bgr (bool): Crops are BGR (OpenCV frames) instead of RGB.
+
+        Returns:
+            torch.Tensor: (B, 3, H, W) float32, normalized like default_transform.
+        """
+        n = len(crops)
+        if n > len(self._staging):
+            self._allocate(max(n, 2 * len(self._staging)))
+        for crop, slot in zip(crops, self._staging):
+            self._letterbox(np.asarray(crop), slot, bgr)
+        out = self._out[:n]
+        out.copy_(torch.from_numpy(self._staging[:n]).permute(0, 3, 1, 2))
+        # ToTensor + Normalize(NORM_MEAN, NORM_STD) as one scale and shift
+        return out.mul_(1.0 / (255.0 * NORM_STD[0])).sub_(NORM_MEAN[0] / NORM_STD[0])
+
+    def from_boxes(self, frame, boxes, bgr=True):
+        """
+        Crops xyxy boxes out of one frame (clipped to the frame, no copies) and
+        preprocesses them like __call__. Frames from cv2 are BGR by default.
+        """
+        h, w = frame.shape[:2]
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        x1 = np.clip(np.floor(boxes[:, 0]), 0, w - 1).astype(int)
+        y1 = np.clip(np.floor(boxes[:, 1]), 0, h - 1).astype(int)
+        x2 = np.maximum(np.clip(np.ceil(boxes[:, 2]), 0, w).astype(int), x1 + 1)
+        y2 = np.maximum(np.clip(np.ceil(boxes[:, 3]), 0, h).astype(int), y1 + 1)
+        return self([frame[a:c, b:d] for b, a, d, c in zip(x1, y1, x2, y2)], bgr=bgr)
+
+
+def default_transform(size=INPUT_SIZE):
+    """ResizePad → ToTensor → Normalize, the transform used for validation and inference."""
+    return transforms.Compose([
+        ResizePad(size),
+        transforms.ToTensor(),
+        transforms.Normalize(NORM_MEAN, NORM_STD)
+    ])
+
+
+class RandomObstacleOrCrop:
+    """
+    With probability apply_prob, blacks out a random rectangle ("obstacle") or
+    the bottom half of the PIL image. A class rather than closures so the
+    transform pickles into spawned DataLoader workers / training processes.
+    """
+    def __init__(self, apply_prob=0.3):
+        self.apply_prob = apply_prob
+
+    def __repr__(self):
+        return f"{type(self).__name__}(apply_prob={self.apply_prob})"
+
+    def __call__(self, img):
+        if random.random() > self.apply_prob:
+            return img  # No augmentation
+
+        mode = random.choice(["obstacle", "bottom_crop"])
+
+        if mode == "obstacle":
+            return self.add_obstacle(img)
+        elif mode == "bottom_crop":
+            return self.remove_bottom_half(img)
+        return img
+
+    @staticmethod
+    def add_obstacle(img):
+        draw = ImageDraw.Draw(img)
+        w, h = img.size
+        x1 = random.randint(0, w // 2)
+        y1 = random.randint(0, h // 2)
+        x2 = x1 + random.randint(w // 8, w // 4)
+        y2 = y1 + random.randint(h // 8, h // 4)
+        draw.rectangle([x1, y1, x2, y2], fill=(0, 0, 0))
+        return img
+
+    @staticmethod
+    def remove_bottom_half(img):
+        draw = ImageDraw.Draw(img)
+        w, h = img.size
+        draw.rectangle([0, h//2, w, h], fill=(0, 0, 0))
+        return img
+
+
+def get_custom_transform(apply_prob=0.3):
+    return transforms.Compose([
+        RandomObstacleOrCrop(apply_prob),
+        transforms.Resize((256, 128)),
+        transforms.ToTensor(),
+        transforms.Normalize([0.5]*3, [0.5]*3)
+    ])
+
+
+def occlude_batch_(batch, apply_prob=0.3, rng=random):
+    """
+    In-place version of get_custom_transform's obstacle / bottom-crop
+    augmentation for a uint8 batch of shape (B, H, W, 3) that is already
+    letterboxed to the model input size.
+
+    Each image is left untouched with probability 1 - apply_prob, otherwise
+    either a random black rectangle is drawn or the bottom half is blacked out.
+    """
+    _, h, w, _ = batch.shape
+    for img in batch:
+        if rng.random() > apply_prob:
+            continue
+        if rng.choice(["obstacle", "bottom_crop"]) == "obstacle":
+            x1 = rng.randint(0, w // 2)
+            y1 = rng.randint(0, h // 2)
+            x2 = x1 + rng.randint(w // 8, w // 4)
+            y2 = y1 + rng.randint(h // 8, h // 4)
+            img[y1:y2 + 1, x1:x2 + 1] = 0  # PIL rectangles include the end point
+        else:
+            img[h // 2:] = 0
+    return batch
+
+
+def uint8_to_tensor(batch):
+    """
+    (B, H, W, 3) uint8 array → normalized (B, 3, H, W) float tensor.
+    Same result as ToTensor() followed by Normalize([0.5]*3, [0.5]*3).
+    """
+    x = torch.from_numpy(batch).permute(0, 3, 1, 2).float()
+    return x.div_(127.5).sub_(1.0)
@@ -0,0 +1,135 @@
+import random
+
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+from . import instrument
+
+
+class ValidationSubset:
+    """
+    A fixed, seeded sample of a FolderGroupedBatchDataset, decoded and
+    transformed once and kept as a single tensor.
+
+    P pids contribute K images each (the anchors). Like the notebook loop, each
+    anchor pid also gets its own block of inter_K negatives, each an image of a
+    random other pid (other anchor pids included). `block` holds the anchor pid
+    index of every row, so similarity_stats scores anchors only against their
+    own block. Unlike the loop, pids with fewer than 2 images are never drawn
+    as anchors, so the subset always has P anchor pids when the data allows.
+
+    Args:
+        dataset: Object with `pids`, `pid_to_paths` and `transform`
+                 (FolderGroupedBatchDataset).
+        P (int): Number of anchor pids.
+        K (int): Images per anchor pid.
+        inter_K (int): Negative images per anchor pid.
+        seed (int): Seed for the selection; the same seed gives the same subset.
+    """
+    def __init__(self, dataset, P=5, K=5, inter_K=16, seed=0):
+        rng = random.Random(seed)
+        eligible = sorted(pid for pid in dataset.pids if len(dataset.pid_to_paths[pid]) >= 2)
+        anchor_pids = rng.sample(eligible, min(P, len(eligible)))
+
+        all_pids = sorted(dataset.pids)
+        pid_label = {pid: i for i, pid in enumerate(all_pids)}
+        paths, labels, blocks, is_anchor = [], [], [], []
+        for block, pid in enumerate(anchor_pids):
+            pid_paths = sorted(dataset.pid_to_paths[pid])
+            for p in rng.sample(pid_paths, min(K, len(pid_paths))):
+                paths.append(p)
+                labels.append(pid_label[pid])
+                blocks.append(block)
+                is_anchor.append(True)
+            others = [x for x in all_pids if x != pid]
+            for _ in range(inter_K if others else 0):
+                other = rng.choice(others)
+                paths.append(rng.choice(sorted(dataset.pid_to_paths[other])))
+                labels.append(pid_label[other])
+                blocks.append(block)
+                is_anchor.append(False)
+
+        self.paths = paths
+        self.labels = torch.tensor(labels, dtype=torch.long)
+        self.block = torch.tensor(blocks, dtype=torch.long)
+        self.is_anchor = torch.tensor(is_anchor, dtype=torch.bool)
+        if paths:
+            self.images = torch.stack([dataset.transform(Image.open(p).convert("RGB")) for p in paths])
+        else:
+            self.images = torch.empty(0)
+
+    def __len__(self):
+        return len(self.paths)
+
+
+@torch.no_grad()
+def embed_tensor(model, images, device, batch_size=256):
+    """Runs the model over a preprocessed (N, 3, H, W) tensor in large batches."""
+    outs = []
+    for i in range(0, len(images), batch_size):
+        outs.append(model(images[i:i + batch_size].to(device, non_blocking=True)))
+    return F.normalize(torch.cat(outs), dim=1)
+
+
+@torch.no_grad()
+def similarity_stats(embs, labels, is_anchor=None, block=None):
+    """
+    Mean intra-pid and inter-pid cosine similarity from one similarity matrix.
+
+    Intra: every unordered pair of different anchor images with the same pid.
+    Inter: with `block` (ValidationSubset), every (anchor, negative of its own
+           block) pair, as in the notebook loop; without it every (anchor,
+           image of another pid) pair.
+    """
+    labels = labels.to(embs.device)
+    sim = embs @ embs.T
+    same = labels.unsqueeze(0) == labels.unsqueeze(1)
+    if is_anchor is None:
+        is_anchor = torch.ones(len(labels), dtype=torch.bool)
+    is_anchor = is_anchor.to(embs.device)
+
+    intra_mask = same.triu(diagonal=1) & is_anchor.unsqueeze(1) & is_anchor.unsqueeze(0)
+    inter_mask = ~same & is_anchor.unsqueeze(1)
+    if block is not None:
+        block = block.to(embs.device)
+        inter_mask &= ~is_anchor.unsqueeze(0) & (block.unsqueeze(0) == block.unsqueeze(1))
+
+    intra = sim[intra_mask].mean() if intra_mask.any() else sim.new_zeros(())
+    inter = sim[inter_mask].mean() if inter_mask.any() else sim.new_zeros(())
+    stats = torch.stack([intra, inter]).tolist()  # single device sync
+    return stats[0], stats[1]
+
+
+def get_validation_subset(dataset, P=5, K=5, inter_K=16, seed=0):
+    """Returns the cached ValidationSubset for these settings, building it on first use."""
+    cache = dataset.__dict__.setdefault("_validation_subsets", {})
+    key = (P, K, inter_K, seed)
+    if key not in cache:
+        cache[key] = ValidationSubset(dataset, P=P, K=K, inter_K=inter_K, seed=seed)
+    return cache[key]
+
+
+# Validation
+@instrument.timed("validate")
+@torch.no_grad()
+def validate_similarity(model, dataset, device, P=5, K=5, inter_K=16, seed=0, batch_size=256):
+    """
+    Average intra / inter cosine similarity on a fixed validation subset.
+
+    The subset is selected with `seed` and preprocessed on the first call, then
+    reused, so periodic validation during training only costs the forward pass
+    and one similarity matrix.
+
+    Returns:
+        (avg_intra, avg_inter)
+    """
+    subset = get_validation_subset(dataset, P=P, K=K, inter_K=inter_K, seed=seed)
+    if len(subset) == 0:
+        return 0.0, 0.0
+
+    was_training = model.training
+    model.eval()
+    embs = embed_tensor(model, subset.images, device, batch_size=batch_size)
+    model.train(was_training)
+    return similarity_stats(embs, subset.labels, subset.is_anchor, subset.block)
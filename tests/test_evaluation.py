@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+import torch
+
+from reid.evaluation import compute_similarity_gaps, evaluate, evaluate_rank1
+
+
+def _brute_force(qf, q_ids, gf, g_ids, q_cams, g_cams, same_set, ranks):
+    """Full-matrix, one query at a time reference for evaluate()."""
+    qf = qf / np.linalg.norm(qf, axis=1, keepdims=True)
+    gf = gf / np.linalg.norm(gf, axis=1, keepdims=True)
+    sim = qf.astype(np.float64) @ gf.astype(np.float64).T
+    cmc = np.zeros(max(ranks))
+    aps, gaps = [], []
+    for i in range(len(qf)):
+        keep = np.ones(len(gf), dtype=bool)
+        if same_set:
+            keep[i] = False
+        if q_cams is not None:
+            for j in range(len(gf)):
+                if (g_ids[j] == q_ids[i] and q_cams[i] is not None and g_cams[j] is not None
+                        and g_cams[j] == q_cams[i]):
+                    keep[j] = False
+        cand = np.flatnonzero(keep)
+        match = np.array([g_ids[j] == q_ids[i] for j in cand], dtype=bool)
+        s = sim[i, cand]
+        if match.any() and (~match).any():
+            gaps.append(s[match].max() - s[~match].max())
+        if not match.any():
+            continue
+        hits = match[np.argsort(-s, kind="stable")]
+        first = np.argmax(hits)
+        cmc[first:] += 1
+        positions = np.flatnonzero(hits) + 1
+        aps.append(np.mean(np.arange(1, len(positions) + 1) / positions))
+    n_valid = len(aps)
+    out = {f"rank{k}": cmc[k - 1] / n_valid for k in ranks}
+    out.update(mAP=float(np.mean(aps)), gaps=np.array(gaps), num_valid_queries=n_valid)
+    return out
+
+
+def _data(n, n_pids, n_cams, seed):
+    rng = np.random.default_rng(seed)
+    ids = [f"p{i}" for i in rng.integers(0, n_pids, n)]
+    centers = {pid: rng.normal(size=16) for pid in set(ids)}
+    feats = np.stack([centers[pid] + rng.normal(scale=1.5, size=16) for pid in ids]).astype(np.float32)
+    cams = [f"C{c}" for c in rng.integers(0, n_cams, n)]
+    cams[0] = None  # unknown camera: no exclusion for this image
+    return feats, ids, cams
+
+
+def _assert_matches(results, ref, ranks):
+    for k in ranks:
+        assert results[f"rank{k}"] == pytest.approx(ref[f"rank{k}"])
+    assert results["mAP"] == pytest.approx(ref["mAP"], abs=1e-6)
+    assert results["num_valid_queries"] == ref["num_valid_queries"]
+    np.testing.assert_allclose(results["gaps"], ref["gaps"], atol=1e-5)
+
+
+@pytest.mark.parametrize("use_cams", [False, True])
+def test_same_set_matches_brute_force(use_cams):
+    ranks = (1, 3, 5)
+    feats, ids, cams = _data(53, 9, 3, seed=0)
+    cams = cams if use_cams else None
+    results = evaluate(torch.from_numpy(feats), ids, query_cams=cams, gallery_cams=cams,
+                       ranks=ranks, block_size=8)
+    ref = _brute_force(feats, ids, feats, ids, cams, cams, same_set=True, ranks=ranks)
+    _assert_matches(results, ref, ranks)
+    assert 0 < results["num_valid_queries"] <= 53
+
+
+def test_query_gallery_with_camera_exclusion_matches_brute_force():
+    ranks = (1, 5, 10)
+    qf, q_ids, q_cams = _data(21, 6, 2, seed=1)
+    gf, g_ids, g_cams = _data(40, 6, 2, seed=2)
+    results = evaluate(qf, q_ids, gf, g_ids, query_cams=q_cams, gallery_cams=g_cams, ranks=ranks, block_size=5)
+    ref = _brute_force(qf, q_ids, gf, g_ids, q_cams, g_cams, same_set=False, ranks=ranks)
+    _assert_matches(results, ref, ranks)
+
+
+def test_notebook_wrappers_match_brute_force():
+    feats, ids, _ = _data(30, 12, 1, seed=3)
+    ref = _brute_force(feats, ids, feats, ids, None, None, same_set=True, ranks=(1,))
+    # evaluate_rank1 divides by all queries, like the notebook
+    assert evaluate_rank1(feats, ids) == pytest.approx(ref["rank1"] * ref["num_valid_queries"] / 30)
+    np.testing.assert_allclose(compute_similarity_gaps(feats, ids), ref["gaps"], atol=1e-5)
@@ -0,0 +1,62 @@
+import json
+import os
+
+import numpy as np
+
+from reid.gallery import META_FILE, Gallery
+
+
+def _embeddings(n, dim=8, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def test_long_multibyte_pids_and_cameras_round_trip(tmp_path):
+    prefix = "보행자_" * 12  # 3-byte characters, well over the old 32-byte column
+    pids = [prefix + "가", prefix + "나"]
+    cameras = ["카메라_" * 10 + "1", "카메라_" * 10 + "2"]
+    gallery = Gallery(str(tmp_path / "g"), dim=8, index="flat")
+    rows = gallery.add(_embeddings(2), pids, cameras=cameras)
+    gallery.save()
+
+    reopened = Gallery(str(tmp_path / "g"))
+    assert reopened.pids(rows) == pids
+    assert [r["camera"] for r in reopened.records(rows)] == cameras
+    assert reopened.delete_pid(pids[0]) == 1
+    assert reopened.delete_pid("never stored") == 0
+    assert reopened.num_alive == 1
+
+
+def test_fixed_width_meta_is_migrated(tmp_path):
+    path = tmp_path / "old"
+    os.makedirs(path)
+    old_dtype = np.dtype([("pid", "S32"), ("camera", "S16"), ("timestamp", np.float64), ("alive", bool)])
+    meta = np.zeros(4, dtype=old_dtype)
+    meta[:2] = [(b"p1", b"cam0", 1.0, True), (b"p2", b"cam1", 2.0, True)]
+    np.save(path / META_FILE, meta)
+    np.save(path / "vectors.npy", np.zeros((4, 8), dtype=np.float32))
+    with open(path / "gallery.json", "w", encoding="utf-8") as f:
+        json.dump({"dim": 8, "count": 2, "index": "flat"}, f)
+
+    gallery = Gallery(str(path))
+    assert gallery.pids([0, 1, -1]) == ["p1", "p2", None]
+    assert Gallery(str(path)).records([1])[0]["camera"] == "cam1"
+
+
+def test_long_multibyte_attributes_stay_distinct(tmp_path):
+    shared = "반팔티셔츠" * 3  # 45 bytes in UTF-8: equal in the first 32 bytes
+    red = {"upperclothes": shared + "빨강", "lowerclothes": "청바지"}
+    blue = {"upperclothes": shared + "파랑", "lowerclothes": "청바지"}
+    x = _embeddings(2)
+    gallery = Gallery(str(tmp_path / "g"), dim=8, index="flat")
+    rows = gallery.add(x, ["a", "b"], attributes=[red, blue])
+    gallery.save()
+
+    reopened = Gallery(str(tmp_path / "g"))
+    records = reopened.records(rows)
+    assert [r["upperclothes"] for r in records] == [red["upperclothes"], blue["upperclothes"]]
+    assert records[0]["lowerclothes"] == "청바지"
+    reopened.attributes.build()
+    assert list(reopened.attributes.distances(red)) == [0, 1]
+    # the query only matches its own partition; a weak score never widens past max_distance=0
+    _, found = reopened.search_attributes(x[1], blue, k=2, min_score=0.0, max_distance=0)
+    assert list(found[0]) == [rows[1], -1]
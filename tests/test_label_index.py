@@ -0,0 +1,66 @@
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from label_index import LABEL_FIELDS, build_index, find_label_files, parse_label, row_fields
+
+DOCS = {
+    "full": "<ANN><CAMERA><mode>1000</mode></CAMERA><FILE><name>a.png</name></FILE>"
+            "<OBJECT ID='7'><upperclothes>코트</upperclothes><upperclothes_color>black</upperclothes_color>"
+            "<lowerclothes>jeans</lowerclothes><lowerclothes_color>blue</lowerclothes_color></OBJECT>"
+            "<OBJECT ID='8'><upperclothes>other</upperclothes></OBJECT></ANN>",
+    "empty_and_missing": "<ANN><CAMERA><mode/></CAMERA><FILE><name></name></FILE>"
+                         "<OBJECT><upperclothes/><lowerclothes>skirt</lowerclothes></OBJECT></ANN>",
+    "no_camera": "<ANN><OBJECT ID=''><upperclothes>t</upperclothes></OBJECT></ANN>",
+    "nested": "<ANN><META><FILE><name>b.png</name></FILE></META>"
+              "<FRAME><OBJECT ID='3'><upperclothes>shirt</upperclothes>"
+              "<PART><upperclothes>inner</upperclothes></PART></OBJECT></FRAME></ANN>",
+}
+
+
+def _find_text(elem, path):
+    found = elem.find(path) if elem is not None else None
+    return None if found is None else (found.text or "")
+
+
+def _element_tree(path, nested):
+    """The scripts' original ElementTree lookups (text "" when empty, None when missing)."""
+    root = ET.parse(path).getroot()
+    obj = root.find(".//OBJECT" if nested else "OBJECT")
+    fields = {"mode": _find_text(root, "CAMERA/mode"),
+              "object_id": obj.get("ID") if obj is not None else None,
+              "file_name": _find_text(root, ".//FILE/name" if nested else "FILE/name")}
+    for tag in ("upperclothes", "upperclothes_color", "lowerclothes", "lowerclothes_color"):
+        fields[tag] = _find_text(obj, tag)
+    return tuple(fields[f] for f in LABEL_FIELDS), obj is not None
+
+
+@pytest.mark.parametrize("nested", [False, True])
+@pytest.mark.parametrize("name", sorted(DOCS))
+def test_parse_label_matches_element_tree(tmp_path, name, nested):
+    path = tmp_path / f"{name}.xml"
+    path.write_text(DOCS[name], encoding="utf-8")
+    assert parse_label(str(path), nested=nested) == _element_tree(path, nested)
+
+
+def test_index_keeps_missing_apart_from_empty(tmp_path):
+    (tmp_path / "sub").mkdir()
+    for name, doc in DOCS.items():
+        (tmp_path / f"{name}.xml").write_text(doc, encoding="utf-8")
+    (tmp_path / "sub" / "deep.xml").write_text(DOCS["full"], encoding="utf-8")
+    assert len(find_label_files(tmp_path)) == len(DOCS) + 1
+    assert len(find_label_files(tmp_path, recursive=False)) == len(DOCS)
+
+    index = build_index(tmp_path, workers=1, recursive=False)
+    rows = {r["xml_path"].rsplit("/", 1)[-1]: r for r in map(row_fields, index)}
+    empty = rows["empty_and_missing.xml"]
+    assert (empty["mode"], empty["file_name"], empty["upperclothes"]) == ("", "", "")
+    assert (empty["object_id"], empty["upperclothes_color"]) == (None, None)
+    assert rows["no_camera.xml"]["mode"] is None
+    assert rows["no_camera.xml"]["object_id"] == ""
+    assert not rows["nested.xml"]["has_object"]
+
+    # rows parsed without nested=True are not reused for a nested index
+    nested = build_index(tmp_path, workers=1, previous=index, recursive=False, nested=True)
+    rows = {r["xml_path"].rsplit("/", 1)[-1]: r for r in map(row_fields, nested)}
+    assert rows["nested.xml"]["has_object"] and rows["nested.xml"]["upperclothes"] == "shirt"
@@ -0,0 +1,42 @@
+import pytest
+import torch
+
+from reid.losses import combined_triplet_loss, combined_triplet_loss_loop
+
+
+def _loss_and_grad(loss_fn, embeddings, labels, **kwargs):
+    emb = embeddings.clone().requires_grad_(True)
+    loss = loss_fn(emb, labels, **kwargs)
+    loss.backward()
+    return loss.detach(), emb.grad
+
+
+def _assert_equivalent(embeddings, labels, **kwargs):
+    loss, grad = _loss_and_grad(combined_triplet_loss, embeddings, labels, **kwargs)
+    ref_loss, ref_grad = _loss_and_grad(combined_triplet_loss_loop, embeddings, labels, **kwargs)
+    torch.testing.assert_close(loss, ref_loss)
+    torch.testing.assert_close(grad, ref_grad)
+
+
+@pytest.mark.parametrize("P,K", [(2, 2), (4, 4), (8, 3)])
+@pytest.mark.parametrize("alpha", [0.0, 0.5, 1.0])
+def test_matches_loop_on_pk_batches(P, K, alpha):
+    torch.manual_seed(P * 10 + K)
+    labels = torch.arange(P).repeat_interleave(K)
+    embeddings = torch.randn(P * K, 16, dtype=torch.float64)
+    _assert_equivalent(embeddings, labels, alpha=alpha, margin=0.3)
+
+
+def test_matches_loop_with_single_image_pid():
+    torch.manual_seed(1)
+    labels = ["b", "b", "b", "a", "c", "c", "c", "c"]  # "a" has no positive: skipped as anchor, still a negative
+    embeddings = torch.randn(len(labels), 16, dtype=torch.float64)
+    _assert_equivalent(embeddings, labels)
+
+
+def test_no_valid_anchor_gives_zero():
+    embeddings = torch.randn(4, 8)
+    for labels in ([0, 1, 2, 3], [5, 5, 5, 5]):
+        loss, grad = _loss_and_grad(combined_triplet_loss, embeddings, torch.tensor(labels))
+        assert loss.item() == 0.0
+        assert grad is None or not grad.any()
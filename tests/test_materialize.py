@@ -0,0 +1,73 @@
+import errno
+import os
+
+import pytest
+
+import materialize
+from materialize import Materializer
+
+
+@pytest.fixture
+def pairs(tmp_path):
+    out = []
+    for i in range(3):
+        src = tmp_path / "raw" / f"img{i}.png"
+        src.parent.mkdir(exist_ok=True)
+        src.write_bytes(b"png%d" % i)
+        out.append((src, tmp_path / "set1" / "pid" / src.name))
+    return out
+
+
+def _failing(err, calls, only=None):
+    real = materialize._hardlink
+
+    def link(src, dst):
+        calls.append(src)
+        if only is None or src.endswith(only):
+            raise OSError(err, os.strerror(err))
+        real(src, dst)
+    return link
+
+
+def _unsupported(src, dst):
+    raise OSError(errno.EOPNOTSUPP, "no reflink")
+
+
+def test_auto_caches_device_level_failures_and_copies(pairs, monkeypatch):
+    calls = []
+    monkeypatch.setitem(materialize._LINKERS, "hardlink", _failing(errno.EXDEV, calls))
+    monkeypatch.setitem(materialize._LINKERS, "reflink", _unsupported)
+    m = Materializer("auto")
+    done, failed, methods = m.run(pairs)
+    assert failed == [] and len(done) == 3
+    assert methods == {"copy": 3}
+    assert len(calls) == 1  # the EXDEV is remembered for the device pair
+    assert {key[0] for key in m._failed} == {"hardlink", "reflink"}
+    assert all(not os.path.islink(dst) and dst.read_bytes() == src.read_bytes() for src, dst in pairs)
+
+
+def test_auto_per_file_errors_only_affect_that_file(pairs, monkeypatch):
+    calls = []
+    monkeypatch.setitem(materialize._LINKERS, "hardlink", _failing(errno.EMLINK, calls, only="img0.png"))
+    monkeypatch.setitem(materialize._LINKERS, "reflink", _unsupported)
+    m = Materializer("auto")
+    done, failed, methods = m.run(pairs)
+    assert methods == {"copy": 1, "hardlink": 2}
+    assert len(calls) == 3
+    assert not any(key[0] == "hardlink" for key in m._failed)
+    assert os.stat(pairs[1][0]).st_nlink == 2
+
+
+@pytest.mark.parametrize("err", [errno.EXDEV, errno.EPERM])
+def test_explicit_mode_reports_failures_instead_of_copying(pairs, monkeypatch, err):
+    monkeypatch.setitem(materialize._LINKERS, "hardlink", _failing(err, []))
+    done, failed, methods = Materializer("hardlink").run(pairs)
+    assert done == [] and not methods
+    assert [e.errno for _, _, e in failed] == [err] * 3
+    assert not any(os.path.exists(dst) for _, dst in pairs)
+
+
+def test_existing_links_are_kept(pairs):
+    m = Materializer("hardlink")
+    assert m.run(pairs)[2] == {"hardlink": 3}
+    assert m.run(pairs)[2] == {"existing": 3}
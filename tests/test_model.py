@@ -0,0 +1,41 @@
+import builtins
+
+import pytest
+import torch
+import torch.nn as nn
+
+from reid.model import _load_pickled_module, load_model, read_checkpoint
+
+
+class _Payload:
+    def __init__(self, marker):
+        self.marker = marker
+
+    def __reduce__(self):
+        return builtins.exec, (f"open({str(self.marker)!r}, 'w').write('pwned')",)
+
+
+@pytest.fixture
+def malicious_checkpoint(tmp_path):
+    marker = tmp_path / "pwned"
+    module = nn.Linear(2, 2)
+    module.payload = _Payload(marker)
+    path = tmp_path / "reid_model_full.pth"
+    torch.save(module, path, pickle_protocol=4)
+    return path, marker
+
+
+def test_pickled_module_is_refused_by_default(malicious_checkpoint):
+    path, marker = malicious_checkpoint
+    with pytest.raises(ValueError, match="pickled full model"):
+        load_model(path)
+    with pytest.raises(ValueError, match="pickled full model"):
+        read_checkpoint(path)
+    assert not marker.exists()
+
+
+def test_reduce_payload_is_not_executed(malicious_checkpoint):
+    path, marker = malicious_checkpoint
+    state_dict = _load_pickled_module(path)
+    assert not marker.exists()
+    assert set(state_dict) == {"weight", "bias"}
@@ -0,0 +1,31 @@
+from reid.samplers import DistributedPKBatchSampler, PKBatchSampler
+
+PID_TO_INDICES = {pid: list(range(pid * 10, pid * 10 + 10)) for pid in range(20)}
+
+
+def _epoch(sampler, epoch):
+    sampler.set_epoch(epoch)
+    return list(sampler)
+
+
+def test_same_seed_and_epoch_is_reproducible():
+    a = PKBatchSampler(PID_TO_INDICES, P=4, K=3, num_batches=5, seed=7)
+    b = PKBatchSampler(PID_TO_INDICES, P=4, K=3, num_batches=5, seed=7)
+    assert _epoch(a, 2) == _epoch(b, 2)
+
+
+def test_adjacent_seeds_do_not_share_shifted_epochs():
+    a = PKBatchSampler(PID_TO_INDICES, P=4, K=3, num_batches=5, seed=7)
+    b = PKBatchSampler(PID_TO_INDICES, P=4, K=3, num_batches=5, seed=8)
+    assert _epoch(a, 3) != _epoch(b, 2)
+    assert _epoch(a, 1) != _epoch(a, 2)
+
+
+def test_distributed_ranks_draw_disjoint_pids():
+    batches = [_epoch(DistributedPKBatchSampler(PID_TO_INDICES, P=4, K=3, num_batches=5,
+                                                rank=r, world_size=2, seed=7), 1)
+               for r in range(2)]
+    for step in zip(*batches):
+        pids = [{i // 10 for i in batch} for batch in step]
+        assert len(pids[0]) == len(pids[1]) == 4
+        assert not pids[0] & pids[1]
@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from reid.scheduler import LATENCY_WINDOW, LOAD_DECREASE, LOAD_INCREASE, FrameScheduler, MotionGate
+
+
+def _frame(camera, capture_time, image=None):
+    return SimpleNamespace(camera=camera, capture_time=capture_time, image=image)
+
+
+def test_frames_that_cannot_meet_the_slo_are_shed():
+    scheduler = FrameScheduler(slo_ms=250, motion_gate=False)
+    scheduler.record_detect(1, 0.1)  # 100 ms per frame
+    now = 10.0
+    old, fresh = _frame("old", now - 0.2), _frame("fresh", now)
+    assert scheduler.select([old, fresh], now=now) == [fresh]
+    assert scheduler.cameras["old"].shed_slo == 1
+    assert scheduler.cameras["fresh"].processed == 1
+    assert scheduler.in_flight == 1
+
+
+def test_credit_refills_at_the_camera_budget():
+    scheduler = FrameScheduler(slo_ms=1000, motion_gate=False, max_fps=10)
+    scheduler.record_detect(1, 0.001)  # capacity far above max_fps
+    processed = [bool(scheduler.select([_frame("cam", t)], now=t)) for t in (0.0, 0.05, 0.1, 0.15, 0.2)]
+    assert processed == [True, False, True, False, True]
+    cam = scheduler.cameras["cam"]
+    assert cam.budget_fps == 10
+    assert (cam.processed, cam.skipped_budget, cam.offered) == (3, 2, 5)
+
+
+def test_budget_is_split_by_camera_weight():
+    scheduler = FrameScheduler(slo_ms=1000, motion_gate=False, active_weight=3.0)
+    scheduler.record_detect(1, 0.01)
+    scheduler.select([_frame("busy", 0.0), _frame("idle", 0.0)], now=0.0)
+    scheduler.record_result("busy", 2, 0.01)
+    scheduler.select([], now=0.1)
+    busy, idle = scheduler.cameras["busy"], scheduler.cameras["idle"]
+    assert busy.budget_fps == pytest.approx(4 * idle.budget_fps)
+    assert busy.budget_fps + idle.budget_fps == pytest.approx(scheduler.load / 0.01)
+
+
+def test_static_scene_is_skipped_until_refresh():
+    pytest.importorskip("cv2")
+    scheduler = FrameScheduler(slo_ms=1000, motion_gate=MotionGate(threshold=3.0, refresh=2.0))
+    still = np.full((72, 128, 3), 100, dtype=np.uint8)
+    moved = still.copy()
+    moved[:, :64] = 200
+
+    def run(image, now):
+        return bool(scheduler.select([_frame("cam", now, image)], now=now))
+
+    assert run(still, 0.0)
+    assert not run(still, 0.5)
+    assert scheduler.cameras["cam"].static
+    assert run(moved, 1.0)          # the scene changed
+    assert not run(moved, 1.5)
+    assert run(moved, 3.0)          # refresh: 2 s since the last processed frame
+    assert scheduler.cameras["cam"].skipped_static == 2
+
+
+def test_load_decreases_when_p95_exceeds_slo_and_then_recovers():
+    scheduler = FrameScheduler(slo_ms=100, motion_gate=False)
+    scheduler.record_detect(1, 0.001)
+    start = scheduler.load
+    for _ in range(LATENCY_WINDOW // 5):
+        scheduler.record_result("cam", 0, 0.5)
+    scheduler.select([], now=0.0)
+    assert scheduler.load == pytest.approx(start * LOAD_DECREASE)
+    assert len(scheduler.latencies) == 0
+
+    for _ in range(LATENCY_WINDOW // 5):
+        scheduler.record_result("cam", 0, 0.01)
+    scheduler.select([], now=1.0)
+    assert scheduler.load == pytest.approx(start * LOAD_DECREASE + LOAD_INCREASE)
@@ -0,0 +1,62 @@
+import numpy as np
+
+from reid.tracker import Tracker
+
+FRAME = (480, 640, 3)
+
+
+def _box(x, y, w=40, h=100):
+    return [x, y, x + w, y + h]
+
+
+def test_tracks_follow_two_moving_boxes():
+    tracker = Tracker()
+    ids = None
+    for f in range(20):
+        right, left = _box(50 + 8 * f, 40), _box(500 - 8 * f, 300)
+        boxes = [right, left] if f % 2 else [left, right]  # detection order must not matter
+        tracks, _, _ = tracker.update(boxes, f, FRAME)
+        by_box = {tuple(b): t.track_id for b, t in zip(boxes, tracks)}
+        frame_ids = (by_box[tuple(right)], by_box[tuple(left)])
+        ids = ids or frame_ids
+        assert frame_ids == ids
+    assert len(tracker.tracks) == 2
+    assert len(tracker.active_tracks) == 2
+
+
+def test_track_survives_max_misses_then_expires():
+    tracker = Tracker(max_misses=3)
+    (first,), _, _ = tracker.update([_box(100, 100)], 0, FRAME)
+    for f in range(1, 4):
+        tracker.update([], f, FRAME)
+        assert tracker.tracks == [first]
+    (again,), _, _ = tracker.update([_box(100, 100)], 4, FRAME)  # still matched after 3 misses
+    assert again is first
+
+    for f in range(5, 9):
+        tracker.update([], f, FRAME)
+    assert tracker.tracks == []
+    (new,), _, _ = tracker.update([_box(100, 100)], 9, FRAME)
+    assert new.track_id != first.track_id
+
+
+def test_needs_embedding_only_every_embed_interval_frames():
+    tracker = Tracker(embed_interval=5)
+    embedded = []
+    for f in range(16):
+        (track,), (needs,), (quality,) = tracker.update([_box(200, 100)], f, FRAME)
+        if needs:
+            track.add_embedding(np.ones(8), quality, f)
+            embedded.append(f)
+    assert embedded == [0, 5, 10, 15]
+    assert track.num_embeddings == 4
+
+
+def test_much_better_crop_is_embedded_early():
+    tracker = Tracker(embed_interval=None, iou_threshold=0.1)
+    (track,), (needs,), (quality,) = tracker.update([_box(200, 100, 40, 100)], 0, FRAME)
+    track.add_embedding(np.ones(8), quality, 0)
+    _, (needs,), _ = tracker.update([_box(200, 100, 40, 100)], 1, FRAME)
+    assert not needs
+    _, (needs,), _ = tracker.update([_box(190, 80, 60, 150)], 2, FRAME)  # 2.25× the area
+    assert needs
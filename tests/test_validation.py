@@ -0,0 +1,76 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+
+from reid.validation import ValidationSubset, similarity_stats
+
+
+def _loop_stats(anchor_embs, negative_embs):
+    """The notebook validate_similarity loop on precomputed embeddings (one entry per anchor pid)."""
+    total_intra = total_inter = 0.0
+    count_intra = count_inter = 0
+    for embs, inter_embs in zip(anchor_embs, negative_embs):
+        for i in range(len(embs)):
+            for j in range(i + 1, len(embs)):
+                total_intra += F.cosine_similarity(embs[i:i + 1], embs[j:j + 1]).item()
+                count_intra += 1
+        for anchor in embs:
+            for inter in inter_embs:
+                total_inter += F.cosine_similarity(anchor[None], inter[None]).item()
+                count_inter += 1
+    return total_intra / count_intra, total_inter / count_inter
+
+
+def test_similarity_stats_matches_loop():
+    torch.manual_seed(0)
+    P, K, inter_K, dim = 3, 3, 4, 8
+    # negatives of block b are drawn from the other anchor pids and from pids 3..5
+    neg_labels = [[1, 3, 4, 2], [0, 2, 5, 3], [1, 0, 4, 4]]
+    embs, labels, block, is_anchor = [], [], [], []
+    anchors, negatives = [], []
+    for b in range(P):
+        a = F.normalize(torch.randn(K, dim), dim=1)
+        n = F.normalize(torch.randn(inter_K, dim), dim=1)
+        anchors.append(a)
+        negatives.append(n)
+        embs += [a, n]
+        labels += [b] * K + neg_labels[b]
+        block += [b] * (K + inter_K)
+        is_anchor += [True] * K + [False] * inter_K
+
+    intra, inter = similarity_stats(torch.cat(embs), torch.tensor(labels), torch.tensor(is_anchor),
+                                    torch.tensor(block))
+    ref_intra, ref_inter = _loop_stats(anchors, negatives)
+    assert abs(intra - ref_intra) < 1e-5
+    assert abs(inter - ref_inter) < 1e-5
+
+
+class _FolderDataset:
+    def __init__(self, root, n_pids=6, n_images=4):
+        self.pid_to_paths = {}
+        for p in range(n_pids):
+            paths = []
+            for i in range(n_images):
+                path = root / f"pid{p}_{i}.png"
+                Image.new("RGB", (2, 2), (p * 40, i * 60, 0)).save(path)
+                paths.append(str(path))
+            self.pid_to_paths[f"pid{p}"] = paths
+        self.pids = sorted(self.pid_to_paths)
+
+    @staticmethod
+    def transform(image):
+        return torch.from_numpy(np.asarray(image, dtype=np.float32)).view(-1)
+
+
+def test_validation_subset_gives_each_anchor_pid_its_own_negatives(tmp_path):
+    dataset = _FolderDataset(tmp_path)
+    subset = ValidationSubset(dataset, P=3, K=2, inter_K=5, seed=1)
+    assert len(subset) == 3 * (2 + 5)
+    for b in range(3):
+        rows = subset.block == b
+        anchor_labels = subset.labels[rows & subset.is_anchor]
+        negative_labels = subset.labels[rows & ~subset.is_anchor]
+        assert len(anchor_labels) == 2 and len(set(anchor_labels.tolist())) == 1
+        assert len(negative_labels) == 5
+        assert not (negative_labels == anchor_labels[0]).any()